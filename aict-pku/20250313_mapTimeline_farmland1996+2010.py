@@ -1,5 +1,16 @@
+import os
+import csv
+import json
+import argparse
+import numpy as np
 from pyecharts.charts import Map, Timeline
 from pyecharts import options as opts
+from pyecharts.commons.utils import JsCode
+
+try:  # 共享资源输出（--bundle）用 HongLouMeng-Python 中的 hlm_bundle，需在 PYTHONPATH 中
+    from hlm_bundle import ChartBundle
+except ImportError:
+    ChartBundle = None
 
 data_dict = {
     "全国": [0, 13003.93, -203.27, 12800.67],
@@ -36,50 +47,160 @@ data_dict = {
     "新疆维吾尔自治区": [65, 398.53, 55.87, 454.4]
 }
 
-# 创建 Timeline 对象
-tl = Timeline()
-
-# 1996年数据
-data_1996 = [(key, value[1]) for key, value in data_dict.items() if key != "全国"]
-map_1996 = (
-    Map()
-    .add(
-        "1996年实有耕地面积（单位：万公顷）",
-        data_pair=data_1996,
-        maptype="china",
-        is_map_symbol_show=False,  # 不描点
-        label_opts=opts.LabelOpts(is_show=False),  # 隐藏省份名称
-    )
-    .set_global_opts(
-        title_opts=opts.TitleOpts(
-            title="1996年全国实有耕地面积",
-            subtitle="数据来源：国办发〔1999〕34号"
-        ),
-        visualmap_opts=opts.VisualMapOpts(min_=20, max_=1500, is_piecewise=True),
-    )
-)
-tl.add(map_1996, "1996年")
-
-# 2010年数据
-data_2010 = [(key, value[3]) for key, value in data_dict.items() if key != "全国"]
-map_2010 = (
-    Map()
-    .add(
-        "2010年耕地保有量指标（单位：万公顷）",
-        data_pair=data_2010,
-        maptype="china",
-        is_map_symbol_show=False,  # 不描点
-        label_opts=opts.LabelOpts(is_show=False),  # 隐藏省份名称
-    )
-    .set_global_opts(
-        title_opts=opts.TitleOpts(
-            title="2010年全国耕地保有量指标",
-            subtitle="数据来源：国办发〔1999〕34号"
-        ),
-        visualmap_opts=opts.VisualMapOpts(min_=20, max_=1500, is_piecewise=True),
-    )
-)
-tl.add(map_2010, "2010年")
-
-# 渲染轮播地图
-tl.render('./output/全国耕地保有量1996+2010_mapTimeline.html')
+# 省级行政区划代码 -> 地图上的名称（0 为全国合计，不上图）
+CODE_NAMES = {value[0]: key for key, value in data_dict.items()}
+
+# 默认数据中各年份对应的指标
+DEFAULT_METRICS = {1996: "实有耕地面积", 2010: "耕地保有量指标"}
+
+
+def table_from_dict(data):
+    """把 data_dict（[代码, 1996, 增减, 2010]）转为 (代码数组, 年份列表, 数值矩阵[省份, 年份])"""
+    codes = np.array([value[0] for value in data.values()])
+    values = np.array([[value[1], value[3]] for value in data.values()], dtype=float)
+    return codes, [1996, 2010], values
+
+
+def _read_rows(path):
+    """读取 CSV 或 Parquet，返回 (表头, 行列表)"""
+    if path.endswith('.parquet'):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("读取 Parquet 需要安装 pyarrow")
+        table = pq.read_table(path)
+        columns = [str(name) for name in table.column_names]
+        return columns, list(zip(*(table.column(name).to_pylist() for name in table.column_names)))
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        reader = csv.reader(f)
+        columns = next(reader)
+        return columns, [row for row in reader if row]
+
+
+def load_table(path):
+    """读取按省级代码组织的表，返回 (代码数组, 年份列表, 数值矩阵[省份, 年份])
+
+    支持两种格式：
+      宽表  code[,name],1996,2010,...      每个年份一列
+      长表  code,year,value                 每行一个 (省份, 年份)
+    缺失值为 NaN。
+    """
+    columns, rows = _read_rows(path)
+    columns = [c.strip().lower() for c in columns]
+    data = np.array(rows, dtype=object)
+    codes_col = data[:, columns.index('code')].astype(float).astype(int)
+
+    if 'year' in columns:
+        years_col = data[:, columns.index('year')].astype(float).astype(int)
+        vals = np.array([np.nan if v in ('', None) else float(v)
+                         for v in data[:, columns.index('value')]])
+        codes, rows_idx = np.unique(codes_col, return_inverse=True)
+        years, cols_idx = np.unique(years_col, return_inverse=True)
+        values = np.full((len(codes), len(years)), np.nan)
+        values[rows_idx, cols_idx] = vals
+        return codes, years.tolist(), values
+
+    year_cols = [i for i, c in enumerate(columns) if c.isdigit()]
+    years = [int(columns[i]) for i in year_cols]
+    cells = data[:, year_cols]
+    missing = np.vectorize(lambda v: v is None or v == '', otypes=[bool])(cells)
+    cells[missing] = np.nan
+    return codes_col, years, cells.astype(float)
+
+
+def compute_frames(codes, values, n_bins=5):
+    """向量化计算各帧所需的数据
+
+    返回 dict：
+      mask    上图的省份（排除全国合计和未知代码）
+      totals  各年份全国合计（有 0 号行时取该行，否则按省份求和）
+      deltas  各省较上一年份的增减（第一帧为 NaN）
+      pieces  全部帧共用的分段（按分位数切分，保证各帧图例一致）
+    """
+    mask = np.isin(codes, [c for c in CODE_NAMES if c != 0])
+    provinces = values[mask]
+    national = codes == 0
+    totals = values[national][0] if national.any() else np.nansum(provinces, axis=0)
+    deltas = np.diff(values, axis=1, prepend=np.nan)
+
+    edges = np.unique(np.round(np.nanquantile(provinces, np.linspace(0, 1, n_bins + 1)), 2))
+    pieces = [{"min": float(lo), "max": float(hi)} for lo, hi in zip(edges[:-1], edges[1:])]
+    return {"mask": mask, "totals": totals, "deltas": deltas, "pieces": pieces}
+
+
+def build_timeline(codes, years, values, metrics=None, unit="万公顷",
+                   source="数据来源：国办发〔1999〕34号", n_bins=5):
+    """一次遍历年份构建 Timeline，每个年份一帧"""
+    metrics = metrics or {}
+    frames = compute_frames(codes, values, n_bins)
+    mask = frames["mask"]
+    names = [CODE_NAMES[c] for c in codes[mask].tolist()]
+    visualmap = opts.VisualMapOpts(is_piecewise=True, pieces=frames["pieces"])
+    label = opts.LabelOpts(is_show=False)  # 隐藏省份名称
+
+    tl = Timeline()
+    for j, year in enumerate(years):
+        metric = metrics.get(year, "耕地面积")
+        column = values[mask, j]
+        delta = frames["deltas"][mask, j]
+        # tooltip 中显示较上一帧的增减
+        delta_map = {name: round(d, 2) for name, d in zip(names, delta.tolist()) if d == d}
+        tooltip = JsCode(
+            "function(p){var d=%s[p.name];return p.name+'<br/>'+p.value+' %s'"
+            "+(d===undefined?'':'（较上期 '+(d>=0?'+':'')+d+'）');}"
+            % (json.dumps(delta_map, ensure_ascii=False), unit)
+        )
+        data_pair = [(name, v) for name, v in zip(names, column.tolist()) if v == v]
+        map_chart = (
+            Map()
+            .add(
+                f"{year}年{metric}（单位：{unit}）",
+                data_pair=data_pair,
+                maptype="china",
+                is_map_symbol_show=False,  # 不描点
+                label_opts=label,
+            )
+            .set_global_opts(
+                title_opts=opts.TitleOpts(
+                    title=f"{year}年全国{metric}",
+                    subtitle=f"全国合计 {frames['totals'][j]:.2f} {unit}　{source}"
+                ),
+                visualmap_opts=visualmap,
+                tooltip_opts=opts.TooltipOpts(formatter=tooltip),
+            )
+        )
+        tl.add(map_chart, f"{year}年")
+    return tl
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="省级数据多年份地图轮播")
+    parser.add_argument('--table', default=None,
+                        help="CSV/Parquet 数据表（按省级代码），不指定时使用内置的 1996/2010 耕地数据")
+    parser.add_argument('--metric', default=None, help="指标名称（默认按内置数据的年份区分）")
+    parser.add_argument('--unit', default="万公顷", help="数值单位")
+    parser.add_argument('--source', default="数据来源：国办发〔1999〕34号", help="副标题中的数据来源")
+    parser.add_argument('--bins', type=int, default=5, help="视觉映射分段数")
+    parser.add_argument('--output', default='./output/全国耕地保有量1996+2010_mapTimeline.html')
+    parser.add_argument('--bundle', action='store_true',
+                        help="共享资源输出：每帧单独的压缩数据包，翻页时才加载；echarts 和中国地图放在输出目录的 assets 中")
+    parser.add_argument('--assets', default=None, help="离线资源目录（含 echarts.min.js、maps/china.js），配合 --bundle 使用")
+    args = parser.parse_args()
+    if args.bundle and ChartBundle is None:
+        parser.error("--bundle 需要 hlm_bundle：请把 HongLouMeng-Python 目录加入 PYTHONPATH")
+
+    if args.table:
+        codes, years, values = load_table(args.table)
+        metrics = {year: args.metric for year in years} if args.metric else None
+    else:
+        codes, years, values = table_from_dict(data_dict)
+        metrics = DEFAULT_METRICS
+
+    # 渲染轮播地图
+    tl = build_timeline(codes, years, values, metrics, args.unit, args.source, args.bins)
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    if args.bundle:
+        ChartBundle(os.path.dirname(args.output) or '.', args.assets).add(tl, args.output)
+    else:
+        tl.render(args.output)
+    print(f"已生成 {len(years)} 帧: {args.output}")
@@ -1,16 +1,25 @@
 import os
-import re
-import jieba
-import jieba.posseg as pseg
-import math
-from collections import defaultdict
-from pyecharts import options as opts
-from pyecharts.charts import Graph
-from pyecharts.commons.utils import JsCode
-from pyecharts.globals import CurrentConfig, ThemeType
-
-# 配置CDN资源
-CurrentConfig.ONLINE_HOST = "https://cdn.jsdelivr.net/npm/echarts@5.4.3/dist/"
+import csv
+import sys
+import json
+import time
+import argparse
+from hlm_tokens import (load_token_store, list_chapter_files, tagging_key, split_sentences,
+                        SPLIT_VERSION)
+from hlm_manifest import ChapterStats, chapter_hashes, stats_signature
+from hlm_metrics import metrics, timer
+from hlm_bundle import ChartBundle, render
+from hlm_layout import apply_layout, graph_layout
+from hlm_matcher import MatchSource, make_boundary_rule
+from hlm_corpus import open_corpus
+from hlm_index import INDEX_VERSION, load_position_index
+from hlm_matrix import CoOccurrenceMatrix, SentenceMentions
+from hlm_graph import CoOccurrenceIndex, TOOLTIP_JS, build_graph_data, write_ego_graphs
+from hlm_engine import (AnalysisEngine, Normalizer, WindowCoOccurrence, load_characters,
+                        SlidingCoOccurrence, DecayCoOccurrence, collect_mentions)
+
+# 配置CDN资源（pyecharts 只在生成图表时才导入）
+JS_HOST = "https://cdn.jsdelivr.net/npm/echarts@5.4.3/dist/"
 
 
 def setup_paths():
@@ -26,98 +35,64 @@ def setup_paths():
     for path in paths.values():
         if not os.path.exists(path):
             raise FileNotFoundError(f"路径不存在: {path}")
+    paths["cache"] = os.path.join(script_dir, "cache")  # 分词缓存目录，按需创建
     return paths
 
 
-def load_characters(character_path):
-    """加载人物字典"""
-    characters = set()
-    alias_map = {}
-    with open(character_path, 'r', encoding='utf-8') as f:
-        for line in f:
-            if line.strip():
-                parts = line.strip().split()
-                if len(parts) >= 2:
-                    name = parts[0]
-                    characters.add(name)
-                    if name == "宝玉":
-                        alias_map["贾宝玉"] = name
-                    elif name == "黛玉":
-                        alias_map["林黛玉"] = name
-                    elif name == "宝钗":
-                        alias_map["薛宝钗"] = name
-    return characters, alias_map
-
-
-def load_stopwords(stopwords_dir):
-    """加载停用词"""
-    stopwords = set()
-    for fname in os.listdir(stopwords_dir):
-        with open(os.path.join(stopwords_dir, fname), 'r', encoding='utf-8') as f:
-            stopwords.update(line.strip() for line in f if line.strip())
-    return stopwords
-
-
-def load_text_data(full_path, chapter_dir):
-    """加载文本内容"""
-    if os.path.exists(chapter_dir) and os.listdir(chapter_dir):
-        text = []
-        for fname in sorted(os.listdir(chapter_dir)):
-            if fname.endswith('.txt'):
-                with open(os.path.join(chapter_dir, fname), 'r', encoding='utf-8') as f:
-                    text.append(f.read())
-        return "\n".join(text)
-    else:
-        with open(full_path, 'r', encoding='utf-8') as f:
-            return f.read()
+def load_text_data(full_path, chapter_dir, cache_dir="./cache"):
+    """加载文本内容：内存映射的打包语料（Corpus），章节和句子按需解码"""
+    if os.path.exists(chapter_dir) and list_chapter_files(chapter_dir):
+        return open_corpus(list_chapter_files(chapter_dir), cache_dir)
+    return open_corpus([full_path], cache_dir)
 
 
 def cut_sentences(text):
-    """中文分句"""
-    sentences = re.split(r'([。！？\?])', text)
-    return [s1 + s2 for s1, s2 in zip(sentences[::2], sentences[1::2])]
-
-
-def analyze_co_occurrence(text, characters, alias_map, window_size=3):
-    """分析共现关系"""
-    for char in characters:
-        jieba.add_word(char, tag='nr')
-
-    sentences = cut_sentences(text)
-    freq = defaultdict(int)
-    co_occur = defaultdict(int)
-    co_occur_detail = defaultdict(dict)
-
-    for i in range(0, len(sentences), window_size):
-        window = "".join(sentences[i:i + window_size])
-        words = pseg.cut(window)
-        current_chars = set()
-
-        for word, flag in words:
-            if flag == 'nr':
-                normalized = alias_map.get(word, word)
-                if normalized in characters:
-                    current_chars.add(normalized)
+    """中文分句（惰性产出，句末引号归入本句，末尾没有句末标点的部分也保留）"""
+    for start, end in split_sentences(text):
+        yield text[start:end]
+
+
+def analyze_co_occurrence(store, characters, alias_map, window_size=3, backend='dict',
+                          stride=None, decay=None):
+    """分析共现关系（基于分词缓存，每 window_size 句为一个窗口）
+
+    stride 为窗口步长（默认等于 window_size，即互不重叠）；
+    decay 不为空时改用距离加权：相隔 d 句的两处提及权重为 decay ** d。
+    backend='dict' 返回 (freq, co_occur, co_occur_detail) 三个字典；
+    backend='matrix' 返回稀疏共现矩阵 CoOccurrenceMatrix。
+    """
+    stride = stride or window_size
+    if backend == 'matrix':
+        # 每句人物编号只构建一次，窗口直接由数组组装
+        accumulator = SentenceMentions()
+    elif decay is not None:
+        accumulator = DecayCoOccurrence(window_size, decay)
+    elif stride != window_size:
+        accumulator = SlidingCoOccurrence(window_size, stride)
+    else:
+        accumulator = WindowCoOccurrence(window_size)
 
-        # 更新统计
-        for char in current_chars:
-            freq[char] += 1
+    engine = AnalysisEngine(Normalizer(characters, alias_map))
+    engine.register('co_occur', accumulator)
+    result = engine.run(store)['co_occur']
+    if backend == 'matrix':
+        return result.co_occurrence(window_size, stride, decay)
+    return result
 
-        # 更新共现
-        chars_list = list(current_chars)
-        for j in range(len(chars_list)):
-            for k in range(j + 1, len(chars_list)):
-                char1, char2 = sorted((chars_list[j], chars_list[k]))
-                co_occur[(char1, char2)] += 1
-                co_occur_detail[char1][char2] = co_occur_detail[char1].get(char2, 0) + 1
-                co_occur_detail[char2][char1] = co_occur_detail[char2].get(char1, 0) + 1
 
-    return freq, co_occur, co_occur_detail
+def filter_data(freq, co_occur=None, co_occur_detail=None, top_n=120, main_chars=None):
+    """筛选数据
 
+    freq 为 CoOccurrenceMatrix 时直接在矩阵上筛选，返回字典视图；
+    为 CoOccurrenceIndex 时只访问前 top_n 人物和主角的邻域。
+    """
+    if isinstance(freq, CoOccurrenceMatrix):
+        return freq.filter(top_n, main_chars).views()
+    if isinstance(freq, CoOccurrenceIndex):
+        return freq.filter(top_n, main_chars)
 
-def filter_data(freq, co_occur, co_occur_detail, top_n=120, main_chars=None):
-    """筛选数据"""
-    top_chars = {char for char, _ in sorted(freq.items(), key=lambda x: -x[1])[:top_n]}
+    # 频次相同时按人物名取舍，与矩阵后端一致（freq 的插入顺序不固定）
+    top_chars = {char for char, _ in sorted(freq.items(), key=lambda x: (-x[1], x[0]))[:top_n]}
 
     if main_chars:
         main_chars = set(main_chars)
@@ -147,83 +122,53 @@ def filter_data(freq, co_occur, co_occur_detail, top_n=120, main_chars=None):
     return filtered_freq, filtered_co, filtered_co_detail
 
 
-def get_color(name):
-    """获取节点颜色"""
-    color_map = {
-        "宝玉": "#c23531",
-        "黛玉": "#2f4554",
-        "宝钗": "#61a0a8",
-    }
-    return color_map.get(name, "#d48265")
-
-
-def create_graph(freq, co_occur, co_occur_detail, output_file, main_char=None):
-    """创建关系图"""
-    # 节点数据（修复频次显示问题）
-    max_freq = max(freq.values()) if freq else 1
-    nodes = []
-    for name, count in freq.items():
-        relations = sorted(
-            [(k, v) for k, v in co_occur_detail.get(name, {}).items() if k != name],
-            key=lambda x: -x[1]
-        )[:5]
-
-        nodes.append({
-            "name": name,
-            "value": count,  # 确保传递频次数据
-            "symbolSize": 8 + 25 * (math.log(count + 1) / math.log(max_freq + 1)),
-            "itemStyle": {"color": get_color(name)},
-            "label": {"show": True, "fontSize": 10},
-            "relations": relations
-        })
-
-    # 边数据
-    max_co = max(co_occur.values()) if co_occur else 1
-    links = [{
-        "source": pair[0],
-        "target": pair[1],
-        "value": count,
-        "lineStyle": {
-            "width": 0.3 + 2 * (count / max_co),
-            "opacity": 0.7,
-            "curveness": 0.1
-        }
-    } for pair, count in co_occur.items()]
+def create_graph(freq, co_occur, co_occur_detail, output_file, main_char=None, bundle=None,
+                 layout='force'):
+    """创建关系图（指定 bundle 时输出为共享数据包的外壳页面）
+
+    layout='fixed' 时在本地预先计算力导向布局（按图的哈希缓存），节点带固定坐标，
+    浏览器不再模拟布局；默认 'force' 由 ECharts 在浏览器中布局。
+    """
+    nodes, links = build_graph_data(freq, co_occur, co_occur_detail)
+    if layout == 'fixed':
+        apply_layout(nodes, links)
+    title = f"《红楼梦》{'人物共现网络(出现频次Top120)' if not main_char else main_char + '共现关系图'}"
+    graph = graph_chart(nodes, links, title, layout)
+
+    # 渲染完整HTML
+    with timer('render.graph'):
+        render(graph, output_file, bundle)
+    print(f"已生成: {output_file}")
+
+
+def save_graph_data(freq, co_occur, co_occur_detail, output_file, layout='force'):
+    """只输出关系图的节点和边数据（JSON），不生成图表"""
+    nodes, links = build_graph_data(freq, co_occur, co_occur_detail)
+    if layout == 'fixed':
+        apply_layout(nodes, links)
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump({"nodes": nodes, "links": links}, f, ensure_ascii=False)
+    print(f"已生成: {output_file}")
+
+
+def graph_chart(nodes, links, title, layout='force'):
+    """关系图图表（create_graph 与章回 Timeline 共用）；layout='fixed' 时节点需已带 x/y"""
+    from pyecharts import options as opts
+    from pyecharts.charts import Graph
+    from pyecharts.commons.utils import JsCode
+    from pyecharts.globals import ThemeType
 
     # 修正后的tooltip格式化函数
-    tooltip_formatter = JsCode("""
-        function(params) {
-            if (params.dataType === 'node') {
-                var relations = params.data.relations || [];
-                var result = [
-                    '<div style="font-size:14px;font-weight:bold">' + params.name + '</div>',
-                    '<div style="font-size:12px;color:#666">出现频次: ' + params.data.value + '</div>'
-                ];
-                if (relations.length > 0) {
-                    result.push('<div style="margin:5px 0 3px 0;color:#666">主要共现:</div>');
-                    relations.forEach(function(item) {
-                        result.push('<div style="font-size:12px">• ' + item[0] + ': ' + item[1] + '次</div>');
-                    });
-                }
-                return result.join('');
-            } else if (params.dataType === 'edge') {
-                return [
-                    '<div style="font-size:14px;font-weight:bold">' + params.data.source + ' ↔ ' + params.data.target + '</div>',
-                    '<div style="font-size:12px">共现次数: ' + params.data.value + '次</div>'
-                ].join('');
-            }
-            return '';
-        }
-    """)
+    tooltip_formatter = JsCode(TOOLTIP_JS)
 
     # 创建图表
-    graph = (
+    return (
         Graph(init_opts=opts.InitOpts(
             width="720px",
             height="720px",
             theme=ThemeType.LIGHT,
             page_title="红楼梦人物共现关系",
-            js_host=CurrentConfig.ONLINE_HOST
+            js_host=JS_HOST
         ))
         .add(
             series_name="人物共现关系",
@@ -232,7 +177,7 @@ def create_graph(freq, co_occur, co_occur_detail, output_file, main_char=None):
             repulsion=200,
             edge_length=150,
             gravity=0.03,
-            layout="force",
+            layout="none" if layout == 'fixed' else "force",
             is_draggable=True,
             label_opts=opts.LabelOpts(
                 position="right",
@@ -250,48 +195,327 @@ def create_graph(freq, co_occur, co_occur_detail, output_file, main_char=None):
         )
         .set_global_opts(
             title_opts=opts.TitleOpts(
-                title=f"《红楼梦》{'人物共现网络(出现频次Top120)' if not main_char else main_char + '共现关系图'}",
+                title=title,
                 pos_left="center",
                 title_textstyle_opts=opts.TextStyleOpts(font_size=16)
             )
         )
     )
 
-    # 渲染完整HTML
-    graph.render(output_file)
-    print(f"已生成: {output_file}")
 
+def chapter_ranges(num_chapters, step=10, cumulative=False):
+    """Timeline 各帧的章回区间：每 step 回一帧；cumulative 时每帧从第1回累计"""
+    return [
+        (1 if cumulative else start, min(start + step - 1, num_chapters))
+        for start in range(1, num_chapters + 1, step)
+    ]
+
+
+def create_timeline(dynamic, ranges, output_file, top_n=60, bundle=None, layout='force'):
+    """按章回区间生成关系图 Timeline，每个区间一帧
+
+    dynamic 为 ChapterCoOccurrence，每帧的共现由前缀和相减得到，不重新统计。
+    layout='fixed' 时所有帧共用一套坐标（在全书共现上为各帧出现过的人物布局），翻页时人物位置不变。
+    """
+    from pyecharts import options as opts
+    from pyecharts.charts import Timeline
+    from pyecharts.globals import ThemeType
+
+    frames = []
+    for a, b in ranges:
+        nodes, links = build_graph_data(*dynamic.range(a, b).filter(top_n=top_n).views())
+        frames.append((a, b, nodes, links))
+
+    if layout == 'fixed':
+        names = {node["name"] for _, _, nodes, _ in frames for node in nodes}
+        _, co_occur, _ = dynamic.range(1, dynamic.num_chapters).views()
+        positions = graph_layout(
+            [{"name": name} for name in names],
+            [{"source": s, "target": t, "value": v}
+             for (s, t), v in co_occur.items() if s in names and t in names]
+        )
+        for _, _, nodes, _ in frames:
+            for node in nodes:
+                node["x"], node["y"] = positions[node["name"]]
+
+    tl = Timeline(init_opts=opts.InitOpts(
+        width="720px",
+        height="780px",
+        theme=ThemeType.LIGHT,
+        page_title="红楼梦人物共现关系演变",
+        js_host=JS_HOST
+    ))
+    tl.add_schema(play_interval=2000, is_auto_play=False)
+    for a, b, nodes, links in frames:
+        label = f"第{a}回" if a == b else f"第{a}-{b}回"
+        tl.add(graph_chart(nodes, links, f"《红楼梦》{label}人物共现网络", layout), label)
+
+    with timer('render.timeline'):
+        render(tl, output_file, bundle)
+    print(f"已生成: {output_file}（{len(frames)} 帧）")
+
+
+def load_recognized(paths, characters, alias_map, match='pseg', boundary=('', '')):
+    """人物识别的原始结果：pseg 为分词缓存 TokenStore，dict 为词典匹配 MatchSource
+
+    boundary 为词典匹配的边界规则 (前一字, 后一字)，见 make_boundary_rule。
+    """
+    if match == 'dict':
+        # 词典匹配：不分词，直接用自动机查找人名及别名
+        with load_text_data(paths["full_text"], paths["chapter_dir"], paths["cache"]) as corpus:
+            return MatchSource(corpus, characters | set(alias_map), make_boundary_rule(*boundary))
+    return load_token_store(paths["chapter_dir"], paths["character"], paths["cache"])
+
+
+def load_index(paths, characters, alias_map, match='pseg', boundary=('', '')):
+    """加载人物位置倒排索引（PositionIndex）
+
+    与分词缓存同一口径（章节内容、用户词典、jieba版本、人物表），
+    任一变化时由识别结果重新构建一次，之后检索不再读取分词结果。
+    """
+    signature = stats_signature(
+        f"index-v{INDEX_VERSION}", match, _recognizer_key(paths, match, boundary),
+        SPLIT_VERSION, chapter_hashes(list_chapter_files(paths["chapter_dir"])), characters, alias_map
+    )
+    return load_position_index(
+        lambda: load_recognized(paths, characters, alias_map, match, boundary),
+        Normalizer(characters, alias_map),
+        os.path.join(paths["cache"], f"positions_{match}_{signature[:16]}.npz"),
+    )
+
+
+def _recognizer_key(paths, match, boundary):
+    """缓存签名中的识别口径：pseg 取分词环境键，dict 取边界规则"""
+    return tagging_key(paths["character"]) if match == 'pseg' else list(boundary)
+
+
+def load_source(paths, characters, alias_map, match='pseg', boundary=('', '')):
+    """加载人物识别结果：pseg 分词缓存，或词典匹配
+
+    每回的人物提及按章节内容哈希缓存，只有内容变化的章节才重新识别，
+    合并后的提及序列与 TokenStore 接口一致，可直接交给分析函数。
+    """
+    chapter_files = list_chapter_files(paths["chapter_dir"])
 
-def main():
+    def load():
+        return load_recognized(paths, characters, alias_map, match, boundary)
+
+    signature = stats_signature(
+        match, _recognizer_key(paths, match, boundary), SPLIT_VERSION, characters, alias_map
+    )
+    stats = ChapterStats(os.path.join(paths["cache"], f"mentions_cooc_{match}.json"), signature)
+    hashes = chapter_hashes(chapter_files)
+    mentions, stale = collect_mentions(load, Normalizer(characters, alias_map), hashes, stats)
+    if stale:
+        print(f"重新识别人物的章节：{len(stale)}/{len(hashes)} 回")
+    return mentions
+
+
+def run_sweep(store, characters, alias_map, window_sizes, top_ns=(120,), focus_sets=(None,),
+              out_dir="./output/sweep", stride=None, decay=None, render_html=False, bundle=None,
+              layout='force'):
+    """参数扫描：窗口句数 × top_n × 主角集合
+
+    每句人物编号只构建一次，每个窗口句数只计算一次共现矩阵，其余按组合筛选。
+    每个组合输出一份图数据 JSON（可选 HTML），并把节点数、边数和耗时汇总到 summary.csv。
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    engine = AnalysisEngine(Normalizer(characters, alias_map))
+    engine.register('mentions', SentenceMentions())
+    mentions = engine.run(store)['mentions']
+
+    summary = []
+    for window_size in window_sizes:
+        start = time.perf_counter()
+        matrix = mentions.co_occurrence(window_size, stride, decay)
+        matrix_seconds = time.perf_counter() - start
+
+        for top_n in top_ns:
+            for focus in focus_sets:
+                start = time.perf_counter()
+                f_freq, f_co, f_detail = filter_data(matrix, top_n=top_n, main_chars=focus)
+                nodes, links = build_graph_data(f_freq, f_co, f_detail)
+
+                tag = '+'.join(focus) if focus else 'all'
+                name = f"w{window_size}_top{top_n}_{tag}"
+                with open(os.path.join(out_dir, name + '.json'), 'w', encoding='utf-8') as f:
+                    json.dump({
+                        "window_size": window_size,
+                        "top_n": top_n,
+                        "focus": list(focus or []),
+                        "nodes": nodes,
+                        "links": links
+                    }, f, ensure_ascii=False)
+                if render_html:
+                    create_graph(f_freq, f_co, f_detail, os.path.join(out_dir, name + '.html'),
+                                 tag if focus else None, bundle, layout)
+
+                summary.append([window_size, top_n, tag, len(nodes), len(links),
+                                round(matrix_seconds, 4), round(time.perf_counter() - start, 4)])
+
+    with open(os.path.join(out_dir, 'summary.csv'), 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        writer.writerow(['窗口句数', 'top_n', '主角', '节点数', '边数', '共现矩阵耗时(秒)', '筛选输出耗时(秒)'])
+        writer.writerows(summary)
+    print(f"参数扫描完成，共 {len(summary)} 组，汇总见 {os.path.join(out_dir, 'summary.csv')}")
+    return summary
+
+
+def sweep_main(match, window_sizes, top_ns, focus_sets, stride=None, decay=None, render_html=False,
+               bundle=None, layout='force', boundary=('', '')):
+    try:
+        paths = setup_paths()
+        characters, alias_map = load_characters(paths["character"])
+        store = load_source(paths, characters, alias_map, match, boundary)
+        run_sweep(store, characters, alias_map, window_sizes, top_ns, focus_sets,
+                  stride=stride, decay=decay, render_html=render_html, bundle=bundle,
+                  layout=layout)
+    except Exception as e:
+        metrics.error(e)
+        print(f"错误: {str(e)}")
+        raise
+
+
+def ego_batch_main(match='pseg', window_size=3, out_dir="./output/ego", bundle=None, boundary=('', '')):
+    """为人物表中每个人物生成自我中心网络（JSON + 共用查看页）"""
+    try:
+        paths = setup_paths()
+        characters, alias_map = load_characters(paths["character"])
+        store = load_source(paths, characters, alias_map, match, boundary)
+        index = CoOccurrenceIndex(*analyze_co_occurrence(store, characters, alias_map, window_size))
+        # 使用共享资源时查看页引用本地的 echarts，不访问 CDN
+        js_host = JS_HOST
+        if bundle is not None:
+            bundle.assets(['echarts'])
+            js_host = os.path.relpath(bundle.asset_dir, out_dir).replace(os.sep, '/') + '/'
+        entries = write_ego_graphs(index, characters, out_dir, js_host=js_host)
+        print(f"已生成 {len(entries)} 个人物的共现网络: {os.path.join(out_dir, 'index.html')}")
+    except Exception as e:
+        metrics.error(e)
+        print(f"错误: {str(e)}")
+        raise
+
+
+def timeline_main(match='pseg', window_size=3, stride=None, step=10, cumulative=False, top_n=60,
+                  bundle=None, layout='force', boundary=('', '')):
+    """章回演变：按章回累积共现（前缀和），生成关系图 Timeline"""
+    try:
+        paths = setup_paths()
+        characters, alias_map = load_characters(paths["character"])
+        store = load_source(paths, characters, alias_map, match, boundary)
+        engine = AnalysisEngine(Normalizer(characters, alias_map))
+        engine.register('mentions', SentenceMentions())
+        dynamic = engine.run(store)['mentions'].by_chapter(window_size, stride)
+        create_timeline(dynamic, chapter_ranges(dynamic.num_chapters, step, cumulative),
+                        "./output/co_occurrence_timeline.html", top_n, bundle, layout)
+    except Exception as e:
+        metrics.error(e)
+        print(f"错误: {str(e)}")
+        raise
+
+
+def main(match='pseg', backend='dict', window_size=3, stride=None, decay=None, bundle=None,
+         layout='force', analyze_only=False, boundary=('', '')):
     try:
         # 1. 加载数据
         paths = setup_paths()
-        text = load_text_data(paths["full_text"], paths["chapter_dir"])
         characters, alias_map = load_characters(paths["character"])
-        stopwords = load_stopwords(paths["stopwords"])
+        store = load_source(paths, characters, alias_map, match, boundary)
 
         # 2. 分析数据
-        freq, co_occur, co_occur_detail = analyze_co_occurrence(
-            text, characters, alias_map
-        )
+        result = analyze_co_occurrence(store, characters, alias_map, window_size,
+                                       backend=backend, stride=stride, decay=decay)
+        # 矩阵后端直接把矩阵交给 filter_data，字典后端先建邻接索引
+        source = result if backend == 'matrix' else CoOccurrenceIndex(*result)
 
         # 3. 生成全图 (Top120)
-        f_freq, f_co, f_detail = filter_data(
-            freq, co_occur, co_occur_detail, top_n=120
-        )
-        create_graph(f_freq, f_co, f_detail, "./output/co_occurrence.html")
+        f_freq, f_co, f_detail = filter_data(source, top_n=120)
+        if analyze_only:
+            save_graph_data(f_freq, f_co, f_detail, "./output/co_occurrence.json", layout)
+        else:
+            create_graph(f_freq, f_co, f_detail, "./output/co_occurrence.html", bundle=bundle, layout=layout)
 
         # 4. 生成主角图
         for char, pinyin in [("宝玉", "baoyu"), ("黛玉", "daiyu"), ("宝钗", "baochai")]:
-            cf_freq, cf_co, cf_detail = filter_data(
-                freq, co_occur, co_occur_detail, main_chars=[char]
-            )
-            create_graph(cf_freq, cf_co, cf_detail,
-                         f"./output/co_occurrence_{pinyin}.html", char)
+            cf_freq, cf_co, cf_detail = filter_data(source, main_chars=[char])
+            if analyze_only:
+                save_graph_data(cf_freq, cf_co, cf_detail, f"./output/co_occurrence_{pinyin}.json", layout)
+            else:
+                create_graph(cf_freq, cf_co, cf_detail,
+                             f"./output/co_occurrence_{pinyin}.html", char, bundle, layout)
 
     except Exception as e:
+        metrics.error(e)
         print(f"错误: {str(e)}")
+        raise
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="《红楼梦》人物共现关系分析")
+    parser.add_argument('--match', choices=['pseg', 'dict'], default='pseg',
+                        help="人物识别方式：pseg 词性标注 / dict 词典匹配（更快）")
+    parser.add_argument('--boundary-before', default='',
+                        help="词典匹配的边界规则：人名前一字为其中任一字时不算人名")
+    parser.add_argument('--boundary-after', default='',
+                        help="词典匹配的边界规则：人名后一字为其中任一字时不算人名，如 儿")
+    parser.add_argument('--backend', choices=['dict', 'matrix'], default=None,
+                        help="共现统计后端：dict 嵌套字典（默认）/ matrix 稀疏矩阵")
+    parser.add_argument('--window-size', type=int, default=3, help="窗口句数")
+    parser.add_argument('--stride', type=int, default=None,
+                        help="窗口步长（默认等于窗口句数；小于窗口句数时为滑动窗口）")
+    parser.add_argument('--decay', type=float, default=None,
+                        help="距离加权衰减系数，相隔 d 句的共现权重为 decay^d")
+    parser.add_argument('--sweep', default=None,
+                        help="参数扫描的窗口句数列表，如 1,2,3,5,8（指定后进入扫描模式）")
+    parser.add_argument('--sweep-top-n', default='120', help="参数扫描的 top_n 列表，如 60,120")
+    parser.add_argument('--sweep-focus', default='all',
+                        help="参数扫描的主角集合，逗号分隔，同一集合内用+连接，all 表示全图")
+    parser.add_argument('--sweep-html', action='store_true', help="参数扫描时同时渲染 HTML")
+    parser.add_argument('--ego-batch', action='store_true',
+                        help="为人物表中每个人物生成共现网络 JSON 及共用查看页")
+    parser.add_argument('--timeline', type=int, default=None, metavar='STEP',
+                        help="生成章回演变的关系图 Timeline，每 STEP 回一帧")
+    parser.add_argument('--cumulative', action='store_true', help="Timeline 每帧从第1回累计")
+    parser.add_argument('--timeline-top-n', type=int, default=60, help="Timeline 每帧保留的人物数")
+    parser.add_argument('--layout', choices=['force', 'fixed'], default='force',
+                        help="关系图布局：force 浏览器中模拟 / fixed 本地预计算固定坐标（按图缓存，页面打开即显示）")
+    parser.add_argument('--analyze-only', action='store_true',
+                        help="只统计并输出关系图数据 JSON，不生成图表（不导入 pyecharts）")
+    parser.add_argument('--bundle', action='store_true',
+                        help="共享资源输出：数据写入 ./output/data 压缩数据包，echarts 放在 ./output/assets，不引用 CDN")
+    parser.add_argument('--assets', default=None, help="离线资源目录（含 echarts.min.js 等），配合 --bundle 使用")
+    parser.add_argument('--report', default="./output/run_report_cooc.json", help="运行报告 JSON 路径")
+    parser.add_argument('--profile', action='store_true',
+                        help="采样分析主线程，输出 ./output/profile_cooc.svg 火焰图及 .folded 折叠栈")
+    args = parser.parse_args()
+    # Timeline 由按章回的窗口前缀和生成，不支持距离加权，也不区分后端
+    if args.timeline and (args.decay is not None or args.backend is not None):
+        parser.error("--timeline 不能与 --decay、--backend 同时使用")
+
+    metrics.start('cooc', profile=args.profile)
+    metrics.info["args"] = vars(args)
+    bundle = ChartBundle('./output', args.assets) if args.bundle else None
+    boundary = (args.boundary_before, args.boundary_after)
+    status = 0
+    try:
+        if args.timeline:
+            timeline_main(args.match, args.window_size, args.stride, args.timeline, args.cumulative,
+                          args.timeline_top_n, bundle, args.layout, boundary)
+        elif args.ego_batch:
+            ego_batch_main(args.match, args.window_size, bundle=bundle, boundary=boundary)
+        elif args.sweep:
+            sweep_main(
+                args.match,
+                [int(x) for x in args.sweep.split(',')],
+                [int(x) for x in args.sweep_top_n.split(',')],
+                [None if x == 'all' else x.split('+') for x in args.sweep_focus.split(',')],
+                args.stride, args.decay, args.sweep_html, bundle, args.layout, boundary
+            )
+        else:
+            main(args.match, args.backend or 'dict', args.window_size, args.stride, args.decay, bundle, args.layout,
+                 args.analyze_only, boundary)
+    except Exception:
+        status = 1  # 异常及调用栈已记录在运行报告中
+    metrics.finish(args.report, "./output/profile_cooc" if args.profile else None)
+    print(f"运行报告: {args.report}")
+    sys.exit(status)
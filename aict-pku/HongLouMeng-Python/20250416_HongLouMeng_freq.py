@@ -1,50 +1,77 @@
-import jieba
-import jieba.posseg as pseg
-from collections import OrderedDict, defaultdict
+import sys
+import argparse
 import csv
-from pyecharts import options as opts
-from pyecharts.charts import Bar, WordCloud
-from pyecharts.globals import ThemeType, SymbolType
-from pyecharts.commons.utils import JsCode
+from hlm_tokens import load_token_store, list_chapter_files, tagging_key, SPLIT_VERSION
+from hlm_matcher import MatchSource, make_boundary_rule
+from hlm_corpus import load_corpus
+from hlm_manifest import ChapterStats, chapter_hashes, stats_signature
+from hlm_metrics import metrics, timer
+from hlm_bundle import ChartBundle, render
+from hlm_engine import (AnalysisEngine, Normalizer, GlobalFrequency, ChapterFrequency,
+                        collect_mentions, load_characters, ALIASES)
 
 
 def load_data():
-    """加载数据"""
-    # 加载人物列表
-    characters = []
-    with open('./data/红楼梦_character.txt', 'r', encoding='utf-8') as f:
-        for line in f:
-            name = line.strip().split()[0]
-            characters.append(name)
-
-    # 主要人物映射
-    main_characters_map = {
-        '宝玉': '贾宝玉',
-        '黛玉': '林黛玉',
-        '宝钗': '薛宝钗'
-    }
+    """加载人物表及别名映射（与 cooc 脚本共用 hlm_engine.ALIASES）"""
+    return load_characters('./data/红楼梦_character.txt')
+
+
+def load_tokens(workers=1):
+    """读取分词缓存（首次运行时分词并写入 ./cache，workers>1 时多进程分词）"""
+    return load_token_store('./data/红楼梦_chap', './data/红楼梦_character.txt', './cache', workers)
+
+
+def load_matches(boundary=('', '')):
+    """词典匹配模式：用自动机直接在章节文本中查找人名，不做分词
+
+    boundary 为边界规则 (前一字, 后一字)，见 make_boundary_rule。
+    """
+    characters, alias_map = load_data()
+    names = characters | set(alias_map)
+    with load_corpus('./data/红楼梦_chap', './cache') as corpus:
+        return MatchSource(corpus, names, make_boundary_rule(*boundary))
+
+
+def load_mentions(store=None, match='pseg', boundary=('', '')):
+    """增量收集人物提及：每回结果按章节内容哈希缓存在 ./cache，只重新统计变化的章节"""
+    characters, alias_map = load_data()
+    # 别名统一映射为人物表中的名称，只统计人物表中的 nr 词
+    normalizer = Normalizer(characters, alias_map)
+    hashes = chapter_hashes(list_chapter_files('./data/红楼梦_chap'))
+    signature = stats_signature(
+        match, tagging_key('./data/红楼梦_character.txt') if match == 'pseg' else list(boundary),
+        SPLIT_VERSION, characters, alias_map
+    )
+    stats = ChapterStats(f'./cache/mentions_freq_{match}.json', signature)
+    if store is None:
+        # 有章节变化时才加载
+        store = (lambda: load_matches(boundary)) if match == 'dict' else load_tokens
+    mentions, stale = collect_mentions(store, normalizer, hashes, stats)
+    if stale:
+        print(f"重新统计 {len(stale)}/{len(hashes)} 回")
+    return mentions
+
+
+def count_characters(store=None, match='pseg', boundary=('', '')):
+    """单遍统计全书及每回人物出现频次（未变化章节的提及取自缓存）"""
+    characters, alias_map = load_data()
+    mentions = load_mentions(store, match, boundary)
 
-    return characters, main_characters_map
+    engine = AnalysisEngine(Normalizer(characters, alias_map))
+    engine.register('global', GlobalFrequency())
+    engine.register('chapter', ChapterFrequency())
+    return engine.run(mentions)
 
 
-def generate_character_wordcloud():
+def generate_character_wordcloud(counts=None, bundle=None):
     """生成人物词云图"""
-    characters, main_characters_map = load_data()
-    jieba.load_userdict("./data/红楼梦_character.txt")
-
-    # 读取全文
-    with open('./data/红楼梦_full.txt', 'r', encoding='utf-8') as f:
-        text = f.read()
-
-    # 统计人物出现频率
-    fre_char_dist = defaultdict(int)
-    for word, tag in pseg.cut(text):
-        # 处理主要人物的别名
-        if word in main_characters_map:
-            word = main_characters_map[word]
-        # 只统计人物名词
-        if tag == 'nr' and word in characters:
-            fre_char_dist[word] += 1
+    if counts is None:
+        counts = count_characters()
+    fre_char_dist = counts['global']
+
+    from pyecharts import options as opts
+    from pyecharts.charts import WordCloud
+    from pyecharts.globals import SymbolType
 
     # 转换为词云需要的格式
     wordcloud_data = [(name, freq) for name, freq in fre_char_dist.items()]
@@ -58,16 +85,22 @@ def generate_character_wordcloud():
             tooltip_opts=opts.TooltipOpts(formatter="{b}: {c}次")
         )
     )
-    wc.render('./output/character_wordcloud.html')
+    with timer('render.wordcloud'):
+        render(wc, './output/character_wordcloud.html', bundle)
 
     # 保存词云数据到CSV
-    with open('./output/character_wordcloud.csv', 'w', newline='', encoding='utf-8-sig') as f:
+    save_wordcloud_to_csv(wordcloud_data, './output/character_wordcloud.csv')
+
+    return wordcloud_data
+
+
+def save_wordcloud_to_csv(wordcloud_data, filename):
+    """保存人物频次（词云数据）到CSV"""
+    with open(filename, 'w', newline='', encoding='utf-8-sig') as f:
         writer = csv.writer(f)
         writer.writerow(['人物', '出现频次'])
         writer.writerows(sorted(wordcloud_data, key=lambda x: x[1], reverse=True))
 
-    return wordcloud_data
-
 
 def save_top3_to_csv(top3_data, filename):
     """保存每回前三数据到CSV"""
@@ -87,6 +120,36 @@ def save_top3_to_csv(top3_data, filename):
             writer.writerow(row)
 
 
+def save_keywords_to_csv(keywords, filename, score_name):
+    """保存每回关键词到CSV（格式同 save_top3_to_csv）"""
+    k = max((len(top) for top in keywords), default=0)
+    with open(filename, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        # 写入表头
+        header = ['回目']
+        for i in range(1, k + 1):
+            header.extend([f'关键词{i}', score_name])
+        writer.writerow(header)
+        # 写入数据
+        for chap, top in enumerate(keywords, start=1):
+            row = [chap]
+            for word, score in top:
+                row.extend([word, score])
+            # 如果不足k个，补空值
+            while len(row) < 2 * k + 1:
+                row.extend(["", 0])
+            writer.writerow(row)
+
+
+def extract_keywords(k=10, workers=1, stopwords_dir='./data/stopwords'):
+    """每回关键词（TF-IDF 与对数似然关键性），基于分词结果，过滤停用词"""
+    from hlm_keywords import load_stopwords, chapter_keywords
+    result = chapter_keywords(load_tokens(workers), load_stopwords(stopwords_dir), k)
+    save_keywords_to_csv(result['tfidf'], './output/keywords_tfidf.csv', 'TF-IDF')
+    save_keywords_to_csv(result['keyness'], './output/keywords_keyness.csv', 'G²')
+    return result
+
+
 def save_main_chars_to_csv(main_chars_data, filename):
     """保存主要人物数据到CSV"""
     with open(filename, 'w', newline='', encoding='utf-8-sig') as f:
@@ -101,10 +164,9 @@ def save_main_chars_to_csv(main_chars_data, filename):
             writer.writerow(row)
 
 
-def top3_appear_per_chapter():
-    """每一回出场次数前三的角色（并列柱状图）"""
-    characters, main_characters_map = load_data()
-    jieba.load_userdict("./data/红楼梦_character.txt")
+def chapter_top3(counts):
+    """每回出场次数前三的人物，以及宝、黛、钗每回的出场次数"""
+    chapter_counts = counts['chapter']
 
     top3_data = []  # 改为列表存储每回前三数据
     main_chars_data = {  # 保存主要人物数据
@@ -113,33 +175,36 @@ def top3_appear_per_chapter():
         '薛宝钗': []
     }
 
-    # 准备图表数据
-    chap_names = [f"第{i}回" for i in range(1, 121)]
-
     # 遍历120个章节
     for i in range(1, 121):
-        chapter_file = f"./data/红楼梦_chap/{i:03d}.txt"
-        with open(chapter_file, 'r', encoding='utf-8') as f:
-            text = f.read()
-
-        # 统计本章人物出现频率
-        fre_char_dist = defaultdict(int)
-        for word, tag in pseg.cut(text):
-            # 处理主要人物的别名
-            if word in main_characters_map:
-                word = main_characters_map[word]
-            # 只统计人物名词
-            if tag == 'nr' and word in characters:
-                fre_char_dist[word] += 1
-
-        # 记录主要人物数据
+        # 本章人物出现频率
+        fre_char_dist = chapter_counts.get(i, {})
+
+        # 记录主要人物数据（全名的出现已归并到人物表中的统一名称）
         for char in ['贾宝玉', '林黛玉', '薛宝钗']:
-            main_chars_data[char].append(fre_char_dist.get(char, 0))
+            main_chars_data[char].append(fre_char_dist.get(ALIASES.get(char, char), 0))
 
         # 获取前三名并保存
         sorted_chars = sorted(fre_char_dist.items(), key=lambda x: x[1], reverse=True)
         top3_data.append(sorted_chars[:3])
 
+    return top3_data, main_chars_data
+
+
+def top3_appear_per_chapter(counts=None, bundle=None):
+    """每一回出场次数前三的角色（并列柱状图）"""
+    from pyecharts import options as opts
+    from pyecharts.charts import Bar
+    from pyecharts.globals import ThemeType
+    from pyecharts.commons.utils import JsCode
+
+    if counts is None:
+        counts = count_characters()
+    top3_data, main_chars_data = chapter_top3(counts)
+
+    # 准备图表数据
+    chap_names = [f"第{i}回" for i in range(1, 121)]
+
     # 保存数据到CSV
     save_top3_to_csv(top3_data, './output/top3_characters_per_chapter.csv')
     save_main_chars_to_csv(main_chars_data, './output/main_characters_appear.csv')
@@ -260,12 +325,17 @@ def top3_appear_per_chapter():
         )
     )
 
-    bar.render('./output/top3_appear_per_chapter.html')
+    with timer('render.bar'):
+        render(bar, './output/top3_appear_per_chapter.html', bundle)
     return main_chars_data
 
 
-def main_characters_appear(main_chars_data):
+def main_characters_appear(main_chars_data, bundle=None):
     """主要人物出场频次"""
+    from pyecharts import options as opts
+    from pyecharts.charts import Bar
+    from pyecharts.globals import ThemeType
+
     main_characters = ['贾宝玉', '林黛玉', '薛宝钗']
     chapters = list(range(1, 121))
 
@@ -289,26 +359,80 @@ def main_characters_appear(main_chars_data):
         yaxis_opts=opts.AxisOpts(name="出场次数")
     )
     bar.set_series_opts(label_opts=opts.LabelOpts(is_show=False))
-    bar.render('./output/main_characters_appear.html')
+    with timer('render.bar'):
+        render(bar, './output/main_characters_appear.html', bundle)
 
 
 if __name__ == '__main__':
-    # 生成人物词云图
-    print("正在生成人物词云...")
-    generate_character_wordcloud()
-
-    # 生成每回前三人物图表并获取主要人物数据
-    print("正在分析每回出场人物...")
-    main_chars_data = top3_appear_per_chapter()
-
-    # 生成主要人物出场频次图表
-    print("正在分析主要人物出场频次...")
-    main_characters_appear(main_chars_data)
-
-    print("\n分析完成！已生成以下文件：")
-    print("- character_wordcloud.html (人物词云图)")
-    print("- character_wordcloud.csv (人物频次数据)")
-    print("- top3_appear_per_chapter.html (每回前三人物并列柱状图)")
-    print("- main_characters_appear.html (宝黛钗出场频次柱状图)")
-    print("- top3_characters_per_chapter.csv (每回前三人物数据)")
-    print("- main_characters_appear.csv (宝黛钗出场频次数据)")
+    parser = argparse.ArgumentParser(description="《红楼梦》人物出场频次分析")
+    parser.add_argument('--workers', type=int, default=1, help="分词进程数（默认串行）")
+    parser.add_argument('--match', choices=['pseg', 'dict'], default='pseg',
+                        help="人物识别方式：pseg 词性标注 / dict 词典匹配（更快）")
+    parser.add_argument('--boundary-before', default='',
+                        help="词典匹配的边界规则：人名前一字为其中任一字时不算人名")
+    parser.add_argument('--boundary-after', default='',
+                        help="词典匹配的边界规则：人名后一字为其中任一字时不算人名，如 儿")
+    parser.add_argument('--keywords', type=int, default=None, metavar='K',
+                        help="同时提取每回前 K 个关键词（TF-IDF 与对数似然），需要分词结果")
+    parser.add_argument('--analyze-only', action='store_true',
+                        help="只统计并输出 CSV，不生成图表（不导入 pyecharts）")
+    parser.add_argument('--bundle', action='store_true',
+                        help="共享资源输出：数据写入 ./output/data 压缩数据包，echarts 放在 ./output/assets，不引用 CDN")
+    parser.add_argument('--assets', default=None, help="离线资源目录（含 echarts.min.js 等），配合 --bundle 使用")
+    parser.add_argument('--report', default="./output/run_report_freq.json", help="运行报告 JSON 路径")
+    parser.add_argument('--profile', action='store_true',
+                        help="采样分析主线程，输出 ./output/profile_freq.svg 火焰图及 .folded 折叠栈")
+    args = parser.parse_args()
+    metrics.start('freq', profile=args.profile)
+    metrics.info["args"] = vars(args)
+    status = 0
+    try:
+        bundle = ChartBundle('./output', args.assets) if args.bundle else None
+
+        # 只在有章节变化时读取分词结果（且只对变化的章节分词），单遍完成全部统计
+        boundary = (args.boundary_before, args.boundary_after)
+        store = (lambda: load_matches(boundary)) if args.match == 'dict' else (lambda: load_tokens(args.workers))
+        counts = count_characters(store, args.match, boundary)
+
+        if args.analyze_only:
+            print("正在保存统计结果...")
+            save_wordcloud_to_csv(list(counts['global'].items()), './output/character_wordcloud.csv')
+            top3_data, main_chars_data = chapter_top3(counts)
+            save_top3_to_csv(top3_data, './output/top3_characters_per_chapter.csv')
+            save_main_chars_to_csv(main_chars_data, './output/main_characters_appear.csv')
+        else:
+            # 生成人物词云图
+            print("正在生成人物词云...")
+            generate_character_wordcloud(counts, bundle)
+
+            # 生成每回前三人物图表并获取主要人物数据
+            print("正在分析每回出场人物...")
+            main_chars_data = top3_appear_per_chapter(counts, bundle)
+
+            # 生成主要人物出场频次图表
+            print("正在分析主要人物出场频次...")
+            main_characters_appear(main_chars_data, bundle)
+
+        if args.keywords:
+            print("正在提取每回关键词...")
+            extract_keywords(args.keywords, args.workers)
+
+        print("\n分析完成！已生成以下文件：")
+        if not args.analyze_only:
+            print("- character_wordcloud.html (人物词云图)")
+            print("- top3_appear_per_chapter.html (每回前三人物并列柱状图)")
+            print("- main_characters_appear.html (宝黛钗出场频次柱状图)")
+        print("- character_wordcloud.csv (人物频次数据)")
+        print("- top3_characters_per_chapter.csv (每回前三人物数据)")
+        print("- main_characters_appear.csv (宝黛钗出场频次数据)")
+        if args.keywords:
+            print("- keywords_tfidf.csv (每回 TF-IDF 关键词)")
+            print("- keywords_keyness.csv (每回对数似然关键词)")
+    except Exception as e:
+        metrics.error(e)
+        print(f"错误: {str(e)}")
+        status = 1  # 异常及调用栈已记录在运行报告中
+
+    metrics.finish(args.report, "./output/profile_freq" if args.profile else None)
+    print(f"运行报告: {args.report}")
+    sys.exit(status)
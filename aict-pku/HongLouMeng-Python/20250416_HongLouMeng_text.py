@@ -1,6 +1,85 @@
 import re
 import os
+import json
+import time
+import filecmp
+import tracemalloc
+import argparse
+from collections import deque
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from importlib import metadata
 from zhconv import convert
+from hlm_manifest import load_manifest, save_manifest, content_hash
+
+# 章回标题（兼容多种编号格式）
+CHAPTER_PATTERN = re.compile(
+    r'^(第(?:[一二三四五六七八九十零百]+|[\d零一二三四五六七八九十百]+)回)\s*([^\n]+)',
+    re.MULTILINE
+)
+# 行首的章回序号，用于流式切分（标题可能在下一行，完整匹配留到 format_chapter）
+HEADING_PATTERN = re.compile(r'第(?:[一二三四五六七八九十零百]+|[\d零一二三四五六七八九十百]+)回')
+
+
+# 默认清理规则（通行版）：成对标记之间的内容整段删除，遇到截断标记时丢弃其后全部内容
+DEFAULT_RULES = {
+    "drop": [["【", "】"], ["〈", "〉"]],  # 批语、按语
+    "stop": ["注释"],  # 简体后的注释标记
+}
+
+
+class ChapterCleaner:
+    """单遍章节清理器：从左到右扫描一次，只在最后拼接一次
+
+    各标记用 str.find 定位（C 实现，不回溯），成对标记不跨行（与原 re.sub 的 .*? 相同）；
+    规则可配置，以适配批注标记不同的其他版本。
+    """
+
+    def __init__(self, drop=DEFAULT_RULES["drop"], stop=DEFAULT_RULES["stop"]):
+        self.drop = [tuple(pair) for pair in drop]
+        self.stop = list(stop)
+
+    @classmethod
+    def from_file(cls, path):
+        """从 JSON 规则文件创建：{"drop": [[左, 右], ...], "stop": [标记, ...]}"""
+        with open(path, 'r', encoding='utf-8') as f:
+            rules = json.load(f)
+        return cls(rules.get("drop", []), rules.get("stop", []))
+
+    def _find_stop(self, text, pos):
+        found = [i for i in (text.find(m, pos) for m in self.stop) if i != -1]
+        return min(found, default=len(text))
+
+    def clean(self, text, start=0):
+        """清理 text[start:]，返回去除首尾空白的正文"""
+        stop_at = self._find_stop(text, start)
+        nexts = [text.find(left, start) for left, _ in self.drop]  # 各左标记的下一个位置
+        pieces = []
+        pos = start
+        while True:
+            k = min((k for k, i in enumerate(nexts) if 0 <= i < stop_at),
+                    key=nexts.__getitem__, default=None)
+            if k is None:
+                break
+            left, right = self.drop[k]
+            i = nexts[k]
+            eol = text.find('\n', i)
+            j = text.find(right, i + len(left), len(text) if eol == -1 else eol)
+            if j == -1:  # 本行没有配对的右标记，不删除
+                nexts[k] = text.find(left, i + 1)
+                continue
+            end = j + len(right)
+            pieces.append(text[pos:i])
+            pos = end
+            if end > stop_at:  # 截断标记落在被删除的内容中
+                stop_at = self._find_stop(text, end)
+            nexts = [n if n >= end or n == -1 else text.find(left, end)
+                     for n, (left, _) in zip(nexts, self.drop)]
+        pieces.append(text[pos:max(pos, stop_at)])
+        return ''.join(pieces).strip()
+
+
+DEFAULT_CLEANER = ChapterCleaner()
 
 
 def normalize_title(title):
@@ -8,73 +87,329 @@ def normalize_title(title):
     return re.sub(r'\s+', ' ', title.strip())
 
 
-def preprocess_hongloumeng(input_file, output_file, chap_dir):
+def iter_lines(input_file, chunk_size=1 << 20):
+    """分块读取文件，逐行产出（保留换行符），跨块的行会被拼接完整"""
+    with open(input_file, 'r', encoding='utf-8') as f:
+        rest = ''
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            lines = (rest + chunk).split('\n')
+            rest = lines.pop()
+            for line in lines:
+                yield line + '\n'
+        if rest:
+            yield rest
+
+
+@lru_cache(maxsize=8192)
+def to_simplified(text):
+    """繁体转简体（进程内按行/段缓存，重复的段落直接命中）"""
+    return convert(text, 'zh-cn')
+
+
+class ConversionCache:
+    """按行内容哈希持久化的转换结果（JSON，文件名带 zhconv 版本）
+
+    再次处理（如修订过的版本）时未改动的行直接取缓存，只转换新增或改动的行；
+    保存时只保留本次用到的行，缓存不会随版本更替无限增长。
+    """
+
+    def __init__(self, cache_dir):
+        self.path = os.path.join(cache_dir, f"zhconv_{metadata.version('zhconv')}.json")
+        self.entries = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        self.used = {}
+        self.lookups = 0
+        self.hits = 0
+
+    def get(self, line):
+        """缓存的转换结果，没有时返回 None"""
+        self.lookups += 1
+        key = content_hash(line)
+        result = self.entries.get(key)
+        if result is not None:
+            self.used[key] = result
+            self.hits += 1
+        return result
+
+    def put(self, line, result):
+        self.used[content_hash(line)] = result
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.used, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+def _convert_batch(lines):
+    """工作进程：转换一批行"""
+    return [to_simplified(line) for line in lines]
+
+
+def _iter_batches(lines, batch_lines):
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= batch_lines:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _finish_batch(batch, cached, future, cache):
+    """按原顺序合并一批中命中缓存的行和新转换的行"""
+    converted = iter(future.result() if future else ())
+    for line, result in zip(batch, cached):
+        if result is None:
+            result = next(converted)
+            if cache is not None:
+                cache.put(line, result)
+        yield result
+
+
+def iter_simplified(lines, workers=1, batch_lines=256, cache=None):
+    """逐行转换为简体，workers > 1 时按批分发到进程池并保持原顺序
+
+    只在换行处切分：转换词典中的词条不跨行，因此结果与整体转换完全相同。
+    进程池中同时处理的批次有上限，仍然是流式的。
+    给出 cache（ConversionCache）时先查缓存，只有未命中的行才交给转换。
+    """
+    if workers <= 1:
+        for line in lines:
+            result = cache.get(line) if cache is not None else None
+            if result is None:
+                result = to_simplified(line)
+                if cache is not None:
+                    cache.put(line, result)
+            yield result
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for batch in _iter_batches(lines, batch_lines):
+            cached = [cache.get(line) for line in batch] if cache is not None else [None] * len(batch)
+            missing = [line for line, result in zip(batch, cached) if result is None]
+            future = pool.submit(_convert_batch, missing) if missing else None
+            pending.append((batch, cached, future))
+            if len(pending) >= workers * 4:
+                yield from _finish_batch(*pending.popleft(), cache)
+        while pending:
+            yield from _finish_batch(*pending.popleft(), cache)
+
+
+def verify_conversion(input_file, workers=1):
+    """自检：分段（并行）转换的结果须与整体转换完全一致"""
     with open(input_file, 'r', encoding='utf-8') as f:
-        text = convert(f.read(), 'zh-cn')  # 先整体转换为简体
+        expected = convert(f.read(), 'zh-cn')
+    actual = ''.join(iter_simplified(iter_lines(input_file), workers))
+    if actual != expected:
+        pos = next((i for i, (a, b) in enumerate(zip(actual, expected)) if a != b),
+                   min(len(actual), len(expected)))
+        raise AssertionError(f"转换结果不一致：第 {pos} 个字符附近 {actual[pos:pos + 20]!r} != {expected[pos:pos + 20]!r}")
+    return len(actual)
+
+
+def iter_chapters(lines, start_marker):
+    """从（已转换为简体的）行流中切分章回，逐回产出章节原文
+
+    正文从 start_marker 处开始；行首匹配章回标题时开始新的一回，
+    每次只在内存中保留当前一回。
+    """
+    started = False
+    current = None
+    for line in lines:
+        if not started:
+            pos = line.find(start_marker)
+            if pos == -1:
+                continue
+            started = True
+            line = line[pos:]
+
+        if HEADING_PATTERN.match(line):
+            if current is not None:
+                yield ''.join(current)
+            current = [line]
+        elif current is not None:
+            current.append(line)
 
-    # 1. 找到正文开始的位置（简体版）
-    start_marker = convert("第一回　甄士隱夢幻識通靈　賈雨村風塵懷閨秀", 'zh-cn')
-    start_pos = text.find(start_marker)
-    if start_pos == -1:
+    if not started:
         raise ValueError("无法找到正文开始位置")
-    text = text[start_pos:]
+    if current is not None:
+        yield ''.join(current)
+
+
+def _legacy_clean(chapter_content, heading_len):
+    """原先的逐步清理（每一步都生成新的整回字符串），仅用于基准对比"""
+    chapter_content = re.sub(r'【.*?】', '', chapter_content)  # 批语
+    chapter_content = re.sub(r'〈.*?〉', '', chapter_content)  # 按语
+    if '注释' in chapter_content:  # 简体后的注释标记
+        chapter_content = chapter_content[:chapter_content.find('注释')]
+    return chapter_content[heading_len:].strip()
+
+
+def format_chapter(chapter_num, chapter_content, cleaner=None):
+    """清理单回内容并生成格式化文本"""
+    match = CHAPTER_PATTERN.match(chapter_content)
+    hanzi_chapter = match.group(1)  # 汉字章回序号
+    chapter_title = normalize_title(match.group(2))  # 标题
+
+    # 删除非正文内容（从标题行之后开始，单遍扫描）
+    body = (cleaner or DEFAULT_CLEANER).clean(chapter_content, match.end())
+
+    # 生成格式化内容
+    return (
+        f"\n--------------------\n{chapter_num}\n"
+        f"--------------------\n"
+        f"{hanzi_chapter} {chapter_title}\n"
+        f"{body}"
+    )
+
+
+def benchmark_cleaning(input_file, cleaner=None, repeat=5):
+    """清理步骤的微基准：原 re.sub 链 vs 单遍清理器（耗时与峰值内存分配）"""
+    cleaner = cleaner or DEFAULT_CLEANER
+    start_marker = to_simplified("第一回　甄士隱夢幻識通靈　賈雨村風塵懷閨秀")
+    lines = iter_simplified(iter_lines(input_file))
+    chapters = [
+        (text, CHAPTER_PATTERN.match(text).end()) for text in iter_chapters(lines, start_marker)
+    ]
+
+    mismatched = [i + 1 for i, (text, pos) in enumerate(chapters)
+                  if _legacy_clean(text, pos) != cleaner.clean(text, pos)]
+
+    results = {}
+    for name, func in [("re.sub 链", _legacy_clean), ("单遍清理", cleaner.clean)]:
+        best = float('inf')
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            for text, pos in chapters:
+                func(text, pos)
+            best = min(best, time.perf_counter() - t0)
+
+        # 逐回测量峰值分配，取各回最大值
+        peak = 0
+        tracemalloc.start()
+        for text, pos in chapters:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            func(text, pos)
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - base)
+        tracemalloc.stop()
+        results[name] = (best, peak)
+
+    print(f"共 {len(chapters)} 回，结果不一致的章回：{mismatched or '无'}")
+    for name, (seconds, peak) in results.items():
+        print(f"{name}：{seconds * 1000:.1f} ms，单回峰值分配 {peak / 1024:.0f} KB")
+    return results, mismatched
+
+
+def _same_content(path, data):
+    """文件是否已存在且字节与 data 相同"""
+    if not os.path.exists(path):
+        return False
+    with open(path, 'rb') as f:
+        return f.read() == data
+
+
+def preprocess_hongloumeng(input_file, output_file, chap_dir, chunk_size=1 << 20, workers=1,
+                           cleaner=None, cache_dir=None):
+    """流式预处理：分块读取、逐行转换简体、逐回清理并写出
+
+    内存占用以最长的一回为上限，与全书大小无关。
+    给出 cache_dir 时按行哈希持久化转换结果，再次运行只转换改动过的行。
+    只改写内容有变化的章节文件，并在章节目录下更新清单 manifest.json
+    （每回的内容哈希），下游据此只重新分析变化的章节。
+    """
+    # 1. 正文开始的位置（简体版）
+    start_marker = to_simplified("第一回　甄士隱夢幻識通靈　賈雨村風塵懷閨秀")
 
     # 2. 确保章节目录存在
     os.makedirs(chap_dir, exist_ok=True)
 
-    # 3. 改进的正则表达式，兼容多种编号格式
-    chapter_pattern = re.compile(
-        r'^(第(?:[一二三四五六七八九十零百]+|[\d零一二三四五六七八九十百]+)回)\s*([^\n]+)',
-        re.MULTILINE
-    )
-    matches = list(chapter_pattern.finditer(text))
+    # 3. 逐行转换为简体
+    cache = ConversionCache(cache_dir) if cache_dir else None
+    lines = iter_simplified(iter_lines(input_file, chunk_size), workers, cache=cache)
+
+    old_manifest = load_manifest(chap_dir)
+    hashes = {}
+    changed = []
+    count = 0
+    tmp_file = output_file + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as full:
+        for i, chapter_content in enumerate(iter_chapters(lines, start_marker)):
+            chapter_num = f"{i + 1:03d}"  # 001-120
+            formatted_chapter = format_chapter(chapter_num, chapter_content, cleaner)
+
+            # 保存单个章回文件（内容未变时不改写）
+            fname = f"{chapter_num}.txt"
+            chap_file = os.path.join(chap_dir, fname)
+            # 与文本模式写出的字节相同（'\n' 转为 os.linesep），清单直接记录其哈希
+            data = formatted_chapter.replace('\n', os.linesep).encode('utf-8')
+            if not _same_content(chap_file, data):
+                with open(chap_file, 'wb') as f:
+                    f.write(data)
+                changed.append(chapter_num)
+            hashes[fname] = content_hash(data)
+
+            # 追加到完整文件（各回之间以换行分隔）
+            if i:
+                full.write('\n')
+            full.write(formatted_chapter)
+            count += 1
+
+    # 完整文件同样只在内容变化时替换
+    if os.path.exists(output_file) and filecmp.cmp(tmp_file, output_file, shallow=False):
+        os.remove(tmp_file)
+    else:
+        os.replace(tmp_file, output_file)
+
+    # 删除本次不再产生的旧章节文件
+    for fname in old_manifest:
+        if fname not in hashes and os.path.exists(os.path.join(chap_dir, fname)):
+            os.remove(os.path.join(chap_dir, fname))
+    save_manifest(chap_dir, hashes)
+    if cache is not None:
+        cache.save()
+        print(f"转换缓存命中 {cache.hits}/{cache.lookups} 行")
+    print(f"共 {count} 回，内容有变化的 {len(changed)} 回" +
+          (f"：{', '.join(changed)}" if 0 < len(changed) <= 10 else ""))
 
     # 4. 验证章回数量
-    if len(matches) != 120:
-        print(f"警告：发现{len(matches)}回，预期120回")
-
-    chapters = []
-    for i, match in enumerate(matches):
-        chapter_num = f"{i + 1:03d}"  # 001-120
-        hanzi_chapter = match.group(1)  # 汉字章回序号
-        chapter_title = normalize_title(match.group(2))  # 标题
-
-        # 确定当前回的范围
-        start_pos = match.start()
-        end_pos = matches[i + 1].start() if i + 1 < len(matches) else len(text)
-        chapter_content = text[start_pos:end_pos]
-
-        # 删除非正文内容
-        chapter_content = re.sub(r'【.*?】', '', chapter_content)  # 批语
-        chapter_content = re.sub(r'〈.*?〉', '', chapter_content)  # 按语
-        if '注释' in chapter_content:  # 简体后的注释标记
-            chapter_content = chapter_content[:chapter_content.find('注释')]
-
-        # 生成格式化内容
-        formatted_chapter = (
-            f"\n--------------------\n{chapter_num}\n"
-            f"--------------------\n"
-            f"{hanzi_chapter} {chapter_title}\n"
-            f"{chapter_content[len(match.group(0)):].strip()}"  # 去除标题行
-        )
-
-        # 保存单个章回文件
-        chap_file = os.path.join(chap_dir, f"{chapter_num}.txt")
-        with open(chap_file, 'w', encoding='utf-8') as f:
-            f.write(formatted_chapter)
-
-        chapters.append(formatted_chapter)
-
-    # 保存完整文件
-    with open(output_file, 'w', encoding='utf-8') as f:
-        f.write('\n'.join(chapters))
-
-
-# 使用示例
-input_file = './data/紅樓夢-通行版一百二十回.txt'
-output_file = './data/红楼梦_full.txt'
-chap_dir = './data/红楼梦_chap/'
-
-preprocess_hongloumeng(input_file, output_file, chap_dir)
-print(f"处理完成！完整版保存到 {output_file}")
-print(f"分章回文件保存到 {chap_dir} 目录")
\ No newline at end of file
+    if count != 120:
+        print(f"警告：发现{count}回，预期120回")
+    return changed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="红楼梦文本预处理")
+    parser.add_argument('--workers', type=int, default=1, help="繁简转换的进程数")
+    parser.add_argument('--verify', action='store_true', help="只检查分段转换与整体转换是否一致")
+    parser.add_argument('--rules', default=None,
+                        help="清理规则 JSON 文件：{\"drop\": [[左, 右], ...], \"stop\": [标记, ...]}")
+    parser.add_argument('--benchmark', action='store_true', help="对比原 re.sub 链与单遍清理器")
+    parser.add_argument('--no-cache', action='store_true', help="不使用 ./cache 下的逐行转换缓存")
+    args = parser.parse_args()
+
+    # 使用示例
+    input_file = './data/紅樓夢-通行版一百二十回.txt'
+    output_file = './data/红楼梦_full.txt'
+    chap_dir = './data/红楼梦_chap/'
+
+    cleaner = ChapterCleaner.from_file(args.rules) if args.rules else None
+    if args.verify:
+        n = verify_conversion(input_file, args.workers)
+        print(f"转换一致：共 {n} 字")
+    elif args.benchmark:
+        benchmark_cleaning(input_file, cleaner)
+    else:
+        preprocess_hongloumeng(input_file, output_file, chap_dir, workers=args.workers,
+                               cleaner=cleaner, cache_dir=None if args.no_cache else './cache')
+        print(f"处理完成！完整版保存到 {output_file}")
+        print(f"分章回文件保存到 {chap_dir} 目录")
@@ -0,0 +1,249 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import importlib.util
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from hlm_metrics import peak_rss_kb
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(SCRIPT_DIR, "data")
+
+# 各阶段（按流水线顺序）；与规模无关的阶段只在 1× 时运行
+STAGES = ['preprocess', 'dictionary', 'segment', 'count', 'filter', 'render']
+SCALE_FREE = {'dictionary'}
+
+
+def load_script(name):
+    """导入 20250416_HongLouMeng_{name}.py（文件名以数字开头，不能直接 import）"""
+    path = os.path.join(SCRIPT_DIR, f"20250416_HongLouMeng_{name}.py")
+    spec = importlib.util.spec_from_file_location(f"hlm_{name}_script", path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module  # 进程池按模块名序列化其中的函数
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_scaled_corpus(work_dir, scale, num_chapters=None):
+    """合成 scale 倍规模的语料：章节文件和原始文本都按原样重复 scale 次"""
+    from hlm_tokens import list_chapter_files
+
+    chapter_files = list_chapter_files(os.path.join(DATA_DIR, "红楼梦_chap"))[:num_chapters]
+    chap_dir = os.path.join(work_dir, "chap")
+    os.makedirs(chap_dir, exist_ok=True)
+    n = 0
+    for _ in range(scale):
+        for path in chapter_files:
+            n += 1
+            shutil.copyfile(path, os.path.join(chap_dir, f"{n:05d}.txt"))
+
+    with open(os.path.join(DATA_DIR, "紅樓夢-通行版一百二十回.txt"), 'r', encoding='utf-8') as f:
+        source = f.read()
+    with open(os.path.join(work_dir, "source.txt"), 'w', encoding='utf-8') as f:
+        for _ in range(scale):
+            f.write(source)
+            f.write('\n')
+    return chap_dir
+
+
+def _analyze(work_dir):
+    """准备共现结果（不计时）"""
+    from hlm_tokens import TokenStore
+    cooc = load_script('cooc')
+    store = TokenStore.load(os.path.join(work_dir, "tokens.npz"))
+    characters, alias_map = cooc.load_characters(os.path.join(DATA_DIR, "红楼梦_character.txt"))
+    return cooc, store, characters, alias_map
+
+
+def stage_preprocess(work_dir):
+    text = load_script('text')
+    out_dir = os.path.join(work_dir, "preprocess")
+    start = time.perf_counter()
+    text.preprocess_hongloumeng(os.path.join(work_dir, "source.txt"),
+                                os.path.join(out_dir, "full.txt"), os.path.join(out_dir, "chap"))
+    return time.perf_counter() - start, {}
+
+
+def stage_dictionary(work_dir):
+    import jieba
+    start = time.perf_counter()
+    tokenizer = jieba.Tokenizer()
+    tokenizer.initialize()
+    tokenizer.load_userdict(os.path.join(DATA_DIR, "红楼梦_character.txt"))
+    return time.perf_counter() - start, {"entries": len(tokenizer.FREQ)}
+
+
+def stage_segment(work_dir, workers=1):
+    from hlm_tokens import build_token_store, list_chapter_files
+    chapter_files = list_chapter_files(os.path.join(work_dir, "chap"))
+    start = time.perf_counter()
+    store = build_token_store(chapter_files, os.path.join(DATA_DIR, "红楼梦_character.txt"), workers)
+    seconds = time.perf_counter() - start
+    store.save(os.path.join(work_dir, "tokens.npz"))  # 供后续阶段使用
+    return seconds, {"tokens": len(store), "tokens_per_second": round(len(store) / seconds)}
+
+
+def stage_count(work_dir):
+    from hlm_engine import AnalysisEngine, Normalizer, GlobalFrequency, ChapterFrequency
+    cooc, store, characters, alias_map = _analyze(work_dir)
+    start = time.perf_counter()
+    engine = AnalysisEngine(Normalizer(characters, alias_map))
+    freq = engine.register('global', GlobalFrequency())
+    engine.register('chapter', ChapterFrequency())
+    engine.run(store)
+    _, co_occur, _ = cooc.analyze_co_occurrence(store, characters, alias_map, 3)
+    return time.perf_counter() - start, {"characters": len(freq.counts), "pairs": len(co_occur)}
+
+
+def stage_filter(work_dir):
+    from hlm_graph import CoOccurrenceIndex
+    cooc, store, characters, alias_map = _analyze(work_dir)
+    result = cooc.analyze_co_occurrence(store, characters, alias_map, 3)
+    start = time.perf_counter()
+    index = CoOccurrenceIndex(*result)
+    sizes = [len(cooc.filter_data(index, top_n=120)[1])]
+    for char in ["宝玉", "黛玉", "宝钗"]:
+        sizes.append(len(cooc.filter_data(index, main_chars=[char])[1]))
+    return time.perf_counter() - start, {"links": sum(sizes)}
+
+
+def stage_render(work_dir):
+    from hlm_engine import AnalysisEngine, Normalizer, GlobalFrequency, ChapterFrequency
+    from hlm_graph import CoOccurrenceIndex
+    cooc, store, characters, alias_map = _analyze(work_dir)
+    index = CoOccurrenceIndex(*cooc.analyze_co_occurrence(store, characters, alias_map, 3))
+    f_freq, f_co, f_detail = cooc.filter_data(index, top_n=120)
+    freq = load_script('freq')
+    engine = AnalysisEngine(Normalizer(*freq.load_data()))
+    engine.register('global', GlobalFrequency())
+    engine.register('chapter', ChapterFrequency())
+    counts = engine.run(store)
+
+    # freq 脚本按相对路径写 ./output
+    os.makedirs(os.path.join(work_dir, "output"), exist_ok=True)
+    os.chdir(work_dir)
+    try:
+        start = time.perf_counter()
+        cooc.create_graph(f_freq, f_co, f_detail, os.path.join("output", "co_occurrence.html"))
+        freq.generate_character_wordcloud(counts)
+        freq.main_characters_appear(freq.top3_appear_per_chapter(counts))
+        seconds = time.perf_counter() - start
+    finally:
+        os.chdir(SCRIPT_DIR)
+    return seconds, {"nodes": len(f_freq), "links": len(f_co)}
+
+
+def _run_stage(stage, work_dir, options):
+    """子进程入口：运行一个阶段，返回耗时、计数和本进程峰值内存"""
+    os.chdir(SCRIPT_DIR)  # 各脚本按相对路径读取 ./data
+    if SCRIPT_DIR not in sys.path:
+        sys.path.insert(0, SCRIPT_DIR)
+    func = globals()[f"stage_{stage}"]
+    kwargs = {"workers": options.get("workers", 1)} if stage == 'segment' else {}
+    seconds, counters = func(work_dir, **kwargs)
+    return {"seconds": round(seconds, 4), "peak_rss_kb": peak_rss_kb(), **counters}
+
+
+def run_benchmarks(stages=STAGES, scales=(1,), repeat=1, num_chapters=None, workers=1):
+    """逐规模、逐阶段运行基准
+
+    每个阶段在新的子进程（spawn）中运行，峰值内存互不影响；
+    repeat > 1 时取最短耗时。后续阶段需要的分词结果由 segment 阶段写入工作目录，
+    因此选择 count/filter/render 时会自动先运行 segment。
+    """
+    if any(s in stages for s in ('count', 'filter', 'render')) and 'segment' not in stages:
+        stages = ['segment'] + list(stages)
+    stages = [s for s in STAGES if s in stages]
+    ctx = multiprocessing.get_context('spawn')
+    options = {"workers": workers}
+    results = []
+    for scale in scales:
+        work_dir = tempfile.mkdtemp(prefix=f"hlm_bench_{scale}x_")
+        try:
+            make_scaled_corpus(work_dir, scale, num_chapters)
+            for stage in stages:
+                if stage in SCALE_FREE and scale != scales[0]:
+                    continue
+                runs = []
+                for _ in range(repeat):
+                    with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+                        runs.append(pool.submit(_run_stage, stage, work_dir, options).result())
+                best = min(runs, key=lambda r: r["seconds"])
+                best["peak_rss_kb"] = max((r["peak_rss_kb"] or 0) for r in runs) or None
+                results.append({"stage": stage, "scale": scale, **best})
+                print(f"{scale:>4}×  {stage:<10} {best['seconds']:>9.3f}s  "
+                      f"峰值内存 {best['peak_rss_kb'] or '-'} KB")
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def environment():
+    """运行环境信息，写入结果文件以便对比时核对"""
+    import jieba
+    import pyecharts
+    return {
+        "time": time.strftime('%Y-%m-%d %H:%M:%S'),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "jieba": jieba.__version__,
+        "pyecharts": pyecharts.__version__,
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def compare(baseline, current, tolerance=0.2):
+    """对比两份结果，返回耗时或峰值内存超过 (1 + tolerance) 倍的 (阶段, 规模, 指标, 基准值, 当前值)"""
+    base = {(r["stage"], r["scale"]): r for r in baseline["results"]}
+    regressions = []
+    for r in current["results"]:
+        b = base.get((r["stage"], r["scale"]))
+        if b is None:
+            continue
+        for metric in ("seconds", "peak_rss_kb"):
+            if b.get(metric) and r.get(metric) and r[metric] > b[metric] * (1 + tolerance):
+                regressions.append((r["stage"], r["scale"], metric, b[metric], r[metric]))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="红楼梦分析流水线基准测试")
+    parser.add_argument('--stages', default=','.join(STAGES), help=f"阶段列表，可选 {','.join(STAGES)}")
+    parser.add_argument('--scales', default='1', help="语料规模倍数列表，如 1,10,100")
+    parser.add_argument('--chapters', type=int, default=None, help="只取前若干回作为 1× 语料（preprocess 阶段始终使用完整原文）")
+    parser.add_argument('--repeat', type=int, default=1, help="每个阶段重复次数（取最短耗时）")
+    parser.add_argument('--workers', type=int, default=1, help="分词进程数")
+    parser.add_argument('--out', default=None, help="结果 JSON 路径（默认 ./output/bench/bench_时间.json）")
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'), default=None,
+                        help="对比两份结果 JSON，超过容差时以非零状态退出")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="对比容差（0.2 表示慢 20%% 以上算退化）")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0], 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        with open(args.compare[1], 'r', encoding='utf-8') as f:
+            current = json.load(f)
+        regressions = compare(baseline, current, args.tolerance)
+        for stage, scale, metric, before, after in regressions:
+            print(f"退化：{scale}× {stage} {metric} {before} -> {after}（{after / before - 1:+.0%}）")
+        print(f"共 {len(regressions)} 项超过容差 {args.tolerance:.0%}")
+        sys.exit(1 if regressions else 0)
+
+    results = run_benchmarks(
+        [s for s in args.stages.split(',') if s],
+        [int(x) for x in args.scales.split(',')],
+        args.repeat, args.chapters, args.workers
+    )
+    out = args.out or os.path.join(SCRIPT_DIR, "output", "bench",
+                                   f"bench_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, 'w', encoding='utf-8') as f:
+        json.dump({"environment": environment(), "options": vars(args), "results": results},
+                  f, ensure_ascii=False, indent=1)
+    print(f"结果已保存到 {out}")
@@ -0,0 +1,217 @@
+import os
+import json
+import gzip
+import shutil
+import hashlib
+import urllib.request
+
+# 页面加载器（所有页面共用一份，放在资源目录中）
+LOADER_NAME = 'hlm_loader.js'
+# 下载资源的本地缓存（与模块同目录，不随工作目录变化）
+ASSET_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'assets')
+LOADER_JS = r"""// 共享数据包加载器：按需读取 gzip 压缩的 JSON，时间轴翻页时才加载对应帧
+(function() {
+  var MARK = /^--x_x--0_0--([\s\S]*)--x_x--0_0--$/;
+
+  // pyecharts 的 JsCode 在数据包中保留为带标记的字符串，这里还原为函数
+  function revive(obj) {
+    if (typeof obj === 'string') {
+      var m = MARK.exec(obj);
+      return m ? new Function('return (' + m[1] + ');')() : obj;
+    }
+    if (Array.isArray(obj)) { return obj.map(revive); }
+    if (obj && typeof obj === 'object') {
+      for (var k in obj) { obj[k] = revive(obj[k]); }
+    }
+    return obj;
+  }
+
+  var cache = {};
+  function load(url) {
+    if (!cache[url]) {
+      cache[url] = fetch(url).then(function(r) {
+        if (!r.ok) { throw new Error(url + ': ' + r.status); }
+        if (url.slice(-3) !== '.gz') { return r.json(); }
+        var stream = r.body.pipeThrough(new DecompressionStream('gzip'));
+        return new Response(stream).json();
+      }).then(revive);
+    }
+    return cache[url];
+  }
+
+  // manifest: {base: 数据包, frames: [每帧数据包], theme: 主题}
+  window.hlmChart = function(id, manifest) {
+    var chart = echarts.init(document.getElementById(id), manifest.theme || null);
+    var current = 0;
+    function show(i) {
+      current = i;
+      load(manifest.frames[i]).then(function(frame) {
+        if (i === current) { chart.setOption(frame); }
+      });
+      if (i + 1 < manifest.frames.length) { load(manifest.frames[i + 1]); }  // 预取下一帧
+    }
+    load(manifest.base).then(function(base) {
+      chart.setOption(base);
+      if (manifest.frames.length) {
+        chart.on('timelinechanged', function(e) { show(e.currentIndex); });
+        show((base.timeline && base.timeline.currentIndex) || 0);
+      }
+    });
+    window.addEventListener('resize', function() { chart.resize(); });
+    return chart;
+  };
+})();
+"""
+
+# 单个图表的外壳页面，数据全部在共享数据包中
+PAGE_HTML = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="UTF-8">
+<title>__TITLE__</title>
+__SCRIPTS__
+</head>
+<body>
+<!-- 需通过 HTTP 访问（如在输出目录运行 python -m http.server），file:// 下浏览器会拦截 fetch -->
+<div id="chart" style="width:__WIDTH__;height:__HEIGHT__;"></div>
+<script>hlmChart('chart', __MANIFEST__);</script>
+</body>
+</html>
+"""
+
+
+def asset_file(name):
+    """pyecharts 依赖名对应的资源文件（如 echarts -> echarts.min.js，china -> maps/china.js）"""
+    from pyecharts.datasets import FILENAMES
+    if name not in FILENAMES:
+        raise ValueError(f"不支持打包的依赖: {name}")
+    path, ext = FILENAMES[name]
+    return f"{path}.{ext}"
+
+
+def prepare_assets(names, asset_dir, source_dir=None, cache_dir=ASSET_CACHE_DIR, host=None):
+    """把依赖的 ECharts 资源放入 asset_dir，返回各依赖的相对文件名
+
+    查找顺序：asset_dir 已有 -> source_dir（离线资源目录）-> 本地缓存 cache_dir
+    -> 从 host（默认 pyecharts 的 ONLINE_HOST）下载一次并存入缓存。
+    准备好之后页面只引用 asset_dir 中的文件，不再访问网络。
+    """
+    files = []
+    for name in names:
+        fname = asset_file(name)
+        target = os.path.join(asset_dir, fname)
+        files.append(fname)
+        if os.path.exists(target):
+            continue
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        for folder in (source_dir, cache_dir):
+            if folder and os.path.exists(os.path.join(folder, fname)):
+                shutil.copyfile(os.path.join(folder, fname), target)
+                break
+        else:
+            if host is None:
+                from pyecharts.globals import CurrentConfig
+                host = CurrentConfig.ONLINE_HOST
+            cached = os.path.join(cache_dir, fname)
+            os.makedirs(os.path.dirname(cached), exist_ok=True)
+            try:
+                urllib.request.urlretrieve(host + fname, cached + '.tmp')
+            except OSError as e:
+                raise RuntimeError(f"无法获取 {fname}：请用 source_dir 指定离线资源目录（{e}）")
+            os.replace(cached + '.tmp', cached)
+            shutil.copyfile(cached, target)
+    return files
+
+
+def split_frames(frames):
+    """把各帧中取值完全相同的顶层键提出来作为共用部分，返回 (共用部分, 各帧差异部分)"""
+    if not frames:
+        return {}, []
+    shared = {
+        key: value for key, value in frames[0].items()
+        if all(key in f and f[key] == value for f in frames[1:])
+    }
+    return shared, [{k: v for k, v in f.items() if k not in shared} for f in frames]
+
+
+class ChartBundle:
+    """共享资源、去重的 HTML 输出
+
+    每个图表只写一个很小的外壳页面；选项数据按内容哈希写成 gzip 压缩的 JSON 数据包
+    （out_dir/data/），内容相同的数据包在图表之间、多次运行之间只保存一份。
+    Timeline 拆成共用的基础选项和逐帧数据包，翻到某一帧时才加载。
+    ECharts 及地图等资源只在 out_dir/assets/ 中保存一份，不引用 CDN。
+    """
+
+    def __init__(self, out_dir='./output', source_dir=None, cache_dir=ASSET_CACHE_DIR):
+        self.out_dir = out_dir
+        self.asset_dir = os.path.join(out_dir, 'assets')
+        self.data_dir = os.path.join(out_dir, 'data')
+        self.source_dir = source_dir
+        self.cache_dir = cache_dir
+        self.written = 0  # 本次新写入的数据包数
+        self.reused = 0   # 已存在（去重）的数据包数
+        os.makedirs(self.data_dir, exist_ok=True)
+        os.makedirs(self.asset_dir, exist_ok=True)
+        with open(os.path.join(self.asset_dir, LOADER_NAME), 'w', encoding='utf-8') as f:
+            f.write(LOADER_JS)
+
+    def assets(self, names):
+        """准备依赖资源，返回资源文件的路径（相对 out_dir）"""
+        files = prepare_assets(names, self.asset_dir, self.source_dir, self.cache_dir)
+        return [os.path.join('assets', fname).replace(os.sep, '/') for fname in files]
+
+    def payload(self, obj):
+        """写出一个数据包，返回其路径（相对 out_dir）；同内容只写一次"""
+        data = json.dumps(obj, ensure_ascii=False, separators=(',', ':'), sort_keys=True).encode('utf-8')
+        fname = hashlib.sha256(data).hexdigest()[:16] + '.json.gz'
+        path = os.path.join(self.data_dir, fname)
+        if os.path.exists(path):
+            self.reused += 1
+        else:
+            with open(path + '.tmp', 'wb') as f:
+                f.write(gzip.compress(data, mtime=0))
+            os.replace(path + '.tmp', path)
+            self.written += 1
+        return 'data/' + fname
+
+    def add(self, chart, path):
+        """写出 chart 的外壳页面 path（应位于 out_dir 之内），返回 path"""
+        from pyecharts.charts.base import default
+        from pyecharts.globals import ThemeType
+        chart._use_theme()
+        # 经 pyecharts 的序列化处理 Opts 和 JsCode（JsCode 保留标记，由加载器还原）
+        options = json.loads(json.dumps(chart.get_options(), default=default))
+        if 'baseOption' in options:
+            shared, frames = split_frames(options.get('options', []))
+            base = {**options['baseOption'], **shared}
+        else:
+            base, frames = options, []
+
+        # 页面与 out_dir 不在同一层时，用相对路径引用资源和数据包
+        prefix = os.path.relpath(self.out_dir, os.path.dirname(os.path.abspath(path)) or '.')
+        prefix = '' if prefix == '.' else prefix.replace(os.sep, '/') + '/'
+        manifest = {
+            "base": prefix + self.payload(base),
+            "frames": [prefix + self.payload(frame) for frame in frames],
+            "theme": None if chart.theme == ThemeType.WHITE else chart.theme,
+        }
+        scripts = [prefix + src for src in self.assets(chart.js_dependencies.items)]
+        scripts.append(prefix + 'assets/' + LOADER_NAME)
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(PAGE_HTML
+                    .replace('__TITLE__', chart.page_title)
+                    .replace('__SCRIPTS__', '\n'.join(f'<script src="{src}"></script>' for src in scripts))
+                    .replace('__WIDTH__', chart.width)
+                    .replace('__HEIGHT__', chart.height)
+                    .replace('__MANIFEST__', json.dumps(manifest, ensure_ascii=False)))
+        return path
+
+
+def render(chart, path, bundle=None):
+    """渲染图表：指定 bundle 时写成共享数据包的外壳页面，否则按 pyecharts 默认方式生成完整 HTML"""
+    if bundle is not None:
+        return bundle.add(chart, path)
+    return chart.render(path)
@@ -0,0 +1,168 @@
+import os
+import mmap
+import numpy as np
+from hlm_tokens import SPLIT_VERSION, list_chapter_files, split_sentences
+from hlm_manifest import chapter_hashes, content_hash
+from hlm_metrics import timer
+
+# 打包格式版本，修改分句规则或索引结构时递增
+CORPUS_VERSION = 1
+
+
+def sentence_starts(text):
+    """单回文本中各句的起始字符位置（按 split_sentences 分句，与 TokenStore 句序号一致）"""
+    return [start for start, _ in split_sentences(text)]
+
+
+def pack_corpus(chapter_files, path):
+    """把各章节打包为一个 UTF-8 文件，并写出章节/句子偏移索引 path + '.idx.npz'
+
+    索引：
+      chapter_bytes[c]      第 c 回（从0开始）在文件中的字节起点，末尾为文件长度
+      chapter_sentences[c]  第 c 回的第一句在全书中的句序号，末尾为总句数
+      sentence_bytes[s]     第 s 句的字节起点（全书编号），末尾为文件长度
+      sentence_chars[s]     第 s 句在本回文本中的字符起点
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    chapter_bytes, chapter_sentences = [0], [0]
+    sentence_bytes, sentence_chars = [], []
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as out:
+        pos = 0
+        for fname in chapter_files:
+            with open(fname, 'r', encoding='utf-8') as f:
+                text = f.read()
+            byte_pos = pos
+            for start, end in split_sentences(text):
+                sentence_bytes.append(byte_pos)
+                sentence_chars.append(start)
+                byte_pos += len(text[start:end].encode('utf-8'))
+            data = text.encode('utf-8')
+            out.write(data)
+            pos += len(data)
+            chapter_bytes.append(pos)
+            chapter_sentences.append(len(sentence_bytes))
+    sentence_bytes.append(pos)
+
+    np.savez(
+        path + '.idx.tmp.npz',
+        chapter_bytes=np.array(chapter_bytes, dtype=np.int64),
+        chapter_sentences=np.array(chapter_sentences, dtype=np.int64),
+        sentence_bytes=np.array(sentence_bytes, dtype=np.int64),
+        sentence_chars=np.array(sentence_chars, dtype=np.int64),
+    )
+    os.replace(path + '.idx.tmp.npz', path + '.idx.npz')
+    os.replace(tmp_path, path)
+
+
+class ChapterView:
+    """某一回的惰性视图：只在访问 text 或句子时才解码"""
+
+    def __init__(self, corpus, chap):
+        self.corpus = corpus
+        self.chap = chap  # 从1开始
+
+    @property
+    def text(self):
+        c = self.corpus
+        return c.decode(c.chapter_bytes[self.chap - 1], c.chapter_bytes[self.chap])
+
+    @property
+    def sentence_range(self):
+        """本回的句序号范围 [first, end)"""
+        c = self.corpus
+        return int(c.chapter_sentences[self.chap - 1]), int(c.chapter_sentences[self.chap])
+
+    def sentence_starts(self):
+        """本回各句在本回文本中的字符起点"""
+        first, end = self.sentence_range
+        return self.corpus.sentence_chars[first:end]
+
+    def sentences(self):
+        """逐句产出本回的句子文本"""
+        for s in range(*self.sentence_range):
+            yield self.corpus.sentence(s)
+
+    def __len__(self):
+        """本回的字节数"""
+        c = self.corpus
+        return int(c.chapter_bytes[self.chap] - c.chapter_bytes[self.chap - 1])
+
+
+class Corpus:
+    """内存映射的打包语料：章节、句子按偏移索引切片，访问时才解码"""
+
+    def __init__(self, path):
+        self.path = path
+        with np.load(path + '.idx.npz') as idx:
+            self.chapter_bytes = idx['chapter_bytes']
+            self.chapter_sentences = idx['chapter_sentences']
+            self.sentence_bytes = idx['sentence_bytes']
+            self.sentence_chars = idx['sentence_chars']
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        # 空文件不能映射
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        self._view = memoryview(self._mm) if size else memoryview(b'')
+
+    def close(self):
+        self._view.release()
+        if self._mm is not None:
+            self._mm.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def num_chapters(self):
+        return len(self.chapter_bytes) - 1
+
+    @property
+    def num_sentences(self):
+        return len(self.sentence_bytes) - 1
+
+    def raw(self, start, end):
+        """字节区间的零拷贝视图（memoryview）"""
+        return self._view[int(start):int(end)]
+
+    def decode(self, start, end):
+        return str(self.raw(start, end), 'utf-8')
+
+    def chapter(self, chap):
+        """第 chap 回（从1开始）的惰性视图"""
+        if not 1 <= chap <= self.num_chapters:
+            raise IndexError(chap)
+        return ChapterView(self, chap)
+
+    def chapters(self):
+        for chap in range(1, self.num_chapters + 1):
+            yield ChapterView(self, chap)
+
+    def sentence(self, s):
+        """全书第 s 句的文本"""
+        return self.decode(self.sentence_bytes[s], self.sentence_bytes[s + 1])
+
+    def texts(self):
+        """按章回顺序逐回解码文本"""
+        for view in self.chapters():
+            yield view.text
+
+
+def load_corpus(chapter_dir, cache_dir='./cache'):
+    """打开章节目录对应的打包语料"""
+    return open_corpus(list_chapter_files(chapter_dir), cache_dir)
+
+
+def open_corpus(chapter_files, cache_dir='./cache'):
+    """打开打包语料；章节内容变化（按清单中的哈希判断）时重新打包"""
+    key = content_hash(f"v{CORPUS_VERSION}|split-v{SPLIT_VERSION}|" +
+                       '|'.join(chapter_hashes(chapter_files)))
+    path = os.path.join(cache_dir, f"corpus_{key[:16]}.bin")
+    with timer('load.corpus'):
+        if not (os.path.exists(path) and os.path.exists(path + '.idx.npz')):
+            pack_corpus(chapter_files, path)
+        return Corpus(path)
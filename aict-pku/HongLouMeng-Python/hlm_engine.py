@@ -0,0 +1,375 @@
+from collections import defaultdict, deque
+from hlm_metrics import timer, count
+
+# 人物别名 -> 人物表中的统一名称（freq、cooc 共用同一张表）
+ALIASES = {
+    '贾宝玉': '宝玉',
+    '林黛玉': '黛玉',
+    '薛宝钗': '宝钗',
+}
+
+
+def load_characters(character_path):
+    """加载人物表，返回 (人物集合, 别名映射)；只保留统一名称在人物表中的别名"""
+    characters = set()
+    with open(character_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                characters.add(line.split()[0])
+    alias_map = {alias: name for alias, name in ALIASES.items() if name in characters}
+    return characters, alias_map
+
+
+class Normalizer:
+    """统一的人物名归一化：只保留 nr 词性，别名映射后须在人物表中"""
+
+    def __init__(self, characters, alias_map=None):
+        self.characters = set(characters)
+        self.alias_map = dict(alias_map or {})
+
+    def __call__(self, word, flag):
+        if flag != 'nr':
+            return None
+        name = self.alias_map.get(word, word)
+        return name if name in self.characters else None
+
+
+class Accumulator:
+    """累加器基类，按需覆盖以下回调"""
+
+    def on_token(self, chap, sent, word, flag):
+        """每个词都会调用（覆盖后引擎会遍历全部词）"""
+
+    def on_character(self, chap, sent, name):
+        """每次人物出现时调用，name 为归一化后的人物名"""
+
+    def finish(self):
+        """遍历结束时调用"""
+
+    def result(self):
+        """返回统计结果（基类没有结果）"""
+        return None
+
+
+class GlobalFrequency(Accumulator):
+    """全书人物出现频次"""
+
+    def __init__(self):
+        self.counts = defaultdict(int)
+
+    def on_character(self, chap, sent, name):
+        self.counts[name] += 1
+
+    def result(self):
+        return self.counts
+
+
+class ChapterFrequency(Accumulator):
+    """每回人物出现频次"""
+
+    def __init__(self):
+        self.counts = defaultdict(lambda: defaultdict(int))
+
+    def on_character(self, chap, sent, name):
+        self.counts[chap][name] += 1
+
+    def result(self):
+        return self.counts
+
+
+class WindowCoOccurrence(Accumulator):
+    """按句窗口统计人物共现（每 window_size 句为一个窗口）"""
+
+    def __init__(self, window_size=3):
+        self.window_size = window_size
+        self.freq = defaultdict(int)
+        self.co_occur = defaultdict(int)
+        self.co_occur_detail = defaultdict(dict)
+        self._window = None
+        self._chars = set()
+        self.windows = 0  # 有人物的窗口数
+
+    def on_character(self, chap, sent, name):
+        window = sent // self.window_size
+        if window != self._window:
+            self._flush()
+            self._window = window
+        self._chars.add(name)
+
+    def _flush(self):
+        # 更新统计
+        if self._chars:
+            self.windows += 1
+        for char in self._chars:
+            self.freq[char] += 1
+
+        # 更新共现
+        chars_list = list(self._chars)
+        for j in range(len(chars_list)):
+            for k in range(j + 1, len(chars_list)):
+                char1, char2 = sorted((chars_list[j], chars_list[k]))
+                self.co_occur[(char1, char2)] += 1
+                self.co_occur_detail[char1][char2] = self.co_occur_detail[char1].get(char2, 0) + 1
+                self.co_occur_detail[char2][char1] = self.co_occur_detail[char2].get(char1, 0) + 1
+        self._chars = set()
+
+    def finish(self):
+        self._flush()
+        count('windows', self.windows)
+        count('pairs', len(self.co_occur))
+
+    def result(self):
+        return self.freq, self.co_occur, self.co_occur_detail
+
+
+def window_range(sent, window_size, stride):
+    """第 sent 句所在的窗口编号范围 [lo, hi]，窗口 k 覆盖 [k*stride, k*stride+window_size) 句"""
+    lo = max(0, -(-(sent - window_size + 1) // stride))
+    return lo, sent // stride
+
+
+class SlidingCoOccurrence(Accumulator):
+    """滑动窗口共现（窗口 window_size 句，步长 stride 句）
+
+    窗口移动时只加入新进入句子的人物、撤出离开句子的人物；
+    人物对在连续多少个窗口中同时出现，就在离开时一次性累加多少次。
+    stride == window_size 时与 WindowCoOccurrence 结果相同。
+    """
+
+    def __init__(self, window_size=3, stride=1):
+        self.window_size = window_size
+        self.stride = stride
+        self.freq = defaultdict(int)
+        self.co_occur = defaultdict(int)
+        self.co_occur_detail = defaultdict(dict)
+        self._sent = None
+        self._chars = set()
+        self._present = {}  # 窗口内人物 -> 所在句数
+        self._leaves = deque()  # (离开时的窗口号, 人物集合)
+        self._char_start = {}
+        self._pair_start = {}
+
+    def on_character(self, chap, sent, name):
+        if sent != self._sent:
+            self._push_sentence()
+            self._sent = sent
+        self._chars.add(name)
+
+    def _push_sentence(self):
+        if not self._chars:
+            return
+        lo, hi = window_range(self._sent, self.window_size, self.stride)
+        if lo <= hi:
+            self._advance(lo)
+            for char in self._chars:
+                self._enter(char, lo)
+            self._leaves.append((hi + 1, self._chars))
+        self._chars = set()
+
+    def _advance(self, t):
+        """撤出在窗口 t 之前离开的句子"""
+        while self._leaves and self._leaves[0][0] <= t:
+            leave_at, chars = self._leaves.popleft()
+            for char in chars:
+                self._leave(char, leave_at)
+
+    def _enter(self, char, t):
+        self._present[char] = self._present.get(char, 0) + 1
+        if self._present[char] == 1:
+            self._char_start[char] = t
+            for other in self._present:
+                if other != char:
+                    self._pair_start[tuple(sorted((char, other)))] = t
+
+    def _leave(self, char, t):
+        self._present[char] -= 1
+        if self._present[char]:
+            return
+        del self._present[char]
+        self.freq[char] += t - self._char_start.pop(char)
+        for other in self._present:
+            char1, char2 = pair = tuple(sorted((char, other)))
+            n = t - self._pair_start.pop(pair)
+            self.co_occur[pair] += n
+            self.co_occur_detail[char1][char2] = self.co_occur_detail[char1].get(char2, 0) + n
+            self.co_occur_detail[char2][char1] = self.co_occur_detail[char2].get(char1, 0) + n
+
+    def finish(self):
+        self._push_sentence()
+        self._advance(float('inf'))
+        count('pairs', len(self.co_occur))
+
+    def result(self):
+        return self.freq, self.co_occur, self.co_occur_detail
+
+
+class DecayCoOccurrence(Accumulator):
+    """距离加权共现：两处提及相隔 d 句（d < window_size）时权重为 decay ** d
+
+    freq 为人物出现的句数；句子进入时与窗口内已有句子配对，滑出窗口的句子随即撤出。
+    """
+
+    def __init__(self, window_size=3, decay=0.5):
+        self.window_size = window_size
+        self.decay = decay
+        self.freq = defaultdict(int)
+        self.co_occur = defaultdict(float)
+        self.co_occur_detail = defaultdict(dict)
+        self._sent = None
+        self._chars = set()
+        self._recent = deque()  # (句序号, 人物集合)
+
+    def on_character(self, chap, sent, name):
+        if sent != self._sent:
+            self._push_sentence()
+            self._sent = sent
+        self._chars.add(name)
+
+    def _add(self, a, b, weight):
+        char1, char2 = sorted((a, b))
+        self.co_occur[(char1, char2)] += weight
+        self.co_occur_detail[char1][char2] = self.co_occur_detail[char1].get(char2, 0) + weight
+        self.co_occur_detail[char2][char1] = self.co_occur_detail[char2].get(char1, 0) + weight
+
+    def _push_sentence(self):
+        if not self._chars:
+            return
+        sent, chars = self._sent, self._chars
+        while self._recent and self._recent[0][0] <= sent - self.window_size:
+            self._recent.popleft()
+
+        for char in chars:
+            self.freq[char] += 1
+        chars_list = list(chars)
+        for j in range(len(chars_list)):
+            for k in range(j + 1, len(chars_list)):
+                self._add(chars_list[j], chars_list[k], 1)
+        for prev_sent, prev_chars in self._recent:
+            weight = self.decay ** (sent - prev_sent)
+            for a in chars:
+                for b in prev_chars:
+                    if a != b:
+                        self._add(a, b, weight)
+
+        self._recent.append((sent, chars))
+        self._chars = set()
+
+    def finish(self):
+        self._push_sentence()
+        count('pairs', len(self.co_occur))
+
+    def result(self):
+        return self.freq, self.co_occur, self.co_occur_detail
+
+
+class AnalysisEngine:
+    """单遍分析引擎：遍历一次词流，把每个词分发给所有已注册的累加器"""
+
+    def __init__(self, normalizer):
+        self.normalizer = normalizer
+        self.accumulators = {}
+
+    def register(self, name, accumulator):
+        self.accumulators[name] = accumulator
+        return accumulator
+
+    def run(self, store, chapters=None):
+        """遍历 TokenStore（可只取某几回），返回 {累加器名: 结果}"""
+        accs = list(self.accumulators.values())
+        token_accs = [acc for acc in accs if type(acc).on_token is not Accumulator.on_token]
+        # 没有累加器需要全部词时，只遍历 nr 词
+        records = store.iter_records(None if token_accs else 'nr', chapters)
+
+        normalize = self.normalizer
+        n_records = n_mentions = 0
+        with timer('engine.run'):
+            for chap, sent, word, flag in records:
+                n_records += 1
+                for acc in token_accs:
+                    acc.on_token(chap, sent, word, flag)
+                name = normalize(word, flag)
+                if name is not None:
+                    n_mentions += 1
+                    for acc in accs:
+                        acc.on_character(chap, sent, name)
+
+            for acc in accs:
+                acc.finish()
+        count('records', n_records)
+        count('mentions', n_mentions)
+        return {name: acc.result() for name, acc in self.accumulators.items()}
+
+
+class ChapterMentions(Accumulator):
+    """按章回收集人物提及：{章回: ([句序号], [人物名])}"""
+
+    def __init__(self):
+        self.mentions = defaultdict(lambda: ([], []))
+
+    def on_character(self, chap, sent, name):
+        sents, names = self.mentions[chap]
+        sents.append(sent)
+        names.append(name)
+
+    def result(self):
+        return self.mentions
+
+
+class MentionList:
+    """已归一化的人物提及序列，接口与 TokenStore.iter_records 一致（词性均记为 nr）"""
+
+    def __init__(self, chapter, sentence, names):
+        self.chapter = chapter
+        self.sentence = sentence
+        self.names = names
+
+    def __len__(self):
+        return len(self.names)
+
+    def iter_records(self, flag=None, chapters=None):
+        if flag not in (None, 'nr'):
+            return
+        chapters = None if chapters is None else set(chapters)
+        for c, s, w in zip(self.chapter, self.sentence, self.names):
+            if chapters is None or c in chapters:
+                yield c, s, w, 'nr'
+
+
+def collect_mentions(source, normalizer, hashes, stats):
+    """增量收集全书人物提及，返回 (MentionList, 重新统计的章回号)
+
+    stats 为 ChapterStats，按章节内容哈希保存每回的提及（句序号为回内相对值）；
+    只对内容变化的章节遍历 source，其余直接取缓存，再按各回句数重新编号合并。
+    source 可以是无参函数，只在确有章节需要重新统计时才调用它加载数据。
+    """
+    stale = stats.stale(hashes)
+    count('chapters_recounted', len(stale))
+    if stale:
+        if callable(source):
+            source = source()
+        engine = AnalysisEngine(normalizer)
+        engine.register('mentions', ChapterMentions())
+        mentions = engine.run(source, stale)['mentions']
+        for chap in stale:
+            first, end = source.sentence_range(chap)
+            sents, names = mentions.get(chap, ([], []))
+            stats.put(chap, hashes[chap - 1], {
+                "sentences": end - first,
+                "sent": [s - first for s in sents],
+                "names": names,
+            })
+    removed = stats.removed(len(hashes))
+    for chap in removed:
+        stats.drop(chap)
+    if stale or removed:
+        stats.save()
+
+    chapter, sentence, names = [], [], []
+    first = 0
+    for chap in range(1, len(hashes) + 1):
+        data = stats.get(chap)
+        chapter.extend([chap] * len(data["names"]))
+        sentence.extend(first + s for s in data["sent"])
+        names.extend(data["names"])
+        first += data["sentences"]
+    return MentionList(chapter, sentence, names), stale
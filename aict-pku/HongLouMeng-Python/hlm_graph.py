@@ -0,0 +1,242 @@
+import os
+import json
+import math
+import heapq
+
+# 关系图 tooltip（create_graph 与自我中心网络查看页共用）
+TOOLTIP_JS = """
+        function(params) {
+            if (params.dataType === 'node') {
+                var relations = params.data.relations || [];
+                var result = [
+                    '<div style="font-size:14px;font-weight:bold">' + params.name + '</div>',
+                    '<div style="font-size:12px;color:#666">出现频次: ' + params.data.value + '</div>'
+                ];
+                if (relations.length > 0) {
+                    result.push('<div style="margin:5px 0 3px 0;color:#666">主要共现:</div>');
+                    relations.forEach(function(item) {
+                        result.push('<div style="font-size:12px">• ' + item[0] + ': ' + item[1] + '次</div>');
+                    });
+                }
+                return result.join('');
+            } else if (params.dataType === 'edge') {
+                return [
+                    '<div style="font-size:14px;font-weight:bold">' + params.data.source + ' ↔ ' + params.data.target + '</div>',
+                    '<div style="font-size:12px">共现次数: ' + params.data.value + '次</div>'
+                ].join('');
+            }
+            return '';
+        }
+    """
+
+# 自我中心网络查看页：按需加载每个人物的 JSON
+EGO_VIEWER_HTML = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="UTF-8">
+<title>红楼梦人物自我中心网络</title>
+<script src="__JS_HOST__echarts.min.js"></script>
+<style>
+  body { margin: 0; font-family: sans-serif; }
+  #bar { padding: 8px; border-bottom: 1px solid #ddd; }
+  #chart { width: 100%; height: calc(100vh - 50px); }
+</style>
+</head>
+<body>
+<div id="bar">
+  人物：<input id="search" list="names" placeholder="输入人物名">
+  <datalist id="names"></datalist>
+  <span id="info" style="color:#666;margin-left:12px"></span>
+</div>
+<div id="chart"></div>
+<script>
+  // 需通过 HTTP 访问（如在本目录运行 python -m http.server），file:// 下浏览器会拦截 fetch
+  var chart = echarts.init(document.getElementById('chart'));
+  var files = {};
+  var tooltip = __TOOLTIP__;
+
+  function show(name) {
+    if (!files[name]) { return; }
+    fetch(files[name]).then(function(r) { return r.json(); }).then(function(data) {
+      document.getElementById('info').textContent =
+        data.nodes.length + ' 个人物，' + data.links.length + ' 条共现关系';
+      chart.setOption({
+        title: { text: '《红楼梦》' + name + '共现关系图', left: 'center' },
+        tooltip: { trigger: 'item', formatter: tooltip,
+                   backgroundColor: 'rgba(255,255,255,0.95)', borderWidth: 1 },
+        series: [{
+          type: 'graph', layout: 'force', roam: true, draggable: true,
+          force: { repulsion: 200, edgeLength: 150, gravity: 0.03 },
+          label: { position: 'right', fontSize: 10, color: '#333' },
+          lineStyle: { width: 0.5, curveness: 0.1 },
+          data: data.nodes, links: data.links
+        }]
+      }, true);
+    });
+  }
+
+  fetch('index.json').then(function(r) { return r.json(); }).then(function(index) {
+    var list = document.getElementById('names');
+    index.forEach(function(item) {
+      files[item.name] = item.file;
+      var opt = document.createElement('option');
+      opt.value = item.name;
+      list.appendChild(opt);
+    });
+    document.getElementById('search').addEventListener('change', function(e) { show(e.target.value); });
+    if (index.length) { show(index[0].name); }
+  });
+</script>
+</body>
+</html>
+"""
+
+
+def get_color(name):
+    """获取节点颜色"""
+    color_map = {
+        "宝玉": "#c23531",
+        "黛玉": "#2f4554",
+        "宝钗": "#61a0a8",
+    }
+    return color_map.get(name, "#d48265")
+
+
+def build_graph_data(freq, co_occur, co_occur_detail):
+    """生成关系图的节点和边数据"""
+    # 节点数据（修复频次显示问题）
+    max_freq = max(freq.values()) if freq else 1
+    nodes = []
+    for name, count in freq.items():
+        relations = sorted(
+            [(k, v) for k, v in co_occur_detail.get(name, {}).items() if k != name],
+            key=lambda x: -x[1]
+        )[:5]
+
+        nodes.append({
+            "name": name,
+            "value": count,  # 确保传递频次数据
+            "symbolSize": 8 + 25 * (math.log(count + 1) / math.log(max_freq + 1)),
+            "itemStyle": {"color": get_color(name)},
+            "label": {"show": True, "fontSize": 10},
+            "relations": relations
+        })
+
+    # 边数据
+    max_co = max(co_occur.values()) if co_occur else 1
+    links = [{
+        "source": pair[0],
+        "target": pair[1],
+        "value": count,
+        "lineStyle": {
+            "width": 0.3 + 2 * (count / max_co),
+            "opacity": 0.7,
+            "curveness": 0.1
+        }
+    } for pair, count in co_occur.items()]
+
+    return nodes, links
+
+
+class CoOccurrenceIndex:
+    """共现结果的邻接索引：人物 -> 按共现次数降序排列的邻居
+
+    构建一次后，top_n 用堆做部分选择，主角图只访问主角的邻域，
+    不必像 filter_data 那样每次扫描全部人物对。
+    """
+
+    def __init__(self, freq, co_occur, co_occur_detail):
+        self.freq = freq
+        self.co_occur = co_occur
+        self.co_occur_detail = co_occur_detail
+        # 次数相同时按人物名排序，与矩阵后端（人物按名字编号）一致
+        self.neighbors = {
+            char: sorted(detail.items(), key=lambda x: (-x[1], x[0]))
+            for char, detail in co_occur_detail.items()
+        }
+        self._top_cache = {}
+
+    def top_chars(self, top_n):
+        """频次前 top_n 的人物（并列时取人物名在前者，与 filter_data、矩阵后端一致）"""
+        if top_n not in self._top_cache:
+            self._top_cache[top_n] = [
+                char for char, _ in heapq.nsmallest(top_n, self.freq.items(), key=lambda x: (-x[1], x[0]))
+            ]
+        return self._top_cache[top_n]
+
+    def _detail_within(self, chars, keep):
+        return {
+            char: {k: v for k, v in self.neighbors[char] if k in keep}
+            for char in chars if char in self.neighbors
+        }
+
+    def filter(self, top_n=120, main_chars=None):
+        """与 filter_data 结果相同的 (freq, co_occur, co_occur_detail)"""
+        top_chars = set(self.top_chars(top_n))
+
+        if main_chars:
+            main_chars = set(main_chars)
+            top_chars.update(main_chars)
+            for char in main_chars:
+                top_chars.update(k for k, _ in self.neighbors.get(char, ()))
+            # 只需主角的邻边
+            filtered_co = {}
+            for char in main_chars:
+                for other, count in self.neighbors.get(char, ()):
+                    if other in top_chars:
+                        filtered_co[tuple(sorted((char, other)))] = count
+        else:
+            filtered_co = {}
+            for char in top_chars:
+                for other, count in self.neighbors.get(char, ()):
+                    if char < other and other in top_chars:
+                        filtered_co[(char, other)] = count
+
+        filtered_freq = {k: v for k, v in self.freq.items() if k in top_chars}
+        return filtered_freq, filtered_co, self._detail_within(top_chars, top_chars)
+
+    def ego_graph(self, char, max_neighbors=None):
+        """某人物的自我中心网络：本人及其（前 max_neighbors 个）邻居，只保留与本人相连的边"""
+        neighbors = self.neighbors.get(char, [])
+        if max_neighbors is not None:
+            neighbors = neighbors[:max_neighbors]
+        nodes = [char] + [k for k, _ in neighbors]
+        keep = set(nodes)
+
+        ego_freq = {k: self.freq[k] for k in nodes if k in self.freq}
+        ego_co = {tuple(sorted((char, other))): count for other, count in neighbors}
+        return ego_freq, ego_co, self._detail_within(nodes, keep)
+
+
+def _write_ego(char, ego, path):
+    """生成单个人物的图数据并写入 JSON，返回 (节点数, 边数)"""
+    nodes, links = build_graph_data(*ego)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"name": char, "nodes": nodes, "links": links}, f,
+                  ensure_ascii=False, separators=(',', ':'))
+    return len(nodes), len(links)
+
+
+def write_ego_graphs(index, characters, out_dir, max_neighbors=None,
+                     js_host="https://cdn.jsdelivr.net/npm/echarts@5.4.3/dist/"):
+    """批量输出每个人物的自我中心网络 JSON，以及一个共用的查看页 index.html
+
+    每个人物只需从共现索引取出邻域并写一个小文件，串行即可（进程池的开销反而更大）。
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    chars = [char for char in sorted(characters) if char in index.freq]
+    tasks = [
+        (char, index.ego_graph(char, max_neighbors), os.path.join(out_dir, f"{i:03d}.json"))
+        for i, char in enumerate(chars)
+    ]
+    sizes = [_write_ego(*task) for task in tasks]
+
+    entries = [
+        {"name": char, "file": os.path.basename(path), "nodes": n_nodes, "links": n_links}
+        for (char, _, path), (n_nodes, n_links) in zip(tasks, sizes)
+    ]
+    with open(os.path.join(out_dir, 'index.json'), 'w', encoding='utf-8') as f:
+        json.dump(entries, f, ensure_ascii=False)
+    with open(os.path.join(out_dir, 'index.html'), 'w', encoding='utf-8') as f:
+        f.write(EGO_VIEWER_HTML.replace('__JS_HOST__', js_host).replace('__TOOLTIP__', TOOLTIP_JS.strip()))
+    return entries
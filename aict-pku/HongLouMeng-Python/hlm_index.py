@@ -0,0 +1,298 @@
+import os
+import csv
+import argparse
+import numpy as np
+from hlm_metrics import timer, count
+
+# 索引格式版本，修改编码方式时递增（旧缓存自动失效）
+INDEX_VERSION = 1
+
+
+def _compact(values):
+    """转为能容纳最大值的最小无符号整数类型"""
+    values = np.asarray(values, dtype=np.int64)
+    return values.astype(np.min_scalar_type(int(values.max(initial=0))))
+
+
+def delta_encode(values, starts):
+    """分段差分编码：每段第一个值保存原值，其余保存与前一个值的差（各段内须非递减）
+
+    starts 为布尔数组，标记每段的第一个位置。
+    """
+    values = np.asarray(values, dtype=np.int64)
+    deltas = np.diff(values, prepend=0)
+    deltas[starts] = values[starts]
+    return _compact(deltas)
+
+
+def delta_decode(deltas, starts):
+    """delta_encode 的逆运算：段内累加，段首处重新开始"""
+    total = np.cumsum(deltas, dtype=np.int64)
+    # 各段起点之前的累加值（非递减），向后传播后减去
+    base = np.maximum.accumulate(np.where(starts, total - deltas, 0))
+    return total - base
+
+
+class Postings:
+    """某人物的出现位置（已解码）：章回、全书句序号、回内字符偏移、原文字数"""
+
+    def __init__(self, name, chapter, sentence, offset, length):
+        self.name = name
+        self.chapter = chapter
+        self.sentence = sentence
+        self.offset = offset
+        self.length = length
+
+    def __len__(self):
+        return len(self.sentence)
+
+    def select(self, key):
+        """按布尔掩码或下标取子集"""
+        return Postings(self.name, self.chapter[key], self.sentence[key], self.offset[key], self.length[key])
+
+
+class PositionIndex:
+    """人物位置倒排索引
+
+    每个人物（别名归并到人物表中的名字）的出现按 (句序号, 偏移) 排序后连续存放，
+    indptr[i]:indptr[i+1] 为第 i 个人物的区间：
+      sent_deltas    全书句序号的差分（每个人物的第一项为原值）
+      offset_deltas  回内字符偏移的差分（每个人物在每回的第一项为原值）
+      lengths        原文中人名的字数（别名与人物名长度可能不同）
+    差分后的数组按最大值选用最小的整数类型。章回号不保存，由句序号和
+    chapter_sentences（每回第一句的句序号，末尾为总句数）推出。
+    """
+
+    def __init__(self, names, indptr, sent_deltas, offset_deltas, lengths, chapter_sentences):
+        self.names = list(names)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.indptr = indptr
+        self.sent_deltas = sent_deltas
+        self.offset_deltas = offset_deltas
+        self.lengths = lengths
+        self.chapter_sentences = chapter_sentences
+
+    @classmethod
+    def from_source(cls, source, normalizer):
+        """由 TokenStore（分词标注结果）或 MatchSource（词典匹配结果）构建
+
+        词表中的每个词只归一化一次，再按编号映射到全部词元，不逐词循环。
+        """
+        chapter, sentence, offset = (np.asarray(col, dtype=np.int64)
+                                     for col in (source.chapter, source.sentence, source.offset))
+        if hasattr(source, 'word_ids'):
+            vocab, word_ids = source.words, source.word_ids
+            if 'nr' in source.flags:
+                mask = source.flag_ids == source.flags.index('nr')
+            else:
+                mask = np.zeros(len(word_ids), dtype=bool)
+        else:
+            vocab, word_ids = np.unique(np.array(source.words, dtype=object), return_inverse=True)
+            vocab = vocab.tolist()
+            mask = np.ones(len(word_ids), dtype=bool)
+
+        canonical = [normalizer(word, 'nr') for word in vocab]
+        names = sorted({name for name in canonical if name is not None})
+        index = {name: i for i, name in enumerate(names)}
+        word_name = np.array([-1 if name is None else index[name] for name in canonical] or [-1], dtype=np.int64)
+        word_len = np.array([len(word) for word in vocab] or [0], dtype=np.int64)
+
+        name_ids = word_name[word_ids]
+        keep = mask & (name_ids >= 0)
+        name_ids, chapter, sentence, offset = name_ids[keep], chapter[keep], sentence[keep], offset[keep]
+        lengths = word_len[word_ids[keep]]
+        order = np.lexsort((offset, sentence, name_ids))
+        name_ids, chapter, sentence, offset, lengths = (
+            col[order] for col in (name_ids, chapter, sentence, offset, lengths))
+
+        new_name = np.ones(len(name_ids), dtype=bool)
+        new_name[1:] = name_ids[1:] != name_ids[:-1]
+        new_chapter = new_name.copy()
+        new_chapter[1:] |= chapter[1:] != chapter[:-1]
+
+        num_chapters = int(np.max(source.chapter, initial=0))
+        bounds = [source.sentence_range(chap) for chap in range(1, num_chapters + 1)]
+        chapter_sentences = np.array([first for first, _ in bounds] + [bounds[-1][1] if bounds else 0],
+                                     dtype=np.int64)
+        count('postings', len(name_ids))
+        return cls(
+            names,
+            np.searchsorted(name_ids, np.arange(len(names) + 1)).astype(np.int64),
+            delta_encode(sentence, new_name),
+            delta_encode(offset, new_chapter),
+            _compact(lengths),
+            chapter_sentences,
+        )
+
+    def save(self, path):
+        """写入 .npz 文件（人物名以空字符分隔的UTF-8字节保存）"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = path + '.tmp.npz'
+        np.savez(
+            tmp_path,
+            names=np.frombuffer('\0'.join(self.names).encode('utf-8'), dtype=np.uint8),
+            indptr=self.indptr,
+            sent_deltas=self.sent_deltas,
+            offset_deltas=self.offset_deltas,
+            lengths=self.lengths,
+            chapter_sentences=self.chapter_sentences,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """从 .npz 文件读取"""
+        with np.load(path) as data:
+            names = data['names'].tobytes().decode('utf-8')
+            return cls(
+                names.split('\0') if names else [],
+                data['indptr'], data['sent_deltas'], data['offset_deltas'],
+                data['lengths'], data['chapter_sentences'],
+            )
+
+    @property
+    def num_chapters(self):
+        return len(self.chapter_sentences) - 1
+
+    @property
+    def nbytes(self):
+        """编码后各数组占用的字节数"""
+        return sum(a.nbytes for a in (self.indptr, self.sent_deltas, self.offset_deltas,
+                                      self.lengths, self.chapter_sentences))
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def count(self, name):
+        """人物的出现次数（不解码）"""
+        i = self.index.get(name)
+        return 0 if i is None else int(self.indptr[i + 1] - self.indptr[i])
+
+    def postings(self, name, start=1, end=None):
+        """解码人物在第 start～end 回的出现位置"""
+        i = self.index.get(name)
+        lo, hi = (0, 0) if i is None else (int(self.indptr[i]), int(self.indptr[i + 1]))
+        sentence = np.cumsum(self.sent_deltas[lo:hi], dtype=np.int64)
+        chapter = np.searchsorted(self.chapter_sentences, sentence, side='right')
+        new_chapter = np.ones(len(chapter), dtype=bool)
+        new_chapter[1:] = chapter[1:] != chapter[:-1]
+        offset = delta_decode(self.offset_deltas[lo:hi], new_chapter)
+        postings = Postings(name, chapter, sentence, offset, self.lengths[lo:hi].astype(np.int64))
+
+        start = min(max(start, 1), self.num_chapters + 1)
+        end = self.num_chapters if end is None else min(max(end, start - 1), self.num_chapters)
+        first, last = np.searchsorted(sentence, [self.chapter_sentences[start - 1], self.chapter_sentences[end]])
+        return postings.select(slice(first, last))
+
+    def near(self, a, b, within=1, start=1, end=None):
+        """a 在同一回内与 b 相距不超过 within 句的出现位置
+
+        返回 (a 的 Postings 子集, 与最近一处 b 相隔的句数，b 在后为正)。
+        每处 a 在 b 的句序号中二分查找插入点，只比较两侧相邻的 b，不跨回。
+        """
+        pa, pb = self.postings(a, start, end), self.postings(b, start, end)
+        if not len(pb):
+            return pa.select(np.zeros(len(pa), dtype=bool)), np.zeros(0, dtype=np.int64)
+        sa, sb = pa.sentence, pb.sentence
+        chap_first = self.chapter_sentences[pa.chapter - 1]
+        chap_last = self.chapter_sentences[pa.chapter] - 1
+        # 同句的 b 正好在插入点上；两侧的 b 不在 a 所在章回时不算
+        idx = np.searchsorted(sb, sa)
+        prev = sb[np.maximum(idx - 1, 0)]
+        nxt = sb[np.minimum(idx, len(sb) - 1)]
+        before = np.where((idx > 0) & (prev >= chap_first), sa - prev, within + 1)
+        after = np.where((idx < len(sb)) & (nxt <= chap_last), nxt - sa, within + 1)
+        hit = np.minimum(before, after) <= within
+        distance = np.where(before <= after, -before, after)  # 距离相同时取在前的 b
+        return pa.select(hit), distance[hit]
+
+
+def kwic(corpus, postings, width=20, limit=None):
+    """逐条产出关键词上下文 (章回, 句序号, 左侧文本, 关键词, 右侧文本)
+
+    只按 corpus 的句子偏移索引解码覆盖 [偏移 - width, 偏移 + 字数 + width] 的几句，
+    不读取整回文本；上下文不跨回。width 小于 0 时按 0 处理，limit 不能为负数。
+    """
+    if limit is not None and limit < 0:
+        raise ValueError(f"limit 不能为负数: {limit}")
+    width = max(width, 0)
+    n = len(postings) if limit is None else min(limit, len(postings))
+    for chap, sent, offset, length in zip(postings.chapter[:n].tolist(), postings.sentence[:n].tolist(),
+                                          postings.offset[:n].tolist(), postings.length[:n].tolist()):
+        first, last = int(corpus.chapter_sentences[chap - 1]), int(corpus.chapter_sentences[chap])
+        starts = corpus.sentence_chars[first:last]
+        left_char, right_char = max(offset - width, 0), offset + length + width
+        s0 = first + int(np.searchsorted(starts, left_char, side='right')) - 1
+        s1 = first + int(np.searchsorted(starts, right_char - 1, side='right')) - 1
+        text = corpus.decode(corpus.sentence_bytes[s0], corpus.sentence_bytes[s1 + 1])
+        base = int(corpus.sentence_chars[s0])
+        yield (chap, sent, text[left_char - base:offset - base],
+               text[offset - base:offset + length - base], text[offset + length - base:right_char - base])
+
+
+def load_position_index(source, normalizer, path):
+    """读取位置索引缓存 path，不存在时由 source 构建并写入
+
+    source 可以是无参函数，只在需要构建时才调用它加载分词或匹配结果。
+    """
+    if os.path.exists(path):
+        with timer('load.index'):
+            return PositionIndex.load(path)
+    if callable(source):
+        source = source()
+    with timer('index.build'):
+        positions = PositionIndex.from_source(source, normalizer)
+    positions.save(path)
+    return positions
+
+
+def save_kwic_to_csv(rows, filename):
+    """保存关键词上下文到CSV"""
+    os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+    with open(filename, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        writer.writerow(['章回', '句序号', '左侧', '人物', '右侧'])
+        writer.writerows(rows)
+
+
+if __name__ == '__main__':
+    from hlm_bench import load_script
+
+    parser = argparse.ArgumentParser(description="《红楼梦》人物出现位置检索（关键词上下文）")
+    parser.add_argument('name', help="人物名或别名")
+    parser.add_argument('--near', default=None, metavar='B', help="只列出与人物 B 相距不超过 --within 句的出现")
+    parser.add_argument('--within', type=int, default=1, help="邻近检索的句数")
+    parser.add_argument('--width', type=int, default=20, help="左右上下文的字数")
+    parser.add_argument('--start', type=int, default=1, help="起始章回")
+    parser.add_argument('--end', type=int, default=None, help="结束章回（默认到最后一回）")
+    parser.add_argument('--limit', type=int, default=50, help="最多显示的条数")
+    parser.add_argument('--match', choices=['pseg', 'dict'], default='pseg',
+                        help="人物识别方式：pseg 词性标注 / dict 词典匹配")
+    parser.add_argument('--csv', default=None, help="同时把全部结果写入 CSV")
+    args = parser.parse_args()
+    if args.limit < 0:
+        parser.error("--limit 不能为负数")
+    args.width = max(args.width, 0)
+
+    cooc = load_script('cooc')
+    paths = cooc.setup_paths()
+    characters, alias_map = cooc.load_characters(paths["character"])
+    positions = cooc.load_index(paths, characters, alias_map, args.match)
+    name = alias_map.get(args.name, args.name)
+    if name not in positions:
+        raise SystemExit(f"未知人物: {args.name}")
+
+    if args.near:
+        other = alias_map.get(args.near, args.near)
+        hits, _ = positions.near(name, other, args.within, args.start, args.end)
+        print(f"{name} 与 {other} 相距 {args.within} 句以内：{len(hits)} 处")
+    else:
+        hits = positions.postings(name, args.start, args.end)
+        print(f"{name}：{len(hits)} 处")
+
+    with cooc.load_text_data(paths["full_text"], paths["chapter_dir"], paths["cache"]) as corpus:
+        for chap, sent, left, word, right in kwic(corpus, hits, args.width, args.limit):
+            print(f"第{chap:>3}回  {left.replace(chr(10), ' '):>{args.width}}【{word}】{right.replace(chr(10), ' ')}")
+        if args.csv:
+            save_kwic_to_csv(kwic(corpus, hits, args.width), args.csv)
+            print(f"已保存: {args.csv}")
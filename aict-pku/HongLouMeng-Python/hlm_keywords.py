@@ -0,0 +1,102 @@
+import os
+import numpy as np
+from scipy import sparse
+from hlm_metrics import timer, count
+
+# 不计入关键词的词性（x 为标点、非语素字等）
+EXCLUDE_FLAGS = frozenset({'x', 'm', 'eng'})
+
+
+def load_stopwords(stopwords_dir):
+    """加载停用词（目录下各停用词表合并为一个集合）"""
+    stopwords = set()
+    for fname in os.listdir(stopwords_dir):
+        with open(os.path.join(stopwords_dir, fname), 'r', encoding='utf-8') as f:
+            stopwords.update(line.strip() for line in f if line.strip())
+    return frozenset(stopwords)
+
+
+def term_matrix(store, stopwords=frozenset(), min_len=2, exclude_flags=EXCLUDE_FLAGS):
+    """章回 × 词 的词频稀疏矩阵
+
+    停用词、过短的词和 exclude_flags 中的词性只在词表/词性表上各判断一次，
+    再按编号索引到全部词元，不逐词循环。
+    返回 (CSR 矩阵[章回-1, 词], 词列表)，只保留出现过的词。
+    """
+    keep_word = np.array([len(w) >= min_len and w not in stopwords for w in store.words], dtype=bool)
+    keep_flag = np.array([t not in exclude_flags for t in store.flags], dtype=bool)
+    mask = keep_word[store.word_ids] & keep_flag[store.flag_ids]
+
+    word_ids = store.word_ids[mask]
+    vocab, cols = np.unique(word_ids, return_inverse=True)
+    counts = sparse.csr_matrix(
+        (np.ones(len(cols), dtype=np.int64), (store.chapter[mask] - 1, cols)),
+        shape=(store.num_chapters, len(vocab))
+    )
+    counts.sum_duplicates()
+    count('terms', len(vocab))
+    return counts, [store.words[i] for i in vocab.tolist()]
+
+
+def tfidf(counts, sublinear=True):
+    """TF-IDF：tf 为 1 + log(词频)（sublinear=False 时为词频），
+    idf 为 log((1 + 章回数) / (1 + 文档频率)) + 1，每回按 L2 归一化"""
+    weights = counts.astype(float).tocsr()
+    if sublinear:
+        np.log(weights.data, out=weights.data)
+        weights.data += 1
+    df = np.bincount(weights.indices, minlength=weights.shape[1])
+    idf = np.log((1 + weights.shape[0]) / (1 + df)) + 1
+    weights.data *= idf[weights.indices]
+
+    norms = np.sqrt(np.asarray(weights.multiply(weights).sum(axis=1)).ravel())
+    rows = np.repeat(np.arange(weights.shape[0]), np.diff(weights.indptr))
+    weights.data /= np.where(norms[rows] > 0, norms[rows], 1)
+    return weights
+
+
+def keyness(counts):
+    """对数似然比（Dunning G²）关键性：每回相对于其余各回的显著程度
+
+    对每个 (回, 词)：a 为本回词频，b 为其余各回词频，本回总词数 c、其余总词数 d，
+    期望 E1 = c(a+b)/(c+d)、E2 = d(a+b)/(c+d)，G² = 2[a·ln(a/E1) + b·ln(b/E2)]。
+    本回使用偏少（a < E1）的词取负值。只对非零元计算。
+    """
+    counts = counts.tocsr()
+    rows = np.repeat(np.arange(counts.shape[0]), np.diff(counts.indptr))
+    a = counts.data.astype(float)
+    term_total = np.asarray(counts.sum(axis=0)).ravel().astype(float)
+    chapter_total = np.asarray(counts.sum(axis=1)).ravel().astype(float)
+    total = chapter_total.sum()
+
+    b = term_total[counts.indices] - a
+    c = chapter_total[rows]
+    d = total - c
+    e1 = c * (a + b) / total
+    e2 = d * (a + b) / total
+    with np.errstate(divide='ignore', invalid='ignore'):
+        g2 = 2 * (a * np.log(a / e1) + np.where(b > 0, b * np.log(b / e2), 0))
+    g2 = np.where(a < e1, -g2, g2)
+    return sparse.csr_matrix((np.nan_to_num(g2), counts.indices, counts.indptr), shape=counts.shape)
+
+
+def top_terms(weights, terms, k=10):
+    """每回权重最高的 k 个词：[[(词, 权重), ...], ...]（按章回顺序）"""
+    weights = weights.tocsr()
+    result = []
+    for r in range(weights.shape[0]):
+        start, end = weights.indptr[r], weights.indptr[r + 1]
+        data, cols = weights.data[start:end], weights.indices[start:end]
+        order = np.lexsort((cols, -data))[:k]  # 整行排序，权重相同时按词表顺序，结果稳定
+        result.append([(terms[j], round(float(v), 4)) for j, v in zip(cols[order], data[order]) if v > 0])
+    return result
+
+
+def chapter_keywords(store, stopwords, k=10, min_len=2):
+    """每回的 TF-IDF 和对数似然关键词：{'tfidf': [...], 'keyness': [...]}"""
+    with timer('keywords'):
+        counts, terms = term_matrix(store, stopwords, min_len)
+        return {
+            'tfidf': top_terms(tfidf(counts), terms, k),
+            'keyness': top_terms(keyness(counts), terms, k),
+        }
@@ -0,0 +1,96 @@
+import os
+import json
+import numpy as np
+from hlm_manifest import stats_signature
+from hlm_metrics import timer, count
+
+# 布局算法版本，修改算法或参数含义时递增（旧缓存自动失效）
+LAYOUT_VERSION = 1
+
+
+def force_layout(num_nodes, edges, iterations=300, gravity=0.05, seed=0, block=64, size=1000):
+    """向量化的 Fruchterman–Reingold 力导向布局
+
+    edges 为 (i, j, 权重) 列表，权重越大吸引越强（按最大值归一化）。
+    斥力按 block 行分块计算（每块 block × n），节点很多时内存仍有上限。
+    返回 (num_nodes, 2) 的坐标，缩放到 [0, size]。
+    """
+    if num_nodes == 0:
+        return np.zeros((0, 2))
+    rng = np.random.default_rng(seed)
+    pos = rng.random((num_nodes, 2))
+    k = 1 / np.sqrt(num_nodes)  # 理想边长
+
+    edges = np.array(edges, dtype=float).reshape(-1, 3)
+    src, dst = edges[:, 0].astype(int), edges[:, 1].astype(int)
+    weight = edges[:, 2] / edges[:, 2].max() if len(edges) else edges[:, 2]
+
+    temperature = 0.1
+    cooling = temperature / (iterations + 1)
+    for _ in range(iterations):
+        disp = np.zeros_like(pos)
+        x, y = pos[:, 0], pos[:, 1]
+        # 斥力 k²/d（沿两点连线方向），x、y 分量分开算以减少临时数组
+        for start in range(0, num_nodes, block):
+            dx = x[start:start + block, None] - x[None, :]
+            dy = y[start:start + block, None] - y[None, :]
+            inv = dx * dx
+            inv += dy * dy
+            np.maximum(inv, 1e-9, out=inv)
+            np.divide(k * k, inv, out=inv)
+            disp[start:start + block, 0] += (dx * inv).sum(axis=1)
+            disp[start:start + block, 1] += (dy * inv).sum(axis=1)
+        # 引力 w·d²/k
+        delta = pos[src] - pos[dst]
+        dist = np.sqrt((delta ** 2).sum(axis=-1))
+        force = delta * (weight * dist / k)[:, None]
+        np.subtract.at(disp, src, force)
+        np.add.at(disp, dst, force)
+        # 向中心的引力，避免不连通的部分飘散
+        disp -= gravity * (pos - pos.mean(axis=0)) / k
+
+        # 每步位移不超过当前温度
+        length = np.sqrt((disp ** 2).sum(axis=-1))
+        pos += disp * (np.minimum(length, temperature) / np.maximum(length, 1e-9))[:, None]
+        temperature -= cooling
+
+    pos -= pos.min(axis=0)
+    span = pos.max() or 1
+    return pos * (size / span)
+
+
+def graph_layout(nodes, links, cache_dir='./cache/layout', **params):
+    """关系图节点坐标 {人物: (x, y)}，按图的哈希缓存
+
+    只有节点集合、边及其权重或布局参数变化时才重新计算；
+    节点按名称排序后编号，与 nodes、links 的先后顺序无关。
+    """
+    names = sorted(node["name"] for node in nodes)
+    index = {name: i for i, name in enumerate(names)}
+    edges = sorted(
+        (min(index[l["source"]], index[l["target"]]), max(index[l["source"]], index[l["target"]]), l["value"])
+        for l in links if l["source"] in index and l["target"] in index
+    )
+    key = stats_signature(f"layout-v{LAYOUT_VERSION}", params, names, edges)
+    path = os.path.join(cache_dir, f"{key[:16]}.json")
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return {name: tuple(xy) for name, xy in json.load(f).items()}
+
+    with timer('layout'):
+        pos = force_layout(len(names), edges, **params)
+    count('layouts_computed')
+    positions = {name: (round(float(x), 2), round(float(y), 2)) for name, (x, y) in zip(names, pos)}
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(positions, f, ensure_ascii=False)
+    os.replace(path + '.tmp', path)
+    return positions
+
+
+def apply_layout(nodes, links, cache_dir='./cache/layout', **params):
+    """为节点写入固定坐标 x/y（原地修改并返回 nodes），前端无需再模拟布局"""
+    positions = graph_layout(nodes, links, cache_dir, **params)
+    for node in nodes:
+        node["x"], node["y"] = positions[node["name"]]
+    return nodes
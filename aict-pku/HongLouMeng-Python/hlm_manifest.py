@@ -0,0 +1,115 @@
+import os
+import json
+import hashlib
+
+# 章节清单文件名（与章节文件放在同一目录）
+MANIFEST_NAME = 'manifest.json'
+
+
+def content_hash(data):
+    """章节内容哈希（str 按 UTF-8 编码）"""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.sha256(data).hexdigest()
+
+
+def stats_signature(*parts):
+    """统计口径的签名：各部分（列表、集合、字典会先排序）序列化后取哈希"""
+    def normalize(x):
+        if isinstance(x, (set, frozenset)):
+            return sorted(x)
+        if isinstance(x, dict):
+            return sorted(x.items())
+        return x
+    return content_hash(json.dumps([normalize(x) for x in parts], ensure_ascii=False))
+
+
+def load_manifest(chapter_dir):
+    """读取章节清单 {文件名: {sha256, size, mtime_ns}}，不存在时返回空字典"""
+    path = os.path.join(chapter_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f).get('chapters', {})
+
+
+def save_manifest(chapter_dir, hashes):
+    """写入章节清单，同时记录文件大小和修改时间，供下游判断清单是否仍然有效"""
+    chapters = {}
+    for fname, digest in sorted(hashes.items()):
+        st = os.stat(os.path.join(chapter_dir, fname))
+        chapters[fname] = {"sha256": digest, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    path = os.path.join(chapter_dir, MANIFEST_NAME)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({"chapters": chapters}, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+def chapter_hashes(chapter_files):
+    """各章节文件的内容哈希（按 chapter_files 顺序）
+
+    文件大小和修改时间与清单一致时直接使用清单中的哈希，
+    否则（手工修改过、或没有清单）重新计算。
+    """
+    manifests = {}
+    hashes = []
+    for path in chapter_files:
+        chapter_dir, fname = os.path.split(path)
+        if chapter_dir not in manifests:
+            manifests[chapter_dir] = load_manifest(chapter_dir)
+        entry = manifests[chapter_dir].get(fname)
+        st = os.stat(path)
+        if entry and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+            hashes.append(entry["sha256"])
+        else:
+            with open(path, 'rb') as f:
+                hashes.append(content_hash(f.read()))
+    return hashes
+
+
+class ChapterStats:
+    """按章节内容哈希保存的每回统计结果（JSON）
+
+    signature 描述统计口径（分词环境、人物表、识别方式等），口径变化时全部作废；
+    章节哈希变化时只有该回需要重新统计。
+    """
+
+    def __init__(self, path, signature):
+        self.path = path
+        self.signature = signature
+        self.chapters = {}  # 章回号(str) -> {"hash": ..., "data": ...}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            if saved.get('signature') == signature:
+                self.chapters = saved.get('chapters', {})
+
+    def stale(self, hashes):
+        """需要重新统计的章回号（从1开始）：新增或内容变化的章节"""
+        return [
+            chap for chap, digest in enumerate(hashes, start=1)
+            if self.chapters.get(str(chap), {}).get('hash') != digest
+        ]
+
+    def removed(self, num_chapters):
+        """已不存在的章回号（章节数减少时）"""
+        return sorted(int(chap) for chap in self.chapters if int(chap) > num_chapters)
+
+    def get(self, chap):
+        entry = self.chapters.get(str(chap))
+        return entry['data'] if entry else None
+
+    def put(self, chap, digest, data):
+        self.chapters[str(chap)] = {"hash": digest, "data": data}
+
+    def drop(self, chap):
+        self.chapters.pop(str(chap), None)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"signature": self.signature, "chapters": self.chapters}, f,
+                      ensure_ascii=False)
+        os.replace(tmp_path, self.path)
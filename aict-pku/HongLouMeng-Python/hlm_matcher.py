@@ -0,0 +1,221 @@
+import os
+from bisect import bisect_right
+from collections import defaultdict, deque
+from hlm_corpus import sentence_starts
+from hlm_metrics import timer, count
+
+
+class AhoCorasick:
+    """多模式串匹配自动机（最左最长匹配，不重叠）"""
+
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [0]   # 恰好在该状态结束的模式串长度，0 表示不是模式串
+        self.link = [0]  # 字典后缀链：失败链上最近的模式串状态
+        for pattern in patterns:
+            if pattern:
+                self._insert(pattern)
+        self._build_fail()
+
+    def _insert(self, pattern):
+        node = 0
+        for ch in pattern:
+            nxt = self.goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[node][ch] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append(0)
+                self.link.append(0)
+            node = nxt
+        self.out[node] = len(pattern)
+
+    def _build_fail(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self.goto[node].items():
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                fail_node = self.fail[nxt]
+                self.link[nxt] = fail_node if self.out[fail_node] else self.link[fail_node]
+                queue.append(nxt)
+
+    def iter_candidates(self, text):
+        """产出文本中所有模式串的出现 (start, end)，包括互相重叠、互相包含的"""
+        goto, fail, out, link = self.goto, self.fail, self.out, self.link
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            # 沿字典后缀链给出以此结尾的每一个模式串
+            match = node if out[node] else link[node]
+            while match:
+                yield i + 1 - out[match], i + 1
+                match = link[match]
+
+    def find(self, text, boundary=None):
+        """最左最长、互不重叠的匹配列表 [(start, end)]
+
+        boundary(text, start, end) 返回 False 的候选先被丢弃，
+        同一位置上较短的合法候选仍可入选；再从左到右取每个起点上最长的不重叠候选。
+        """
+        candidates = [
+            (start, end) for start, end in self.iter_candidates(text)
+            if boundary is None or boundary(text, start, end)
+        ]
+        candidates.sort(key=lambda x: (x[0], x[0] - x[1]))
+        matches = []
+        last_end = 0
+        for start, end in candidates:
+            if start >= last_end:
+                matches.append((start, end))
+                last_end = end
+        return matches
+
+
+def make_boundary_rule(before='', after=''):
+    """边界规则：匹配前一字在 before 中或后一字在 after 中时不算人名（两者都为空时返回 None）"""
+    if not before and not after:
+        return None
+    before, after = set(before), set(after)
+
+    def rule(text, start, end):
+        if start > 0 and text[start - 1] in before:
+            return False
+        if end < len(text) and text[end] in after:
+            return False
+        return True
+
+    return rule
+
+
+def _iter_chapters(chapters):
+    """逐回产出 (文本, 各句起始字符位置)
+
+    chapters 为 Corpus 时直接使用其句子索引，否则视为章节文件路径列表。
+    """
+    if hasattr(chapters, 'chapters'):
+        for view in chapters.chapters():
+            yield view.text, view.sentence_starts().tolist()
+        return
+    for path in chapters:
+        with open(path, 'r', encoding='utf-8') as f:
+            text = f.read()
+        yield text, sentence_starts(text)
+
+
+class MatchSource:
+    """词典匹配结果，接口与 TokenStore.iter_records 一致（词性均记为 nr）
+
+    chapters 可以是打包语料 Corpus，也可以是章节文件路径列表。
+    """
+
+    def __init__(self, chapters, names, boundary=None):
+        with timer('match.dict'):
+            self._scan(chapters, names, boundary)
+        count('matches', len(self.words))
+
+    def _scan(self, chapters, names, boundary):
+        self.matcher = AhoCorasick(names)
+        self.chapter, self.sentence, self.offset, self.words = [], [], [], []
+        self.sentence_bounds = [0]  # 第 chap 回的句序号范围为 [bounds[chap-1], bounds[chap])
+        sent = 0
+        for chap, (text, starts) in enumerate(_iter_chapters(chapters), start=1):
+            for start, end in self.matcher.find(text, boundary):
+                self.chapter.append(chap)
+                self.sentence.append(sent + bisect_right(starts, start) - 1)
+                self.offset.append(start)
+                self.words.append(text[start:end])
+            # 句序号与 TokenStore 保持一致
+            sent += len(starts)
+            self.sentence_bounds.append(sent)
+
+    def __len__(self):
+        return len(self.words)
+
+    def sentence_range(self, chap):
+        """某一回的句序号范围 [first, end)"""
+        return self.sentence_bounds[chap - 1], self.sentence_bounds[chap]
+
+    def iter_records(self, flag=None, chapters=None):
+        """按顺序遍历 (章回, 句序号, 词, 'nr')，可只取某几回"""
+        if flag not in (None, 'nr'):
+            return
+        chapters = None if chapters is None else set(chapters)
+        for c, s, w in zip(self.chapter, self.sentence, self.words):
+            if chapters is None or c in chapters:
+                yield c, s, w, 'nr'
+
+
+def accuracy_report(store, source, normalizer):
+    """以 pseg 结果为基准，按 (章回, 偏移, 人物) 比较词典匹配的准确率"""
+    baseline = set()
+    if 'nr' in store.flags:
+        mask = store.flag_ids == store.flags.index('nr')
+        for c, o, w in zip(store.chapter[mask].tolist(), store.offset[mask].tolist(),
+                           store.word_ids[mask].tolist()):
+            name = normalizer(store.words[w], 'nr')
+            if name is not None:
+                baseline.add((c, o, name))
+
+    matched = set()
+    for c, o, w in zip(source.chapter, source.offset, source.words):
+        name = normalizer(w, 'nr')
+        if name is not None:
+            matched.add((c, o, name))
+
+    tp = len(baseline & matched)
+    precision = tp / len(matched) if matched else 0.0
+    recall = tp / len(baseline) if baseline else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+
+    # 各人物的差异（多匹配 / 漏匹配）
+    diff = defaultdict(lambda: [0, 0])
+    for _, _, name in matched - baseline:
+        diff[name][0] += 1
+    for _, _, name in baseline - matched:
+        diff[name][1] += 1
+    worst = sorted(diff.items(), key=lambda x: -(x[1][0] + x[1][1]))[:20]
+
+    return {
+        "baseline": len(baseline),
+        "matched": len(matched),
+        "true_positive": tp,
+        "precision": precision,
+        "recall": recall,
+        "f1": f1,
+        "top_diff": [(name, extra, missed) for name, (extra, missed) in worst],
+    }
+
+
+if __name__ == '__main__':
+    # 以 pseg 为基准输出词典匹配准确率报告
+    import time
+    from hlm_tokens import load_token_store
+    from hlm_corpus import load_corpus
+    from hlm_engine import Normalizer
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    chapter_dir = os.path.join(script_dir, "data", "红楼梦_chap")
+    character_path = os.path.join(script_dir, "data", "红楼梦_character.txt")
+    with open(character_path, 'r', encoding='utf-8') as f:
+        names = [line.split()[0] for line in f if line.strip()]
+
+    start = time.perf_counter()
+    with load_corpus(chapter_dir, os.path.join(script_dir, "cache")) as corpus:
+        source = MatchSource(corpus, names)
+    elapsed = time.perf_counter() - start
+
+    store = load_token_store(chapter_dir, character_path, os.path.join(script_dir, "cache"))
+    report = accuracy_report(store, source, Normalizer(names))
+    print(f"词典匹配耗时: {elapsed:.2f}s，匹配 {report['matched']} 处，基准 {report['baseline']} 处")
+    print(f"准确率 {report['precision']:.3f}  召回率 {report['recall']:.3f}  F1 {report['f1']:.3f}")
+    print("差异最大的人物（多匹配, 漏匹配）:")
+    for name, extra, missed in report['top_diff']:
+        print(f"  {name}: +{extra} -{missed}")
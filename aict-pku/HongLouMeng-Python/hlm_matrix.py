@@ -0,0 +1,358 @@
+from collections.abc import Mapping
+import numpy as np
+from scipy import sparse
+from hlm_engine import Accumulator
+from hlm_metrics import timer, count
+
+
+class CoOccurrenceMatrix:
+    """人物共现矩阵：C = AᵀA，A 为 窗口×人物 的 0/1 关联矩阵
+
+    对角线为人物出现的窗口数（freq），非对角元为共现次数。
+    人物编号按名字排序，因此 i < j 时 (names[i], names[j]) 与原字典版的键顺序一致。
+    """
+
+    def __init__(self, names, matrix, focus=None):
+        self.names = list(names)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.matrix = sparse.csr_matrix(matrix)
+        self.matrix.eliminate_zeros()
+        self.focus = focus  # 只保留与这些人物相连的边（布尔数组），None 表示不限
+
+    @staticmethod
+    def _incidence(rows, cols, shape):
+        """构建 行×人物 的 0/1 关联矩阵"""
+        a = sparse.csr_matrix((np.ones(len(cols), dtype=np.int32), (rows, cols)), shape=shape)
+        a.sum_duplicates()
+        a.data[:] = 1  # 同一行内多次出现只计一次
+        return a
+
+    @classmethod
+    def from_windows(cls, names, windows, char_ids):
+        """由 (窗口号, 人物编号) 序列构建"""
+        _, rows = np.unique(windows, return_inverse=True)
+        a = cls._incidence(rows, char_ids, (int(rows.max(initial=-1)) + 1, len(names)))
+        return cls(names, (a.T @ a).tocsr())
+
+    @classmethod
+    def from_sentences(cls, names, sents, char_ids, window_size=3, decay=0.5):
+        """距离加权共现：C = Sᵀ·B·S，S 为 句×人物 关联矩阵，B[i, j] = decay^|i-j|（|i-j| < window_size）
+
+        对角线替换为人物出现的句数。
+        """
+        n = int(sents.max(initial=-1)) + 1
+        s = cls._incidence(sents, char_ids, (n, len(names)))
+        offsets = [d for d in range(-window_size + 1, window_size) if abs(d) < n]
+        band = sparse.diags(
+            [np.full(n - abs(d), decay ** abs(d)) for d in offsets], offsets,
+            shape=(n, n), format='csr'
+        )
+        c = (s.T @ band @ s).tolil()
+        c.setdiag(np.asarray(s.sum(axis=0)).ravel())
+        return cls(names, c.tocsr())
+
+    @property
+    def diagonal(self):
+        return self.matrix.diagonal()
+
+    @property
+    def freq(self):
+        diag = self.diagonal
+        return {self.names[i]: int(diag[i]) for i in np.flatnonzero(diag)}
+
+    @property
+    def co_occur(self):
+        return PairView(self)
+
+    @property
+    def co_occur_detail(self):
+        return DetailView(self)
+
+    def views(self):
+        """(freq, co_occur, co_occur_detail)，与字典版 analyze_co_occurrence 的返回值同构"""
+        return self.freq, self.co_occur, self.co_occur_detail
+
+    def top_ids(self, top_n):
+        """频次前 top_n 的人物编号（部分选择，并列时取编号小者，即人物名在前者，与字典后端一致）"""
+        diag = self.diagonal
+        if top_n >= len(diag):
+            chosen = np.arange(len(diag))
+        elif top_n <= 0:
+            chosen = np.arange(0)
+        else:
+            kth = np.partition(diag, len(diag) - top_n)[len(diag) - top_n]
+            above = np.flatnonzero(diag > kth)
+            ties = np.flatnonzero(diag == kth)[:top_n - len(above)]
+            chosen = np.concatenate([above, ties])
+        return chosen[diag[chosen] > 0]
+
+    def filter(self, top_n=120, main_chars=None):
+        """矩阵版 filter_data：保留频次前 top_n 的人物，及主角和主角的邻居"""
+        diag = self.diagonal
+        keep = np.zeros(len(self.names), dtype=bool)
+        keep[self.top_ids(top_n)] = True
+
+        focus = None
+        if main_chars:
+            focus = np.zeros(len(self.names), dtype=bool)
+            focus[[self.index[c] for c in main_chars if c in self.index]] = True
+            keep |= focus
+            neighbors = self.matrix[np.flatnonzero(focus)].indices
+            keep[neighbors] = True
+
+        mask = sparse.diags(keep.astype(np.int32), dtype=np.int32)
+        return CoOccurrenceMatrix(self.names, mask @ self.matrix @ mask, focus)
+
+
+class PairView(Mapping):
+    """co_occur 的只读视图：{(人物1, 人物2): 共现次数}，只含上三角"""
+
+    def __init__(self, cm):
+        self.cm = cm
+        upper = sparse.triu(cm.matrix, k=1).tocoo()
+        rows, cols, data = upper.row, upper.col, upper.data
+        if cm.focus is not None:
+            sel = cm.focus[rows] | cm.focus[cols]
+            rows, cols, data = rows[sel], cols[sel], data[sel]
+        self._rows, self._cols, self._data = rows, cols, data
+
+    def __getitem__(self, pair):
+        i, j = sorted(self.cm.index[name] for name in pair)
+        if i == j:
+            raise KeyError(pair)
+        if self.cm.focus is not None and not (self.cm.focus[i] or self.cm.focus[j]):
+            raise KeyError(pair)
+        value = self.cm.matrix[i, j]
+        if not value:
+            raise KeyError(pair)
+        return value.item()
+
+    def __iter__(self):
+        names = self.cm.names
+        for i, j in zip(self._rows.tolist(), self._cols.tolist()):
+            yield names[i], names[j]
+
+    def __len__(self):
+        return len(self._data)
+
+    def items(self):
+        names = self.cm.names
+        for i, j, v in zip(self._rows.tolist(), self._cols.tolist(), self._data.tolist()):
+            yield (names[i], names[j]), v
+
+    def values(self):
+        return self._data.tolist()
+
+
+class DetailView(Mapping):
+    """co_occur_detail 的只读视图：{人物: {共现人物: 次数}}"""
+
+    def __init__(self, cm):
+        self.cm = cm
+        degree = np.diff(cm.matrix.indptr) - (cm.diagonal > 0)
+        self._present = np.flatnonzero(degree > 0)
+
+    def __getitem__(self, name):
+        i = self.cm.index[name]
+        m = self.cm.matrix
+        start, end = m.indptr[i], m.indptr[i + 1]
+        row = {
+            self.cm.names[j]: v
+            for j, v in zip(m.indices[start:end].tolist(), m.data[start:end].tolist())
+            if j != i
+        }
+        if not row:
+            raise KeyError(name)
+        return row
+
+    def __iter__(self):
+        for i in self._present.tolist():
+            yield self.cm.names[i]
+
+    def __len__(self):
+        return len(self._present)
+
+
+class SentenceCharacters:
+    """每句出现的人物编号（CSR 结构，全书只需构建一次）
+
+    第 sents[i] 句中的人物为 char_ids[indptr[i]:indptr[i + 1]]；
+    任意窗口大小、步长的共现都由这两个数组直接组装，不再拼接或切分句子字符串。
+    """
+
+    def __init__(self, names, sents, char_ids, chaps=None):
+        self.names = list(names)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        # 去重并按 (句, 人物) 排序
+        pairs = np.unique(np.stack([sents, char_ids], axis=1), axis=0) if len(sents) else \
+            np.zeros((0, 2), dtype=np.int64)
+        self.mention_sents = pairs[:, 0]
+        self.char_ids = pairs[:, 1]
+        self.sents, starts = np.unique(self.mention_sents, return_index=True)
+        self.indptr = np.append(starts, len(self.char_ids))
+        # 每个有人物的句子所在章回（与 self.sents 对齐），未提供时为 None
+        self.chaps = None
+        if chaps is not None:
+            self.chaps = np.zeros(len(self.sents), dtype=np.int64)
+            self.chaps[np.searchsorted(self.sents, sents)] = chaps
+
+    @classmethod
+    def from_mentions(cls, sents, names, chaps=None):
+        """由 (句序号, 人物名) 序列构建，人物按名字排序编号"""
+        ids = sorted(set(names))
+        index = {name: i for i, name in enumerate(ids)}
+        return cls(
+            ids,
+            np.asarray(sents, dtype=np.int64),
+            np.array([index[name] for name in names], dtype=np.int64),
+            None if chaps is None else np.asarray(chaps, dtype=np.int64),
+        )
+
+    def __len__(self):
+        return len(self.sents)
+
+    def sentence(self, i):
+        """第 i 个有人物的句子中的人物编号（数组视图，不复制）"""
+        return self.char_ids[self.indptr[i]:self.indptr[i + 1]]
+
+    def co_occurrence(self, window_size=3, stride=None, decay=None):
+        """按窗口组装共现矩阵；decay 不为空时为距离加权"""
+        with timer('matrix.co_occurrence'):
+            cm = self._co_occurrence(window_size, stride, decay)
+        count('pairs', int(sparse.triu(cm.matrix, k=1).nnz))
+        return cm
+
+    def _co_occurrence(self, window_size, stride, decay):
+        if decay is not None:
+            return CoOccurrenceMatrix.from_sentences(
+                self.names, self.mention_sents, self.char_ids, window_size, decay)
+
+        windows, counts = self._windows(window_size, stride)
+        count('windows', len(np.unique(windows)))
+        return CoOccurrenceMatrix.from_windows(self.names, windows, np.repeat(self.char_ids, counts))
+
+    def _windows(self, window_size, stride):
+        """每处提及归入所有覆盖它的窗口 [lo, hi]：返回 (展开后的窗口号, 每处提及的窗口数)"""
+        stride = stride or window_size
+        sents = self.mention_sents
+        lo = np.maximum(0, -(-(sents - window_size + 1) // stride))
+        hi = sents // stride
+        counts = np.maximum(hi - lo + 1, 0)
+        starts = np.repeat(np.cumsum(counts) - counts, counts)
+        return np.repeat(lo, counts) + np.arange(int(counts.sum())) - starts, counts
+
+    def by_chapter(self, window_size=3, stride=None):
+        """按章回累积的共现（需要构建时提供章回号），见 ChapterCoOccurrence"""
+        if self.chaps is None:
+            raise ValueError("构建 SentenceCharacters 时未提供章回号")
+        with timer('matrix.by_chapter'):
+            windows, counts = self._windows(window_size, stride)
+            mention_chaps = self.chaps[np.searchsorted(self.sents, self.mention_sents)]
+            return ChapterCoOccurrence.from_windows(
+                self.names, windows, np.repeat(self.char_ids, counts), np.repeat(mention_chaps, counts))
+
+    def sweep(self, window_sizes, stride=None, decay=None):
+        """一次构建、多种窗口大小：{窗口句数: CoOccurrenceMatrix}"""
+        return {w: self.co_occurrence(w, stride, decay) for w in window_sizes}
+
+
+class ChapterCoOccurrence:
+    """按章回累积的共现：每条边、每个人物在前 c 回中的前缀和
+
+    edge_prefix[c, e] 为第 1..c 回中边 e（edge_rows[e] < edge_cols[e]）的共现次数，
+    freq_prefix[c, i] 为人物 i 在第 1..c 回中出现的窗口数，第 0 行全为 0。
+    任意章回区间 [a, b] 由两行相减得到，只需 O(边数)，不必重新统计。
+    每个窗口计入其中最早出现人物的章回，全部章回之和与全书的 co_occurrence 相同。
+    """
+
+    def __init__(self, names, edge_rows, edge_cols, edge_prefix, freq_prefix):
+        self.names = list(names)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.edge_rows = edge_rows
+        self.edge_cols = edge_cols
+        self.edge_prefix = edge_prefix
+        self.freq_prefix = freq_prefix
+        self._edge_keys = edge_rows * len(self.names) + edge_cols  # 升序，用于查找单条边
+
+    @classmethod
+    def from_windows(cls, names, windows, char_ids, chaps):
+        """由 (窗口号, 人物编号, 章回号) 序列构建"""
+        n = len(names)
+        num_chapters = int(chaps.max(initial=0))
+        win_ids, rows = np.unique(windows, return_inverse=True)
+        win_chaps = np.full(len(win_ids), num_chapters, dtype=np.int64)
+        np.minimum.at(win_chaps, rows, chaps)
+        a = CoOccurrenceMatrix._incidence(rows, char_ids, (len(win_ids), n))
+
+        # 窗口按起始句排序，所属章回单调不减，每回的窗口是连续的行
+        bounds = np.searchsorted(win_chaps, np.arange(1, num_chapters + 2))
+        per_chapter = []
+        freq = np.zeros((num_chapters + 1, n), dtype=np.int64)
+        for c in range(1, num_chapters + 1):
+            block = a[bounds[c - 1]:bounds[c]]
+            upper = sparse.triu(block.T @ block, k=1).tocoo()
+            per_chapter.append((upper.row * n + upper.col, upper.data))
+            freq[c] = np.asarray(block.sum(axis=0)).ravel()
+
+        keys = np.concatenate([k for k, _ in per_chapter]) if per_chapter else np.zeros(0, dtype=np.int64)
+        edges = np.unique(keys)
+        counts = np.zeros((num_chapters + 1, len(edges)), dtype=np.int64)
+        for c, (k, v) in enumerate(per_chapter, start=1):
+            counts[c, np.searchsorted(edges, k)] = v
+        return cls(names, edges // n, edges % n, np.cumsum(counts, axis=0), np.cumsum(freq, axis=0))
+
+    @property
+    def num_chapters(self):
+        return len(self.freq_prefix) - 1
+
+    def _bounds(self, a, b):
+        a, b = max(a, 1), min(b, self.num_chapters)
+        if a > b:
+            raise ValueError(f"章回区间为空: [{a}, {b}]")
+        return a, b
+
+    def edge_counts(self, a, b):
+        """第 a..b 回（含两端，从1开始）中每条边的共现次数"""
+        a, b = self._bounds(a, b)
+        return self.edge_prefix[b] - self.edge_prefix[a - 1]
+
+    def pair(self, name1, name2, a, b):
+        """两人在第 a..b 回中的共现次数（二分查找边号，O(log 边数)）"""
+        i, j = sorted((self.index[name1], self.index[name2]))
+        key = i * len(self.names) + j
+        e = int(np.searchsorted(self._edge_keys, key))
+        if i == j or e >= len(self._edge_keys) or self._edge_keys[e] != key:
+            return 0
+        a, b = self._bounds(a, b)
+        return int(self.edge_prefix[b, e] - self.edge_prefix[a - 1, e])
+
+    def range(self, a, b):
+        """第 a..b 回的共现矩阵（CoOccurrenceMatrix，可直接 filter / views）"""
+        a, b = self._bounds(a, b)
+        values = self.edge_prefix[b] - self.edge_prefix[a - 1]
+        freq = self.freq_prefix[b] - self.freq_prefix[a - 1]
+        diag = np.arange(len(self.names))
+        matrix = sparse.coo_matrix(
+            (np.concatenate([values, values, freq]),
+             (np.concatenate([self.edge_rows, self.edge_cols, diag]),
+              np.concatenate([self.edge_cols, self.edge_rows, diag]))),
+            shape=(len(self.names), len(self.names))
+        )
+        return CoOccurrenceMatrix(self.names, matrix)
+
+
+class SentenceMentions(Accumulator):
+    """收集 (句, 人物) 提及，结束时构建 SentenceCharacters"""
+
+    def __init__(self):
+        self.chaps = []
+        self.sents = []
+        self.names = []
+
+    def on_character(self, chap, sent, name):
+        self.chaps.append(chap)
+        self.sents.append(sent)
+        self.names.append(name)
+
+    def result(self):
+        return SentenceCharacters.from_mentions(self.sents, self.names, self.chaps)
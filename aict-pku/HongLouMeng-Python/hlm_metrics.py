@@ -0,0 +1,240 @@
+import os
+import sys
+import json
+import time
+import threading
+import traceback
+from collections import defaultdict
+from contextlib import contextmanager
+
+try:
+    import resource  # 仅 Unix
+except ImportError:
+    resource = None
+
+
+def peak_rss_kb():
+    """本进程的峰值常驻内存（KB），不支持的平台返回 None"""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss  # macOS 单位为字节
+
+
+def current_rss_kb():
+    """当前常驻内存（KB）：Linux 读 /proc，其他平台退回到峰值内存，都不可用时返回 None"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+    except (OSError, ValueError, AttributeError):
+        pass
+    return peak_rss_kb()
+
+
+class MemorySampler:
+    """后台线程定时采样常驻内存，记录峰值和采样序列"""
+
+    def __init__(self, interval=0.2):
+        self.interval = interval
+        self.samples = []  # (相对时间, KB)
+        self._stop = threading.Event()
+        self._thread = None
+        self._start = None
+
+    def start(self):
+        self._start = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            rss = current_rss_kb()
+            if rss is not None:
+                self.samples.append((round(time.perf_counter() - self._start, 3), rss))
+            if self._stop.wait(self.interval):
+                break
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+
+    @property
+    def peak_kb(self):
+        return max((rss for _, rss in self.samples), default=None)
+
+
+class SamplingProfiler:
+    """采样分析器：后台线程定时抓取主线程调用栈，输出折叠栈和火焰图 SVG"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = defaultdict(int)  # "f1;f2;f3" -> 采样次数
+        self._stop = threading.Event()
+        self._thread = None
+        self._target = threading.main_thread().ident
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+
+    def write_folded(self, path):
+        """折叠栈格式（每行 "栈 次数"），可交给 flamegraph.pl、speedscope 等工具"""
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, n in sorted(self.stacks.items()):
+                f.write(f"{stack} {n}\n")
+
+    def write_svg(self, path, width=1200, row=16):
+        """简易火焰图：每层按采样次数分配宽度，悬停显示函数名和占比"""
+        root = {}
+        for stack, n in self.stacks.items():
+            node = root
+            for name in stack.split(';'):
+                entry = node.setdefault(name, [0, {}])
+                entry[0] += n
+                node = entry[1]
+        total = sum(self.stacks.values()) or 1
+
+        rects = []
+
+        def walk(node, x, depth):
+            for name, (n, children) in sorted(node.items()):
+                w = width * n / total
+                if w >= 0.5:
+                    rects.append((x, depth, w, name, n))
+                    walk(children, x, depth + 1)
+                x += w
+
+        walk(root, 0.0, 0)
+        height = (max((d for _, d, _, _, _ in rects), default=0) + 2) * row
+        parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+                 f'font-family="monospace" font-size="11">']
+        for x, depth, w, name, n in rects:
+            y = height - (depth + 1) * row
+            label = name.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+            hue = 20 + sum(map(ord, name.split(' ')[0])) % 40
+            parts.append(
+                f'<g><title>{label} — {n} 次 ({100 * n / total:.1f}%)</title>'
+                f'<rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{row - 1}" '
+                f'fill="hsl({hue},90%,60%)"/>'
+                + (f'<text x="{x + 2:.1f}" y="{y + row - 4}">{label[:int(w / 7)]}</text>' if w > 30 else '')
+                + '</g>'
+            )
+        parts.append('</svg>')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(parts))
+
+
+class Metrics:
+    """轻量的运行指标：计时器、计数器、内存采样和可选的采样分析
+
+    各模块通过模块级的 timer()/count() 记录；未调用 start() 时同样累计，只是没有内存采样。
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.timers = defaultdict(lambda: [0.0, 0])  # 名称 -> [累计秒数, 次数]
+        self.counters = defaultdict(int)
+        self.info = {}
+        self.errors = []
+        self.sampler = None
+        self.profiler = None
+        self._start = time.perf_counter()
+
+    def start(self, name, sample_memory=True, profile=False):
+        """开始一次运行：记录脚本名，启动内存采样和（可选）采样分析"""
+        self.reset()
+        self.info["script"] = name
+        self.info["started"] = time.strftime('%Y-%m-%d %H:%M:%S')
+        if sample_memory:
+            self.sampler = MemorySampler()
+            self.sampler.start()
+        if profile:
+            self.profiler = SamplingProfiler()
+            self.profiler.start()
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry = self.timers[name]
+            entry[0] += time.perf_counter() - start
+            entry[1] += 1
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def error(self, exc):
+        """记录异常（含调用栈），供运行报告使用"""
+        self.errors.append({
+            "type": type(exc).__name__,
+            "message": str(exc),
+            "traceback": traceback.format_exception(type(exc), exc, exc.__traceback__),
+        })
+
+    def rates(self):
+        """由计数器和计时器导出的速率"""
+        rates = {}
+        seconds = self.timers.get('segment', [0])[0]
+        if seconds and self.counters.get('tokens'):
+            rates["tokens_per_second"] = round(self.counters['tokens'] / seconds)
+        seconds = self.timers.get('engine.run', [0])[0]
+        if seconds and self.counters.get('records'):
+            rates["records_per_second"] = round(self.counters['records'] / seconds)
+        return rates
+
+    def report(self):
+        return {
+            **self.info,
+            "wall_seconds": round(time.perf_counter() - self._start, 4),
+            "timers": {name: {"seconds": round(s, 4), "calls": n} for name, (s, n) in self.timers.items()},
+            "counters": dict(self.counters),
+            "rates": self.rates(),
+            "memory": {
+                "peak_rss_kb": self.sampler.peak_kb if self.sampler else current_rss_kb(),
+                "samples": self.sampler.samples if self.sampler else [],
+            },
+            "errors": self.errors,
+        }
+
+    def finish(self, report_path, profile_path=None):
+        """停止采样，写出运行报告 JSON（以及火焰图 profile_path.svg / .folded）"""
+        if self.sampler:
+            self.sampler.stop()
+        if self.profiler:
+            self.profiler.stop()
+            if profile_path:
+                os.makedirs(os.path.dirname(profile_path) or '.', exist_ok=True)
+                self.profiler.write_folded(profile_path + '.folded')
+                self.profiler.write_svg(profile_path + '.svg')
+        report = self.report()
+        os.makedirs(os.path.dirname(report_path) or '.', exist_ok=True)
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+        return report
+
+
+# 全局实例：各模块共用
+metrics = Metrics()
+timer = metrics.timer
+count = metrics.count
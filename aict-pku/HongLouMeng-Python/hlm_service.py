@@ -0,0 +1,279 @@
+import json
+import time
+import asyncio
+import argparse
+from functools import lru_cache
+from urllib.parse import urlsplit, parse_qsl
+import numpy as np
+from hlm_engine import AnalysisEngine, Normalizer, ChapterFrequency
+from hlm_matrix import SentenceMentions
+from hlm_graph import build_graph_data
+from hlm_index import kwic
+from hlm_metrics import metrics, count
+
+HTTP_STATUS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               500: 'Internal Server Error'}
+
+
+class QueryError(ValueError):
+    """查询参数有误（返回 400）"""
+
+
+class StatsService:
+    """常驻内存的人物统计索引及查询
+
+    启动时遍历一次人物提及，构建：
+      每回人物出现次数的前缀和（任意章回区间的频次、前 k 名）
+      ChapterCoOccurrence（任意章回区间的两人共现、自我中心网络）
+    另给出位置索引 positions（PositionIndex）和打包语料 corpus 时，
+    提供关键词上下文 /kwic 和邻近检索 /near，只按偏移索引解码用到的句子。
+    查询结果（JSON 字节串）按 (路径, 参数) 缓存在 LRU 中。
+    """
+
+    def __init__(self, mentions, characters, alias_map, window_size=3, cache_size=1024,
+                 positions=None, corpus=None):
+        self.alias_map = dict(alias_map)
+        self.positions = positions
+        self.corpus = corpus
+        engine = AnalysisEngine(Normalizer(characters, alias_map))
+        engine.register('chapter', ChapterFrequency())
+        engine.register('mentions', SentenceMentions())
+        result = engine.run(mentions)
+
+        self.dynamic = result['mentions'].by_chapter(window_size)
+        self.names = self.dynamic.names
+        self.index = self.dynamic.index
+        self.num_chapters = self.dynamic.num_chapters
+        counts = np.zeros((self.num_chapters + 1, len(self.names)), dtype=np.int64)
+        for chap, chapter_counts in result['chapter'].items():
+            for name, n in chapter_counts.items():
+                counts[chap, self.index[name]] = n
+        self.freq_prefix = np.cumsum(counts, axis=0)
+
+        self.routes = {
+            '/freq': self.freq,
+            '/topk': self.topk,
+            '/cooc': self.cooc,
+            '/ego': self.ego,
+        }
+        if positions is not None and corpus is not None:
+            self.routes['/kwic'] = self.kwic
+            self.routes['/near'] = self.near
+        self._cached = lru_cache(maxsize=cache_size)(self._query)
+
+    # ---- 参数 ----
+
+    def _name(self, params, key='name'):
+        if key not in params:
+            raise QueryError(f"缺少参数 {key}")
+        name = self.alias_map.get(params[key], params[key])
+        if name not in self.index:
+            raise QueryError(f"未知人物: {params[key]}")
+        return name
+
+    def _int(self, params, key, default, minimum=None):
+        try:
+            value = int(params.get(key, default))
+        except ValueError:
+            raise QueryError(f"参数 {key} 应为整数")
+        if minimum is not None and value < minimum:
+            raise QueryError(f"参数 {key} 不能小于 {minimum}")
+        return value
+
+    def _range(self, params):
+        """章回区间：chapter=N 或 start=a&end=b（缺省为全书）"""
+        if 'chapter' in params:
+            start = end = self._int(params, 'chapter', 1)
+        else:
+            start = self._int(params, 'start', 1)
+            end = self._int(params, 'end', self.num_chapters)
+        start, end = max(start, 1), min(end, self.num_chapters)
+        if start > end:
+            raise QueryError(f"章回区间为空: [{start}, {end}]")
+        return start, end
+
+    def _freq(self, start, end):
+        return self.freq_prefix[end] - self.freq_prefix[start - 1]
+
+    # ---- 查询 ----
+
+    def freq(self, params):
+        """人物出现频次：指定 name 时返回该人物，否则返回前 top 名"""
+        start, end = self._range(params)
+        freq = self._freq(start, end)
+        if 'name' in params:
+            name = self._name(params)
+            return {"name": name, "start": start, "end": end, "count": int(freq[self.index[name]])}
+        top = self._int(params, 'top', 20, minimum=1)
+        order = np.lexsort((np.arange(len(freq)), -freq))[:top]
+        return {"start": start, "end": end,
+                "top": [{"name": self.names[i], "count": int(freq[i])} for i in order if freq[i] > 0]}
+
+    def topk(self, params):
+        """每回出场次数前 k 名（同 top3_appear_per_chapter），可限定章回区间"""
+        start, end = self._range(params)
+        k = self._int(params, 'k', 3, minimum=1)
+        chapters = []
+        for chap in range(start, end + 1):
+            freq = self._freq(chap, chap)
+            order = np.lexsort((np.arange(len(freq)), -freq))[:k]
+            chapters.append({"chapter": chap,
+                             "top": [[self.names[i], int(freq[i])] for i in order if freq[i] > 0]})
+        return {"k": k, "chapters": chapters}
+
+    def cooc(self, params):
+        """两人在章回区间内的共现次数"""
+        start, end = self._range(params)
+        a, b = self._name(params, 'a'), self._name(params, 'b')
+        return {"a": a, "b": b, "start": start, "end": end,
+                "count": self.dynamic.pair(a, b, start, end)}
+
+    def ego(self, params):
+        """人物在章回区间内的自我中心网络（节点、边格式同关系图）"""
+        start, end = self._range(params)
+        name = self._name(params)
+        limit = self._int(params, 'limit', 20, minimum=1)
+        matrix = self.dynamic.range(start, end).matrix
+        i = self.index[name]
+        cols = matrix.indices[matrix.indptr[i]:matrix.indptr[i + 1]]
+        values = matrix.data[matrix.indptr[i]:matrix.indptr[i + 1]]
+        keep = cols != i
+        cols, values = cols[keep], values[keep]
+        order = np.lexsort((cols, -values))[:limit]
+
+        nodes = [name] + [self.names[j] for j in cols[order]]
+        freq = self._freq(start, end)
+        ego_freq = {n: int(freq[self.index[n]]) for n in nodes}
+        ego_co = {tuple(sorted((name, self.names[j]))): int(v) for j, v in zip(cols[order], values[order])}
+        detail = {name: {self.names[j]: int(v) for j, v in zip(cols[order], values[order])}}
+        for j, v in zip(cols[order], values[order]):
+            detail[self.names[j]] = {name: int(v)}
+        graph_nodes, graph_links = build_graph_data(ego_freq, ego_co, detail)
+        return {"name": name, "start": start, "end": end, "nodes": graph_nodes, "links": graph_links}
+
+    def _contexts(self, postings, params):
+        width = min(self._int(params, 'width', 20, minimum=0), 200)
+        limit = self._int(params, 'limit', 50, minimum=1)
+        return [{"chapter": chap, "sentence": sent, "left": left, "word": word, "right": right}
+                for chap, sent, left, word, right in kwic(self.corpus, postings, width, limit)]
+
+    def kwic(self, params):
+        """人物在章回区间内各处出现的上下文（width 为左右字数，最多 limit 条）"""
+        start, end = self._range(params)
+        name = self._name(params)
+        postings = self.positions.postings(name, start, end)
+        return {"name": name, "start": start, "end": end, "count": len(postings),
+                "contexts": self._contexts(postings, params)}
+
+    def near(self, params):
+        """a 在同一回内与 b 相距不超过 within 句的各处出现及上下文"""
+        start, end = self._range(params)
+        a, b = self._name(params, 'a'), self._name(params, 'b')
+        within = self._int(params, 'within', 1, minimum=0)
+        postings, distance = self.positions.near(a, b, within, start, end)
+        contexts = self._contexts(postings, params)
+        for context, d in zip(contexts, distance.tolist()):
+            context["distance"] = d
+        return {"a": a, "b": b, "within": within, "start": start, "end": end,
+                "count": len(postings), "contexts": contexts}
+
+    def _query(self, path, params):
+        """执行查询，返回 (状态码, JSON 字节串)；结果经 LRU 缓存"""
+        handler = self.routes.get(path)
+        if handler is None:
+            return 404, _dumps({"error": f"未知路径: {path}", "paths": sorted(self.routes)})
+        try:
+            return 200, _dumps(handler(dict(params)))
+        except QueryError as e:
+            return 400, _dumps({"error": str(e)})
+
+    def query(self, path, query_string=''):
+        count('requests')
+        if path == '/stats':
+            info = self._cached.cache_info()
+            return 200, _dumps({"chapters": self.num_chapters, "characters": len(self.names),
+                                "cache": {"hits": info.hits, "misses": info.misses,
+                                          "size": info.currsize, "maxsize": info.maxsize}})
+        return self._cached(path, tuple(sorted(parse_qsl(query_string))))
+
+
+def _dumps(obj):
+    return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+
+async def handle_request(service, reader, writer):
+    """处理一个 HTTP/1.1 GET 请求（响应后关闭连接）"""
+    try:
+        request_line = await reader.readline()
+        # 读完请求头（不支持请求体）
+        while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+            pass
+        parts = request_line.decode('latin-1').split()
+        if len(parts) != 3:
+            status, body = 400, _dumps({"error": "请求格式错误"})
+        elif parts[0] != 'GET':
+            status, body = 405, _dumps({"error": "只支持 GET"})
+        else:
+            url = urlsplit(parts[1])
+            start = time.perf_counter()
+            try:
+                status, body = service.query(url.path, url.query)
+            except Exception as e:
+                # 查询本身出错：仍然返回 JSON，连接不会无响应地断开
+                metrics.error(e)
+                status, body = 500, _dumps({"error": f"服务器内部错误: {e}"})
+            elapsed = (time.perf_counter() - start) * 1000
+            print(f"{parts[0]} {parts[1]} {status} {elapsed:.2f}ms")
+        writer.write(
+            f"HTTP/1.1 {status} {HTTP_STATUS[status]}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n".encode('latin-1') + body
+        )
+        await writer.drain()
+    finally:
+        writer.close()
+
+
+async def serve(service, host='127.0.0.1', port=8765):
+    server = await asyncio.start_server(
+        lambda r, w: handle_request(service, r, w), host, port
+    )
+    print(f"查询服务已启动: http://{host}:{port}/  （{' '.join(sorted(service.routes))} /stats）")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == '__main__':
+    from hlm_bench import load_script
+
+    parser = argparse.ArgumentParser(description="《红楼梦》人物统计本地查询服务（JSON）")
+    parser.add_argument('--host', default='127.0.0.1', help="监听地址（默认只允许本机访问）")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--match', choices=['pseg', 'dict'], default='pseg',
+                        help="人物识别方式：pseg 词性标注 / dict 词典匹配")
+    parser.add_argument('--window-size', type=int, default=3, help="共现窗口句数")
+    parser.add_argument('--cache-size', type=int, default=1024, help="LRU 缓存的查询结果数")
+    parser.add_argument('--no-kwic', action='store_true', help="不加载位置索引（不提供 /kwic、/near）")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    cooc = load_script('cooc')
+    paths = cooc.setup_paths()
+    characters, alias_map = cooc.load_characters(paths["character"])
+    mentions = cooc.load_source(paths, characters, alias_map, args.match)
+    positions = corpus = None
+    if not args.no_kwic:
+        positions = cooc.load_index(paths, characters, alias_map, args.match)
+        corpus = cooc.load_text_data(paths["full_text"], paths["chapter_dir"], paths["cache"])
+    service = StatsService(mentions, characters, alias_map, args.window_size, args.cache_size,
+                           positions, corpus)
+    print(f"索引构建完成：{service.num_chapters} 回，{len(service.names)} 个人物，"
+          f"用时 {time.perf_counter() - start:.2f}s")
+    try:
+        asyncio.run(serve(service, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if corpus is not None:
+            corpus.close()
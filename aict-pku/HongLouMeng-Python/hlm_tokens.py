@@ -0,0 +1,354 @@
+import os
+import re
+import pickle
+import hashlib
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from importlib import metadata
+import numpy as np
+from hlm_manifest import chapter_hashes
+from hlm_metrics import timer, count
+
+# 句末：连续的分句标点，或后面紧跟引号的省略号；句末之后的后引号归入本句
+SENTENCE_BOUNDARY = re.compile(r'(?:[。！？?]+|…+(?=[”’」』]))[”’」』]*')
+
+# 缓存格式版本，修改分词规则时递增
+STORE_VERSION = 2
+
+# 分句规则版本，修改分句规则时递增（只影响句序号，不需要重新分词）
+SPLIT_VERSION = 2
+
+
+def split_sentences(text):
+    """逐句产出单回文本中的句子区间 (start, end)
+
+    “。”” 之类句末后的引号留在本句，连续的 “？！” 算一个句末，
+    “……”” 也结束一句；末尾没有句末标点的部分同样产出。
+    """
+    pos = 0
+    for m in SENTENCE_BOUNDARY.finditer(text):
+        yield pos, m.end()
+        pos = m.end()
+    if pos < len(text):
+        yield pos, len(text)
+
+
+def iter_sentences(texts):
+    """流式分句：按章回顺序产出 (章回, 全书句序号, start, end)，start/end 为回内字符位置"""
+    sent = 0
+    for chap, text in enumerate(texts, start=1):
+        for start, end in split_sentences(text):
+            yield chap, sent, start, end
+            sent += 1
+
+
+def list_chapter_files(chapter_dir):
+    """按章回顺序列出章节文件"""
+    return [
+        os.path.join(chapter_dir, fname)
+        for fname in sorted(os.listdir(chapter_dir))
+        if fname.endswith('.txt')
+    ]
+
+
+def jieba_version():
+    """jieba 版本号（读取安装信息，不导入 jieba）"""
+    try:
+        return metadata.version('jieba')
+    except metadata.PackageNotFoundError:
+        import jieba
+        return jieba.__version__
+
+
+def tagging_key(userdict_path):
+    """分词环境键：缓存版本、jieba版本和用户词典内容"""
+    h = hashlib.sha256()
+    h.update(f"v{STORE_VERSION}|jieba-{jieba_version()}".encode('utf-8'))
+    with open(userdict_path, 'rb') as f:
+        h.update(hashlib.sha256(f.read()).digest())
+    return h.hexdigest()
+
+
+def corpus_key(chapter_files, userdict_path, hashes=None):
+    """根据章节内容、用户词典和jieba版本计算缓存键（章节哈希优先取自清单）"""
+    if hashes is None:
+        hashes = chapter_hashes(chapter_files)
+    h = hashlib.sha256(f"{tagging_key(userdict_path)}|split-v{SPLIT_VERSION}".encode('utf-8'))
+    for digest in hashes:
+        h.update(bytes.fromhex(digest))
+    return h.hexdigest()
+
+
+class TokenStore:
+    """词性标注结果的列式存储：(词, 词性, 章回, 句序号, 字符偏移)
+
+    句序号在全书范围内连续编号，字符偏移为词在本章文本中的位置。
+    """
+
+    COLUMNS = ('word_ids', 'flag_ids', 'chapter', 'sentence', 'offset')
+
+    def __init__(self, words, flags, word_ids, flag_ids, chapter, sentence, offset):
+        self.words = words  # 词表
+        self.flags = flags  # 词性表
+        self.word_ids = word_ids
+        self.flag_ids = flag_ids
+        self.chapter = chapter  # 章回号，从1开始
+        self.sentence = sentence
+        self.offset = offset
+        # 每回在列中的起止位置
+        chapters = np.arange(1, int(chapter.max(initial=0)) + 2)
+        self._bounds = np.searchsorted(chapter, chapters)
+
+    def __len__(self):
+        return len(self.word_ids)
+
+    @property
+    def num_chapters(self):
+        return len(self._bounds) - 1
+
+    def chapter_slice(self, chap):
+        """某一回在各列中的切片"""
+        return slice(self._bounds[chap - 1], self._bounds[chap])
+
+    def iter_tokens(self, chap=None):
+        """按顺序遍历 (词, 词性)，可限定章回"""
+        sl = slice(None) if chap is None else self.chapter_slice(chap)
+        words, flags = self.words, self.flags
+        for w, t in zip(self.word_ids[sl].tolist(), self.flag_ids[sl].tolist()):
+            yield words[w], flags[t]
+
+    def sentence_range(self, chap):
+        """某一回的句序号范围 [first, end)"""
+        sl = self.chapter_slice(chap)
+        if sl.start == sl.stop:
+            first = int(self.sentence[sl.start - 1]) + 1 if sl.start else 0
+            return first, first
+        return int(self.sentence[sl.start]), int(self.sentence[sl.stop - 1]) + 1
+
+    def iter_records(self, flag=None, chapters=None):
+        """按顺序遍历 (章回, 句序号, 词, 词性)，可只取某一词性、某几回"""
+        columns = [self.chapter, self.sentence, self.word_ids, self.flag_ids]
+        mask = None
+        if flag is not None:
+            if flag not in self.flags:
+                return
+            mask = self.flag_ids == self.flags.index(flag)
+        if chapters is not None:
+            in_chapters = np.isin(self.chapter, list(chapters))
+            mask = in_chapters if mask is None else mask & in_chapters
+        if mask is not None:
+            columns = [col[mask] for col in columns]
+        words, flags = self.words, self.flags
+        for c, s, w, t in zip(*(col.tolist() for col in columns)):
+            yield c, s, words[w], flags[t]
+
+    def save(self, path):
+        """写入 .npz 文件（词表以空字符分隔的UTF-8字节保存）"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = path + '.tmp.npz'
+        np.savez(
+            tmp_path,
+            words=np.frombuffer('\0'.join(self.words).encode('utf-8'), dtype=np.uint8),
+            flags=np.frombuffer('\0'.join(self.flags).encode('utf-8'), dtype=np.uint8),
+            **{name: getattr(self, name) for name in self.COLUMNS}
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """从 .npz 文件读取"""
+        with np.load(path) as data:
+            words = data['words'].tobytes().decode('utf-8').split('\0')
+            flags = data['flags'].tobytes().decode('utf-8').split('\0')
+            columns = [data[name] for name in cls.COLUMNS]
+        return cls(words, flags, *columns)
+
+
+def load_tokenizer(userdict_path, cache_dir=None):
+    """已并入人物词典的词性标注器（jieba.posseg.POSTokenizer）
+
+    指定 cache_dir 时，首次构建后把前缀词典、词频总数和词性表序列化为快照
+    cache_dir/tokenizer_*.pkl（按分词环境键命名），之后直接反序列化，
+    省去构建前缀词典、解析默认词典词性和加载用户词典的时间。
+    """
+    import jieba
+    import jieba.posseg as pseg
+
+    path = None
+    if cache_dir is not None:
+        path = os.path.join(cache_dir, f"tokenizer_{tagging_key(userdict_path)[:16]}.pkl")
+        if os.path.exists(path):
+            with timer('load.tokenizer'), open(path, 'rb') as f:
+                snapshot = pickle.load(f)
+            tokenizer = jieba.Tokenizer()
+            tokenizer.FREQ, tokenizer.total = snapshot['freq'], snapshot['total']
+            tokenizer.initialized = True
+            for word in snapshot['force_split']:
+                jieba.finalseg.add_force_split(word)
+            tagger = pseg.POSTokenizer.__new__(pseg.POSTokenizer)
+            tagger.tokenizer, tagger.word_tag_tab = tokenizer, snapshot['word_tag_tab']
+            return tagger
+
+    with timer('build.tokenizer'):
+        tokenizer = jieba.Tokenizer()
+        tokenizer.initialize()
+        with open(userdict_path, 'rb') as f:  # 传路径时 jieba 不会关闭文件
+            tokenizer.load_userdict(f)
+        tagger = pseg.POSTokenizer(tokenizer)
+        # 与 POSTokenizer 首次切分时的处理相同：并入用户词典的词性
+        tagger.word_tag_tab.update(tokenizer.user_word_tag_tab)
+        tokenizer.user_word_tag_tab = {}
+    if path is not None:
+        with open(userdict_path, 'r', encoding='utf-8') as f:
+            user_words = [line.split()[0] for line in f if line.strip()]
+        snapshot = {
+            'freq': tokenizer.FREQ,
+            'total': tokenizer.total,
+            'word_tag_tab': tagger.word_tag_tab,
+            'force_split': [w for w in user_words if tokenizer.FREQ.get(w) == 0],
+        }
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+    return tagger
+
+
+# 当前进程的词性标注器（_init_worker 设置）
+_tagger = None
+
+
+def tag_chapter(text):
+    """对单回文本做词性标注，返回 [(词, 词性, 字符偏移)]"""
+    tokens = []
+    pos = 0
+    with timer('pseg.cut'):
+        for word, flag in _tagger.cut(text):
+            tokens.append((word, flag, pos))
+            pos += len(word)
+    return tokens
+
+
+def _init_worker(userdict_path, cache_dir=None):
+    """工作进程启动时加载一次标注器（有快照时直接读取快照）"""
+    global _tagger
+    _tagger = load_tokenizer(userdict_path, cache_dir)
+
+
+def _read_chapter(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def save_tagged(path, tokens):
+    """写入单回标注结果（.npz）"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp.npz'
+    np.savez(
+        tmp_path,
+        words=np.frombuffer('\0'.join(t[0] for t in tokens).encode('utf-8'), dtype=np.uint8),
+        flags=np.frombuffer('\0'.join(t[1] for t in tokens).encode('utf-8'), dtype=np.uint8),
+        offset=np.array([t[2] for t in tokens], dtype=np.uint32),
+    )
+    os.replace(tmp_path, path)
+
+
+def load_tagged(path):
+    """读取单回标注结果，返回与 tag_chapter 相同的列表"""
+    with np.load(path) as data:
+        if not len(data['offset']):
+            return []
+        words = data['words'].tobytes().decode('utf-8').split('\0')
+        flags = data['flags'].tobytes().decode('utf-8').split('\0')
+        return list(zip(words, flags, data['offset'].tolist()))
+
+
+def _tag_chapters(texts, userdict_path, workers=1, cache_dir=None):
+    """标注若干回文本，按顺序产出结果"""
+    if not texts:
+        return
+    if workers > 1:
+        # 先在主进程写好快照，各工作进程只需读取
+        if cache_dir is not None:
+            load_tokenizer(userdict_path, cache_dir)
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(userdict_path, cache_dir)
+        ) as pool:
+            yield from pool.map(tag_chapter, texts)
+    else:
+        _init_worker(userdict_path, cache_dir)
+        yield from map(tag_chapter, texts)
+
+
+def build_token_store(chapter_files, userdict_path, workers=1, cache_dir=None, hashes=None):
+    """逐回分词标注并构建 TokenStore
+
+    workers > 1 时各回分发到进程池并行标注；结果按章回顺序合并，
+    与串行结果完全一致。指定 cache_dir 时每回的标注结果按章节内容哈希
+    缓存在 cache_dir/chapters 下，只有新增或修改过的章节需要重新分词，
+    其文本取自 cache_dir 下的打包语料（Corpus）。
+    """
+    from hlm_corpus import open_corpus  # hlm_corpus 依赖本模块
+
+    if cache_dir is None:
+        tagged = _tag_chapters([_read_chapter(path) for path in chapter_files], userdict_path, workers)
+    else:
+        if hashes is None:
+            hashes = chapter_hashes(chapter_files)
+        env = tagging_key(userdict_path)[:8]
+        cache_files = [
+            os.path.join(cache_dir, 'chapters', f"{env}_{digest[:16]}.npz") for digest in hashes
+        ]
+        missing = [i for i, path in enumerate(cache_files) if not os.path.exists(path)]
+        count('chapters_tagged', len(missing))
+        if missing:
+            print(f"需要分词的章节：{len(missing)}/{len(chapter_files)} 回")
+            with open_corpus(chapter_files, cache_dir) as corpus:
+                texts = [corpus.chapter(i + 1).text for i in missing]
+                for i, tokens in zip(missing, _tag_chapters(texts, userdict_path, workers, cache_dir)):
+                    save_tagged(cache_files[i], tokens)
+        tagged = map(load_tagged, cache_files)
+
+    vocab, flag_table = {}, {}
+    word_ids, flag_ids, chapter, sentence, offset = [], [], [], [], []
+    sent = 0
+    for chap, tokens in enumerate(tagged, start=1):
+        # 句序号由 split_sentences 决定，各回的句子互不相连
+        starts = [start for start, _ in split_sentences(''.join(t[0] for t in tokens))]
+        for word, flag, pos in tokens:
+            word_ids.append(vocab.setdefault(word, len(vocab)))
+            flag_ids.append(flag_table.setdefault(flag, len(flag_table)))
+            chapter.append(chap)
+            sentence.append(sent + bisect_right(starts, pos) - 1)
+            offset.append(pos)
+        sent += len(starts)
+
+    return TokenStore(
+        list(vocab), list(flag_table),
+        np.array(word_ids, dtype=np.uint32),
+        np.array(flag_ids, dtype=np.uint8),
+        np.array(chapter, dtype=np.uint16),
+        np.array(sentence, dtype=np.uint32),
+        np.array(offset, dtype=np.uint32),
+    )
+
+
+def load_token_store(chapter_dir, userdict_path, cache_dir='./cache', workers=1):
+    """读取分词缓存；章节、词典或jieba版本变化时重新构建
+
+    重新构建时只对内容变化的章节分词，其余章节取自每回缓存。
+    """
+    chapter_files = list_chapter_files(chapter_dir)
+    hashes = chapter_hashes(chapter_files)
+    key = corpus_key(chapter_files, userdict_path, hashes)
+    cache_file = os.path.join(cache_dir, f"tokens_{key[:16]}.npz")
+    if os.path.exists(cache_file):
+        with timer('load.tokens'):
+            return TokenStore.load(cache_file)
+
+    print("正在分词并写入缓存...")
+    with timer('segment'):
+        store = build_token_store(chapter_files, userdict_path, workers, cache_dir, hashes)
+    count('tokens', len(store))
+    store.save(cache_file)
+    return store
@@ -0,0 +1,141 @@
+import os
+import sys
+from itertools import combinations
+
+import numpy as np
+import pytest
+
+SCRIPT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SCRIPT_DIR)
+
+from hlm_bench import load_script  # noqa: E402
+from hlm_engine import (AnalysisEngine, Normalizer, MentionList, SlidingCoOccurrence,  # noqa: E402
+                        WindowCoOccurrence, DecayCoOccurrence)
+from hlm_graph import CoOccurrenceIndex  # noqa: E402
+
+NAMES = ['宝玉', '黛玉', '宝钗', '袭人', '凤姐', '贾母']
+
+# (窗口句数, 步长)：不重叠、滑动、步长大于窗口（窗口之间有空隙）
+WINDOWS = [(3, 3), (3, 1), (5, 2), (2, 5), (1, 1)]
+
+
+@pytest.fixture(scope="module")
+def cooc():
+    return load_script('cooc')
+
+
+@pytest.fixture(scope="module")
+def mentions():
+    """合成的人物提及：约 200 句，部分句子有多个（或重复的）人物"""
+    rng = np.random.default_rng(1)
+    chapter, sentence, names = [], [], []
+    for sent in sorted(rng.choice(200, 90, replace=False).tolist()):
+        for name in rng.choice(NAMES, rng.integers(1, 4)).tolist():
+            chapter.append(sent // 50 + 1)
+            sentence.append(sent)
+            names.append(name)
+    return MentionList(chapter, sentence, names)
+
+
+def brute_force(mentions, window_size, stride):
+    """逐个窗口重新统计：窗口 k 覆盖 [k*stride, k*stride+window_size) 句"""
+    freq, co_occur = {}, {}
+    for k in range(max(mentions.sentence) // stride + 1):
+        chars = {w for s, w in zip(mentions.sentence, mentions.names)
+                 if k * stride <= s < k * stride + window_size}
+        for char in chars:
+            freq[char] = freq.get(char, 0) + 1
+        for pair in combinations(sorted(chars), 2):
+            co_occur[pair] = co_occur.get(pair, 0) + 1
+    return freq, co_occur
+
+
+def as_dicts(freq, co_occur, co_occur_detail):
+    return (dict(freq), dict(co_occur.items()),
+            {a: dict(others) for a, others in co_occur_detail.items() if others})
+
+
+@pytest.mark.parametrize("window_size,stride", WINDOWS)
+def test_backends_match_brute_force(cooc, mentions, window_size, stride):
+    by_dict = as_dicts(*cooc.analyze_co_occurrence(mentions, NAMES, {}, window_size, stride=stride))
+    by_matrix = as_dicts(*cooc.analyze_co_occurrence(
+        mentions, NAMES, {}, window_size, backend='matrix', stride=stride).views())
+    assert by_dict == by_matrix
+    assert by_dict[:2] == brute_force(mentions, window_size, stride)
+
+
+@pytest.mark.parametrize("window_size,stride", WINDOWS)
+@pytest.mark.parametrize("top_n,main_chars", [(3, None), (4, ['袭人']), (0, ['贾母', '宝玉'])])
+def test_filter_backends_match(cooc, mentions, window_size, stride, top_n, main_chars):
+    result = cooc.analyze_co_occurrence(mentions, NAMES, {}, window_size, stride=stride)
+    matrix = cooc.analyze_co_occurrence(mentions, NAMES, {}, window_size, backend='matrix', stride=stride)
+    expected = as_dicts(*cooc.filter_data(*result, top_n=top_n, main_chars=main_chars))
+    assert as_dicts(*cooc.filter_data(CoOccurrenceIndex(*result), top_n=top_n, main_chars=main_chars)) == expected
+    assert as_dicts(*cooc.filter_data(matrix, top_n=top_n, main_chars=main_chars)) == expected
+
+
+def detail_of(co_occur):
+    """由人物对计数展开的双向邻接表"""
+    detail = {}
+    for (a, b), n in co_occur.items():
+        detail.setdefault(a, {})[b] = n
+        detail.setdefault(b, {})[a] = n
+    return detail
+
+
+def run(accumulator, mentions):
+    engine = AnalysisEngine(Normalizer(NAMES))
+    engine.register('co_occur', accumulator)
+    return engine.run(mentions)['co_occur']
+
+
+@pytest.mark.parametrize("window_size,stride", [(3, 1), (4, 2), (5, 3), (4, 4), (2, 3), (2, 7)])
+def test_sliding_matches_recount(mentions, window_size, stride):
+    freq, co_occur, detail = as_dicts(*run(SlidingCoOccurrence(window_size, stride), mentions))
+    assert (freq, co_occur) == brute_force(mentions, window_size, stride)
+    assert detail == detail_of(co_occur)
+
+
+def test_sliding_equals_fixed_windows_when_stride_is_window(mentions):
+    assert as_dicts(*run(SlidingCoOccurrence(3, 3), mentions)) == \
+        as_dicts(*run(WindowCoOccurrence(3), mentions))
+
+
+def direct_decay(mentions, window_size, decay):
+    """逐对提及直接计算：同句权重 1，相隔 d 句（0 < d < window_size）权重 decay ** d"""
+    sentences = {}
+    for sent, name in zip(mentions.sentence, mentions.names):
+        sentences.setdefault(sent, set()).add(name)
+    freq, co_occur = {}, {}
+    for s, chars in sentences.items():
+        for char in chars:
+            freq[char] = freq.get(char, 0) + 1
+        for t, others in sentences.items():
+            if not s <= t < s + window_size:
+                continue
+            for a in others:
+                for b in chars:
+                    if a != b and (s < t or a < b):
+                        pair = tuple(sorted((a, b)))
+                        co_occur[pair] = co_occur.get(pair, 0) + decay ** (t - s)
+    return freq, co_occur
+
+
+def test_decay_small_case():
+    # 第0句 宝玉、黛玉；第1句 宝玉；第2句 袭人
+    mentions = MentionList([1] * 4, [0, 0, 1, 2], ['宝玉', '黛玉', '宝玉', '袭人'])
+    freq, co_occur, _ = as_dicts(*run(DecayCoOccurrence(3, 0.5), mentions))
+    assert freq == {'宝玉': 2, '黛玉': 1, '袭人': 1}
+    assert co_occur == {('宝玉', '黛玉'): 1.5, ('宝玉', '袭人'): 0.75, ('袭人', '黛玉'): 0.25}
+
+
+@pytest.mark.parametrize("window_size,decay", [(3, 0.5), (1, 0.5), (4, 0.8)])
+def test_decay_matches_direct(cooc, mentions, window_size, decay):
+    freq, co_occur, detail = as_dicts(*run(DecayCoOccurrence(window_size, decay), mentions))
+    expected_freq, expected_co = direct_decay(mentions, window_size, decay)
+    assert freq == expected_freq
+    assert co_occur == pytest.approx(expected_co)
+    assert detail.keys() == detail_of(co_occur).keys()
+
+    matrix = cooc.analyze_co_occurrence(mentions, NAMES, {}, window_size, backend='matrix', decay=decay)
+    assert dict(matrix.co_occur.items()) == pytest.approx(expected_co)
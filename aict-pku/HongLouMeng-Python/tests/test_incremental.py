@@ -0,0 +1,83 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hlm_engine import Normalizer, collect_mentions  # noqa: E402
+from hlm_manifest import ChapterStats, chapter_hashes, content_hash, save_manifest  # noqa: E402
+from hlm_matcher import MatchSource  # noqa: E402
+
+NAMES = ['宝玉', '黛玉', '宝钗', '袭人']
+CHAPTERS = [
+    "宝玉来了。黛玉笑道：“你来做什么？”",
+    "宝钗和袭人说话。宝玉在旁边听着。",
+    "黛玉哭了。袭人劝她。",
+    "宝玉、宝钗、黛玉一同去了。",
+    "袭人回来。",
+]
+
+
+def write_chapters(chapter_dir, texts):
+    chapter_dir.mkdir(exist_ok=True)
+    for i, text in enumerate(texts, start=1):
+        (chapter_dir / f"{i:03d}.txt").write_text(text, encoding='utf-8')
+    return [str(chapter_dir / f"{i:03d}.txt") for i in range(1, len(texts) + 1)]
+
+
+def collect(chapter_files, stats_path, loads):
+    """增量收集；loads 记录实际加载了几次识别结果"""
+    def load():
+        loads.append(1)
+        return MatchSource(chapter_files, NAMES)
+    stats = ChapterStats(str(stats_path), "test")
+    return collect_mentions(load, Normalizer(NAMES), chapter_hashes(chapter_files), stats)
+
+
+def as_tuple(mentions):
+    return mentions.chapter, mentions.sentence, mentions.names
+
+
+def test_only_edited_chapter_is_recounted(tmp_path):
+    files = write_chapters(tmp_path / "chap", CHAPTERS)
+    loads = []
+    _, stale = collect(files, tmp_path / "stats.json", loads)
+    assert stale == [1, 2, 3, 4, 5]
+
+    # 未修改时不加载识别结果
+    _, stale = collect(files, tmp_path / "stats.json", loads)
+    assert stale == [] and len(loads) == 1
+
+    # 第3回多出两句，其后各回的全书句序号随之后移
+    edited = list(CHAPTERS)
+    edited[2] = "黛玉哭了。宝玉来看她。宝钗也来了。袭人劝她。"
+    files = write_chapters(tmp_path / "chap", edited)
+    mentions, stale = collect(files, tmp_path / "stats.json", loads)
+    assert stale == [3]
+
+    rebuilt, stale = collect(files, tmp_path / "fresh.json", [])
+    assert stale == [1, 2, 3, 4, 5]
+    assert as_tuple(mentions) == as_tuple(rebuilt)
+
+
+def test_removed_chapters_are_dropped(tmp_path):
+    files = write_chapters(tmp_path / "chap", CHAPTERS)
+    collect(files, tmp_path / "stats.json", [])
+    mentions, stale = collect(files[:3], tmp_path / "stats.json", [])
+    assert stale == []
+    assert set(mentions.chapter) == {1, 2, 3}
+    assert sorted(ChapterStats(str(tmp_path / "stats.json"), "test").chapters) == ['1', '2', '3']
+
+
+def test_manifest_shortcut(tmp_path):
+    files = write_chapters(tmp_path / "chap", CHAPTERS)
+    real = content_hash((tmp_path / "chap" / "001.txt").read_bytes())
+    assert chapter_hashes(files)[0] == real
+
+    # 大小和修改时间与清单一致时直接采用清单中的哈希，不重新计算
+    save_manifest(str(tmp_path / "chap"), {"001.txt": "f" * 64})
+    assert chapter_hashes(files)[0] == "f" * 64
+
+    # 修改时间变化后不再信任清单
+    st = os.stat(files[0])
+    os.utime(files[0], ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    assert chapter_hashes(files)[0] == real
@@ -0,0 +1,86 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hlm_corpus import Corpus, pack_corpus  # noqa: E402
+from hlm_index import PositionIndex, Postings, kwic  # noqa: E402
+
+
+class FakeSource:
+    """最小的词典匹配结果：(章回, 句序号, 词)，每回 chapter_size 句"""
+
+    def __init__(self, records, num_chapters, chapter_size):
+        self.chapter = [c for c, _, _ in records]
+        self.sentence = [s for _, s, _ in records]
+        self.offset = [0] * len(records)
+        self.words = [w for _, _, w in records]
+        self.num_chapters = num_chapters
+        self.chapter_size = chapter_size
+
+    def sentence_range(self, chap):
+        return (chap - 1) * self.chapter_size, chap * self.chapter_size
+
+
+def build(records, num_chapters=1, chapter_size=100):
+    # 保证最后一回出现在 source.chapter 中，章回数才完整
+    records = records + [(num_chapters, num_chapters * chapter_size - 1, 'Z')]
+    records.sort(key=lambda r: r[1])
+    return PositionIndex.from_source(FakeSource(records, num_chapters, chapter_size), lambda w, flag: w)
+
+
+def test_near_picks_closest_inside_window():
+    index = build([(1, 10, 'A'), (1, 8, 'B'), (1, 10, 'B'), (1, 12, 'B')])
+    hits, distance = index.near('A', 'B', within=2)
+    assert hits.sentence.tolist() == [10]
+    assert distance.tolist() == [0]
+
+
+def test_near_does_not_cross_chapters():
+    index = build([(2, 10, 'A'), (1, 9, 'B'), (2, 12, 'B')], num_chapters=2, chapter_size=10)
+    hits, distance = index.near('A', 'B', within=2)
+    assert distance.tolist() == [2]
+    assert index.near('A', 'B', within=1)[1].tolist() == []
+
+
+def test_near_matches_brute_force():
+    rng = np.random.default_rng(0)
+    records = [(int(s) // 50 + 1, int(s), w) for w in 'AB' for s in rng.choice(500, 60, replace=False)]
+    index = build(records, num_chapters=10, chapter_size=50)
+    a = sorted(s for _, s, w in records if w == 'A')
+    b = sorted(s for _, s, w in records if w == 'B')
+    for within in (0, 1, 3, 10):
+        expected = {}
+        for sa in a:
+            near = [sb - sa for sb in b if sb // 50 == sa // 50 and abs(sb - sa) <= within]
+            if near:
+                expected[sa] = min(near, key=lambda d: (abs(d), d > 0))  # 距离相同时取在前的 b
+        hits, distance = index.near('A', 'B', within)
+        assert dict(zip(hits.sentence.tolist(), distance.tolist())) == expected
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    path = tmp_path / "001.txt"
+    path.write_text("宝玉笑道：“好妹妹。”黛玉不答。", encoding='utf-8')
+    pack_corpus([str(path)], str(tmp_path / "corpus.bin"))
+    with Corpus(str(tmp_path / "corpus.bin")) as corpus:
+        yield corpus
+
+
+def _postings(*offsets):
+    n = len(offsets)
+    return Postings('X', np.ones(n, dtype=np.int64), np.zeros(n, dtype=np.int64),
+                    np.array(offsets, dtype=np.int64), np.full(n, 2, dtype=np.int64))
+
+
+def test_kwic_width_and_limit(corpus):
+    postings = _postings(0, 11)
+    assert [c[2:] for c in kwic(corpus, postings, 2)] == [("", "宝玉", "笑道"), ("。”", "黛玉", "不答")]
+    assert [c[2:] for c in kwic(corpus, postings, -4)] == [("", "宝玉", ""), ("", "黛玉", "")]
+    assert len(list(kwic(corpus, postings, 2, limit=1))) == 1
+    with pytest.raises(ValueError):
+        list(kwic(corpus, postings, 2, limit=-1))
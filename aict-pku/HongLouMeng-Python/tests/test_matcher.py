@@ -0,0 +1,56 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hlm_matcher import AhoCorasick, make_boundary_rule  # noqa: E402
+
+
+def brute_force(text, patterns, boundary=None):
+    """从左到右：每个位置取通过边界规则的最长模式串，匹配后跳到其末尾"""
+    matches = []
+    i = 0
+    while i < len(text):
+        ends = [i + len(p) for p in patterns
+                if text.startswith(p, i) and (boundary is None or boundary(text, i, i + len(p)))]
+        if ends:
+            matches.append((i, max(ends)))
+            i = max(ends)
+        else:
+            i += 1
+    return matches
+
+
+def test_overlapping_patterns():
+    matcher = AhoCorasick(['AB', 'BCD', 'CD'])
+    assert matcher.find('ABCD') == [(0, 2), (2, 4)]
+    assert matcher.find('XBCDAB') == [(1, 4), (4, 6)]
+    # 所有出现（含重叠、包含）都由字典后缀链给出
+    assert sorted(matcher.iter_candidates('ABCD')) == [(0, 2), (1, 4), (2, 4)]
+
+
+def test_boundary_rule_rejects_match():
+    matcher = AhoCorasick(['凤姐', '凤姐儿', '宝玉'])
+    rule = make_boundary_rule(before='', after='儿道')
+    text = '凤姐儿笑道，宝玉道'
+    # 凤姐儿 后为“笑”，保留；宝玉 后为“道”，被规则丢弃
+    assert matcher.find(text, rule) == [(0, 3)]
+    assert matcher.find(text) == [(0, 3), (6, 8)]
+    assert matcher.find('凤姐儿儿', rule) == []
+    # 较长的候选被丢弃时，同一位置较短的合法候选仍可入选
+    assert matcher.find('凤姐儿道', make_boundary_rule(after='道')) == [(0, 2)]
+    assert make_boundary_rule() is None
+
+
+@pytest.mark.parametrize("use_rule", [False, True])
+def test_matches_brute_force(use_rule):
+    rng = np.random.default_rng(2)
+    patterns = ['AB', 'BCD', 'CD', 'ABC', 'D', 'BCDA', 'CA']
+    rule = make_boundary_rule(before='C', after='B') if use_rule else None
+    matcher = AhoCorasick(patterns)
+    for _ in range(300):
+        text = ''.join(rng.choice(list('ABCDX'), rng.integers(0, 30)))
+        assert matcher.find(text, rule) == brute_force(text, patterns, rule)
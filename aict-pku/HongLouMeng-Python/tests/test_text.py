@@ -0,0 +1,58 @@
+import os
+import sys
+from itertools import islice
+
+import pytest
+from zhconv import convert
+
+SCRIPT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SCRIPT_DIR)
+
+from hlm_bench import load_script  # noqa: E402
+
+SOURCE = os.path.join(SCRIPT_DIR, "data", "紅樓夢-通行版一百二十回.txt")
+
+
+@pytest.fixture(scope="module")
+def text():
+    return load_script('text')
+
+
+@pytest.fixture
+def fixture_file(text, tmp_path):
+    """原文前 600 行（含目录和前几回正文），末行不带换行符"""
+    path = tmp_path / "slice.txt"
+    content = ''.join(islice(text.iter_lines(SOURCE), 600)).rstrip('\n')
+    path.write_text(content, encoding='utf-8')
+    return str(path)
+
+
+def _whole(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return convert(f.read(), 'zh-cn')
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_chunked_matches_whole(text, fixture_file, workers):
+    # 块大小远小于一行，验证跨块拼接
+    chunked = ''.join(text.iter_simplified(text.iter_lines(fixture_file, chunk_size=97), workers,
+                                           batch_lines=16))
+    assert chunked == _whole(fixture_file)
+
+
+def test_verify_conversion(text, fixture_file):
+    assert text.verify_conversion(fixture_file) == len(_whole(fixture_file))
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_persisted_cache(text, fixture_file, tmp_path, workers):
+    expected = _whole(fixture_file)
+    cache = text.ConversionCache(str(tmp_path / "cache"))
+    assert ''.join(text.iter_simplified(text.iter_lines(fixture_file), workers, cache=cache)) == expected
+    assert cache.hits == 0
+    cache.save()
+
+    # 再次运行全部命中缓存，结果不变
+    cache = text.ConversionCache(str(tmp_path / "cache"))
+    assert ''.join(text.iter_simplified(text.iter_lines(fixture_file), workers, cache=cache)) == expected
+    assert cache.hits == 600
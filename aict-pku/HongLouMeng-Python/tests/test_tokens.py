@@ -0,0 +1,34 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+SCRIPT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SCRIPT_DIR)
+
+from hlm_tokens import build_token_store, list_chapter_files  # noqa: E402
+
+DATA_DIR = os.path.join(SCRIPT_DIR, "data")
+USERDICT = os.path.join(DATA_DIR, "红楼梦_character.txt")
+
+
+def saved_arrays(store, path):
+    """保存后读回的全部数组（比较写入缓存的内容，而不是内存中的对象）"""
+    store.save(path)
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
+
+
+@pytest.mark.parametrize("cached", [False, True])
+def test_parallel_matches_serial(tmp_path, cached):
+    chapter_files = list_chapter_files(os.path.join(DATA_DIR, "红楼梦_chap"))[:4]
+    stores = []
+    for workers in (1, 2):
+        cache_dir = str(tmp_path / f"cache{workers}") if cached else None
+        stores.append(build_token_store(chapter_files, USERDICT, workers, cache_dir))
+    serial, parallel = (saved_arrays(store, str(tmp_path / f"{i}.npz")) for i, store in enumerate(stores))
+    assert serial.keys() == parallel.keys()
+    for name in serial:
+        assert serial[name].dtype == parallel[name].dtype
+        assert serial[name].tobytes() == parallel[name].tobytes(), name